@@ -1,32 +1,76 @@
 """Mail and Packages Integration."""
 import asyncio
 import logging
+import shutil
 from datetime import timedelta
+from functools import partial
 
 from async_timeout import timeout
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_HOST, CONF_RESOURCES
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_PASSWORD,
+    CONF_PORT,
+    CONF_RESOURCES,
+    CONF_USERNAME,
+    EVENT_HOMEASSISTANT_STOP,
+)
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .const import (
     CONF_ALLOW_EXTERNAL,
     CONF_AMAZON_DAYS,
     CONF_AMAZON_FWDS,
+    CONF_FOLDER,
     CONF_IMAGE_SECURITY,
+    CONF_IMAP_ASYNC,
+    CONF_IMAP_COMPRESS,
+    CONF_IMAP_CONNECTIONS,
+    CONF_IMAP_IDLE,
+    CONF_IMAP_PREWARM,
     CONF_IMAP_TIMEOUT,
+    CONF_MESSAGE_CACHE,
     CONF_PATH,
     CONF_SCAN_INTERVAL,
     COORDINATOR,
     DEFAULT_AMAZON_DAYS,
+    DEFAULT_IMAP_ASYNC,
+    DEFAULT_IMAP_COMPRESS,
+    DEFAULT_IMAP_CONNECTIONS,
+    DEFAULT_IMAP_IDLE,
+    DEFAULT_IMAP_PREWARM,
     DEFAULT_IMAP_TIMEOUT,
+    DEFAULT_MESSAGE_CACHE,
     DOMAIN,
     ISSUE_URL,
+    MAX_IMAP_CONNECTIONS,
     PLATFORMS,
+    PREWARM_LEAD,
     VERSION,
 )
-from .helpers import default_image_path, process_emails
+from .helpers import (
+    FolderScan,
+    ImapConnection,
+    ImapConnectionPool,
+    MessageCache,
+    async_process_emails,
+    build_search_plan,
+    default_image_path,
+    entry_folders,
+    merge_sensor_data,
+    process_emails,
+)
+from .idle import IdleListener
+from .imap import (
+    AsyncImapConnection,
+    AsyncImapConnectionPool,
+    release_sessions,
+    reserve_sessions,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -93,7 +137,11 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     interval = config.get(CONF_SCAN_INTERVAL)
 
     # Setup the data coordinator
-    coordinator = MailDataUpdateCoordinator(hass, host, the_timeout, interval, config)
+    coordinator = MailDataUpdateCoordinator(
+        hass, host, the_timeout, interval, config, config_entry.entry_id
+    )
+    if coordinator.message_cache is None:
+        await _async_remove_message_cache(hass, config_entry)
 
     # Fetch initial data so we have data when entities subscribe
     await coordinator.async_refresh()
@@ -101,12 +149,23 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     # Raise ConfEntryNotReady if coordinator didn't update
     if not coordinator.last_update_success:
         _LOGGER.error("Error updating sensor data: %s", coordinator.last_exception)
+        # Give the sessions back, setup is retried with a new coordinator
+        await coordinator.async_close()
         raise ConfigEntryNotReady
 
     hass.data[DOMAIN][config_entry.entry_id] = {
         COORDINATOR: coordinator,
     }
 
+    # Push updates over IMAP IDLE when enabled
+    if coordinator.idle is not None:
+        coordinator.idle.async_start()
+        config_entry.async_on_unload(
+            hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STOP, coordinator.idle.async_stop
+            )
+        )
+
     for platform in PLATFORMS:
         hass.async_create_task(
             hass.config_entries.async_forward_entry_setup(config_entry, platform)
@@ -130,11 +189,32 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
 
     if unload_ok:
         _LOGGER.debug("Successfully removed sensors from the %s integration", DOMAIN)
-        hass.data[DOMAIN].pop(config_entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(config_entry.entry_id)[COORDINATOR]
+        if coordinator.idle is not None:
+            await coordinator.idle.async_stop()
+        await coordinator.async_close()
 
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    """Delete the emails cached for a removed entry."""
+    await _async_remove_message_cache(hass, config_entry)
+
+
+def _message_cache_path(hass: HomeAssistant, entry_id: str) -> str:
+    """Return the directory of an entry's message cache."""
+    return hass.config.path(STORAGE_DIR, DOMAIN, entry_id)
+
+
+async def _async_remove_message_cache(
+    hass: HomeAssistant, config_entry: ConfigEntry
+) -> None:
+    """Delete an entry's message cache directory."""
+    path = _message_cache_path(hass, config_entry.entry_id)
+    await hass.async_add_executor_job(partial(shutil.rmtree, path, ignore_errors=True))
+
+
 async def update_listener(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
     """Update listener."""
     _LOGGER.debug("Attempting to reload sensors from the %s integration", DOMAIN)
@@ -228,26 +308,233 @@ async def async_migrate_entry(hass, config_entry):
 class MailDataUpdateCoordinator(DataUpdateCoordinator):
     """Class to manage fetching mail data."""
 
-    def __init__(self, hass, host, the_timeout, interval, config):
+    def __init__(self, hass, host, the_timeout, interval, config, entry_id):
         """Initialize."""
         self.interval = timedelta(minutes=interval)
         self.name = f"Mail and Packages ({host})"
         self.timeout = the_timeout
         self.config = config
         self.hass = hass
-
+        self.search_plan = build_search_plan(config)
+        self.use_async = config.get(CONF_IMAP_ASYNC, DEFAULT_IMAP_ASYNC)
+        # Sessions beyond the first one download emails in parallel
+        extra = config.get(CONF_IMAP_CONNECTIONS, DEFAULT_IMAP_CONNECTIONS) - 1
+        compress = config.get(CONF_IMAP_COMPRESS, DEFAULT_IMAP_COMPRESS)
+        # Other folders are scanned at the same time on their own sessions,
+        # they are claimed before the pool's
+        self.data_main = None
+        self.folders = []
+        for folder in entry_folders(config)[1:]:
+            if (connection := self._folder_connection(folder)) is not None:
+                self.folders.append(FolderScan(config, folder, connection))
+        self.pool = None
+        if self.use_async:
+            self.connection = AsyncImapConnection(
+                host,
+                config.get(CONF_PORT),
+                config.get(CONF_USERNAME),
+                config.get(CONF_PASSWORD),
+                config.get(CONF_FOLDER),
+                the_timeout,
+                compress=compress,
+            )
+            if extra > 0:
+                self.pool = AsyncImapConnectionPool(
+                    host,
+                    config.get(CONF_PORT),
+                    config.get(CONF_USERNAME),
+                    config.get(CONF_PASSWORD),
+                    config.get(CONF_FOLDER),
+                    extra,
+                    MAX_IMAP_CONNECTIONS - 1,
+                    the_timeout,
+                    compress,
+                )
+        else:
+            self.connection = ImapConnection(
+                host,
+                config.get(CONF_PORT),
+                config.get(CONF_USERNAME),
+                config.get(CONF_PASSWORD),
+                config.get(CONF_FOLDER),
+                compress=compress,
+            )
+            if extra > 0:
+                self.pool = ImapConnectionPool(
+                    host,
+                    config.get(CONF_PORT),
+                    config.get(CONF_USERNAME),
+                    config.get(CONF_PASSWORD),
+                    config.get(CONF_FOLDER),
+                    extra,
+                    MAX_IMAP_CONNECTIONS - 1,
+                    compress,
+                )
+        self.message_cache = None
+        if config.get(CONF_MESSAGE_CACHE, DEFAULT_MESSAGE_CACHE):
+            self.message_cache = MessageCache(_message_cache_path(hass, entry_id))
         _LOGGER.debug("Data will be update every %s", self.interval)
 
         super().__init__(hass, _LOGGER, name=self.name, update_interval=self.interval)
 
+        self.idle = None
+        if config.get(CONF_IMAP_IDLE, DEFAULT_IMAP_IDLE):
+            self.idle = IdleListener(hass, self, config)
+
+        # Log in shortly before scheduled refreshes
+        self.prewarm = config.get(CONF_IMAP_PREWARM, DEFAULT_IMAP_PREWARM)
+        self._unsub_prewarm = None
+        self._refreshing = False
+
+    def _folder_connection(self, folder):
+        """Create the session used to scan another folder.
+
+        The session counts against MAX_IMAP_CONNECTIONS, None when the mail
+        server has no session left.
+        """
+        config = self.config
+        if not reserve_sessions(config.get(CONF_HOST), 1, MAX_IMAP_CONNECTIONS - 1):
+            _LOGGER.warning(
+                "No IMAP session left to scan %s, skipping the folder", folder
+            )
+            return None
+        args = (
+            config.get(CONF_HOST),
+            config.get(CONF_PORT),
+            config.get(CONF_USERNAME),
+            config.get(CONF_PASSWORD),
+            folder,
+        )
+        compress = config.get(CONF_IMAP_COMPRESS, DEFAULT_IMAP_COMPRESS)
+        if self.use_async:
+            return AsyncImapConnection(*args, self.timeout, compress=compress)
+        return ImapConnection(*args, compress=compress)
+
     async def _async_update_data(self):
         """Fetch data."""
+        self.cancel_prewarm()
+        self._refreshing = True
+        try:
+            return await self._async_update_folders()
+        finally:
+            self._refreshing = False
+            self._schedule_prewarm()
+
+    async def _async_update_folders(self):
+        """Update the sensors from every folder."""
         async with timeout(self.timeout):
             try:
-                data = await self.hass.async_add_executor_job(
-                    process_emails, self.hass, self.config
+                results = await asyncio.gather(
+                    self._async_process(
+                        self.config,
+                        self.connection,
+                        self.search_plan,
+                        self.data_main,
+                        self.pool,
+                    ),
+                    *[self._async_process_folder(scan) for scan in self.folders],
                 )
             except Exception as error:
                 _LOGGER.error("Problem updating sensors: %s", error)
                 raise UpdateFailed(error) from error
+
+            data = self.data_main = results[0]
+            for result in results[1:]:
+                if data and result:
+                    data = merge_sensor_data(data, result)
             return data
+
+    def _schedule_prewarm(self):
+        """Open the sessions a little before the next scheduled refresh."""
+        if not self.prewarm or self.update_interval is None:
+            return
+        delay = self.update_interval.total_seconds() - PREWARM_LEAD
+        if delay > 0:
+            self._unsub_prewarm = async_call_later(
+                self.hass, delay, self._async_prewarm
+            )
+
+    async def async_close(self):
+        """Logout every session and give the extra sessions back."""
+        self.cancel_prewarm()
+        connections = [self.connection]
+        connections.extend(scan.connection for scan in self.folders)
+        if self.pool is not None:
+            connections.append(self.pool)
+        for connection in connections:
+            if self.use_async:
+                await connection.async_close()
+            else:
+                await self.hass.async_add_executor_job(connection.close)
+        release_sessions(self.config.get(CONF_HOST), len(self.folders))
+        self.folders = []
+
+    def cancel_prewarm(self):
+        """Cancel the pending pre-warm."""
+        if self._unsub_prewarm is not None:
+            self._unsub_prewarm()
+            self._unsub_prewarm = None
+
+    async def _async_prewarm(self, _now):
+        """Check or rebuild the sessions so the refresh doesn't wait on a login."""
+        self._unsub_prewarm = None
+        if self._refreshing:
+            return
+        connections = [self.connection]
+        connections.extend(scan.connection for scan in self.folders)
+        if self.pool is not None:
+            connections.append(self.pool)
+        _LOGGER.debug("Opening mail server sessions ahead of the refresh")
+        try:
+            async with timeout(self.timeout):
+                if self.use_async:
+                    await asyncio.gather(
+                        *[connection.async_get() for connection in connections]
+                    )
+                else:
+                    await asyncio.gather(
+                        *[
+                            self.hass.async_add_executor_job(connection.get)
+                            for connection in connections
+                        ]
+                    )
+        except Exception as err:
+            _LOGGER.debug("Error opening mail server sessions: %s", err)
+
+    async def _async_process(
+        self, config, connection, plan, previous, pool, images=True
+    ):
+        """Update the sensors from the emails of one folder."""
+        if self.use_async:
+            return await async_process_emails(
+                self.hass,
+                config,
+                connection,
+                plan,
+                self.message_cache,
+                previous,
+                pool,
+                images,
+            )
+        return await self.hass.async_add_executor_job(
+            process_emails,
+            self.hass,
+            config,
+            plan,
+            connection,
+            self.message_cache,
+            previous,
+            pool,
+            images,
+        )
+
+    async def _async_process_folder(self, scan):
+        """Update the sensors from another folder, errors only skip the folder."""
+        try:
+            scan.data = await self._async_process(
+                scan.config, scan.connection, scan.plan, scan.data, None, False
+            )
+        except Exception as error:
+            _LOGGER.warning("Problem scanning folder %s: %s", scan.folder, error)
+            scan.data = None
+        return scan.data
@@ -23,10 +23,17 @@ from .const import (
     CONF_CUSTOM_IMG,
     CONF_CUSTOM_IMG_FILE,
     CONF_DURATION,
+    CONF_EXTRA_FOLDERS,
     CONF_FOLDER,
     CONF_GENERATE_MP4,
     CONF_IMAGE_SECURITY,
+    CONF_IMAP_ASYNC,
+    CONF_IMAP_COMPRESS,
+    CONF_IMAP_CONNECTIONS,
+    CONF_IMAP_IDLE,
+    CONF_IMAP_PREWARM,
     CONF_IMAP_TIMEOUT,
+    CONF_MESSAGE_CACHE,
     CONF_PATH,
     CONF_SCAN_INTERVAL,
     DEFAULT_ALLOW_EXTERNAL,
@@ -34,16 +41,30 @@ from .const import (
     DEFAULT_AMAZON_FWDS,
     DEFAULT_CUSTOM_IMG,
     DEFAULT_CUSTOM_IMG_FILE,
+    DEFAULT_EXTRA_FOLDERS,
     DEFAULT_FOLDER,
     DEFAULT_GIF_DURATION,
     DEFAULT_IMAGE_SECURITY,
+    DEFAULT_IMAP_ASYNC,
+    DEFAULT_IMAP_COMPRESS,
+    DEFAULT_IMAP_CONNECTIONS,
+    DEFAULT_IMAP_IDLE,
+    DEFAULT_IMAP_PREWARM,
     DEFAULT_IMAP_TIMEOUT,
+    DEFAULT_MESSAGE_CACHE,
     DEFAULT_PATH,
     DEFAULT_PORT,
     DEFAULT_SCAN_INTERVAL,
     DOMAIN,
+    MAX_IMAP_CONNECTIONS,
+)
+from .helpers import (
+    _check_ffmpeg,
+    _test_login,
+    forget_folders,
+    get_resources,
+    list_folders,
 )
-from .helpers import _check_ffmpeg, _test_login, get_resources, login
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -121,27 +142,7 @@ async def _validate_user_input(user_input: dict) -> tuple:
 
 def _get_mailboxes(host: str, port: int, user: str, pwd: str) -> list:
     """Get list of mailbox folders from mail server."""
-    account = login(host, port, user, pwd)
-
-    status, folderlist = account.list()
-    mailboxes = []
-    if status != "OK":
-        _LOGGER.error("Error listing mailboxes ... using default")
-        mailboxes.append(DEFAULT_FOLDER)
-    else:
-        try:
-            for i in folderlist:
-                mailboxes.append(i.decode().split(' "/" ')[1])
-        except IndexError:
-            _LOGGER.error("Error creating folder array trying period")
-            try:
-                for i in folderlist:
-                    mailboxes.append(i.decode().split(' "." ')[1])
-            except IndexError:
-                _LOGGER.error("Error creating folder array, using INBOX")
-                mailboxes.append(DEFAULT_FOLDER)
-
-    return mailboxes
+    return list_folders(host, port, user, pwd)
 
 
 def _get_schema_step_1(user_input: list, default_dict: list) -> Any:
@@ -172,16 +173,21 @@ def _get_schema_step_2(data: list, user_input: list, default_dict: list) -> Any:
         """Get default value for key."""
         return user_input.get(key, default_dict.get(key, fallback_default))
 
+    mailboxes = _get_mailboxes(
+        data[CONF_HOST],
+        data[CONF_PORT],
+        data[CONF_USERNAME],
+        data[CONF_PASSWORD],
+    )
+
     return vol.Schema(
         {
             vol.Required(CONF_FOLDER, default=_get_default(CONF_FOLDER)): vol.In(
-                _get_mailboxes(
-                    data[CONF_HOST],
-                    data[CONF_PORT],
-                    data[CONF_USERNAME],
-                    data[CONF_PASSWORD],
-                )
+                mailboxes
             ),
+            vol.Optional(
+                CONF_EXTRA_FOLDERS, default=_get_default(CONF_EXTRA_FOLDERS)
+            ): cv.multi_select(mailboxes),
             vol.Required(
                 CONF_RESOURCES, default=_get_default(CONF_RESOURCES)
             ): cv.multi_select(get_resources()),
@@ -195,6 +201,20 @@ def _get_schema_step_2(data: list, user_input: list, default_dict: list) -> Any:
             vol.Optional(
                 CONF_IMAP_TIMEOUT, default=_get_default(CONF_IMAP_TIMEOUT)
             ): vol.All(vol.Coerce(int)),
+            vol.Optional(CONF_IMAP_IDLE, default=_get_default(CONF_IMAP_IDLE)): bool,
+            vol.Optional(CONF_IMAP_ASYNC, default=_get_default(CONF_IMAP_ASYNC)): bool,
+            vol.Optional(
+                CONF_IMAP_CONNECTIONS, default=_get_default(CONF_IMAP_CONNECTIONS)
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=MAX_IMAP_CONNECTIONS)),
+            vol.Optional(
+                CONF_IMAP_COMPRESS, default=_get_default(CONF_IMAP_COMPRESS)
+            ): bool,
+            vol.Optional(
+                CONF_IMAP_PREWARM, default=_get_default(CONF_IMAP_PREWARM)
+            ): bool,
+            vol.Optional(
+                CONF_MESSAGE_CACHE, default=_get_default(CONF_MESSAGE_CACHE)
+            ): bool,
             vol.Optional(
                 CONF_DURATION, default=_get_default(CONF_DURATION)
             ): vol.Coerce(int),
@@ -255,6 +275,7 @@ class MailAndPackagesFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
             if not valid:
                 self._errors["base"] = "communication"
             else:
+                forget_folders(user_input[CONF_HOST], user_input[CONF_USERNAME])
                 return await self.async_step_config_2()
 
             return await self._show_config_form(user_input)
@@ -295,11 +316,18 @@ class MailAndPackagesFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         # Defaults
         defaults = {
             CONF_FOLDER: DEFAULT_FOLDER,
+            CONF_EXTRA_FOLDERS: DEFAULT_EXTRA_FOLDERS,
             CONF_SCAN_INTERVAL: DEFAULT_SCAN_INTERVAL,
             CONF_PATH: self.hass.config.path() + DEFAULT_PATH,
             CONF_DURATION: DEFAULT_GIF_DURATION,
             CONF_IMAGE_SECURITY: DEFAULT_IMAGE_SECURITY,
             CONF_IMAP_TIMEOUT: DEFAULT_IMAP_TIMEOUT,
+            CONF_IMAP_IDLE: DEFAULT_IMAP_IDLE,
+            CONF_IMAP_ASYNC: DEFAULT_IMAP_ASYNC,
+            CONF_IMAP_CONNECTIONS: DEFAULT_IMAP_CONNECTIONS,
+            CONF_IMAP_COMPRESS: DEFAULT_IMAP_COMPRESS,
+            CONF_IMAP_PREWARM: DEFAULT_IMAP_PREWARM,
+            CONF_MESSAGE_CACHE: DEFAULT_MESSAGE_CACHE,
             CONF_AMAZON_FWDS: DEFAULT_AMAZON_FWDS,
             CONF_AMAZON_DAYS: DEFAULT_AMAZON_DAYS,
             CONF_GENERATE_MP4: False,
@@ -370,6 +398,7 @@ class MailAndPackagesOptionsFlow(config_entries.OptionsFlow):
             if not valid:
                 self._errors["base"] = "communication"
             else:
+                forget_folders(user_input[CONF_HOST], user_input[CONF_USERNAME])
                 return await self.async_step_options_2()
 
             return await self._show_options_form(user_input)
@@ -402,12 +431,26 @@ class MailAndPackagesOptionsFlow(config_entries.OptionsFlow):
         # Defaults
         defaults = {
             CONF_FOLDER: self._data.get(CONF_FOLDER),
+            CONF_EXTRA_FOLDERS: self._data.get(
+                CONF_EXTRA_FOLDERS, DEFAULT_EXTRA_FOLDERS
+            ),
             CONF_SCAN_INTERVAL: self._data.get(CONF_SCAN_INTERVAL),
             CONF_PATH: self._data.get(CONF_PATH),
             CONF_DURATION: self._data.get(CONF_DURATION),
             CONF_IMAGE_SECURITY: self._data.get(CONF_IMAGE_SECURITY),
             CONF_IMAP_TIMEOUT: self._data.get(CONF_IMAP_TIMEOUT)
             or DEFAULT_IMAP_TIMEOUT,
+            CONF_IMAP_IDLE: self._data.get(CONF_IMAP_IDLE) or DEFAULT_IMAP_IDLE,
+            CONF_IMAP_ASYNC: self._data.get(CONF_IMAP_ASYNC) or DEFAULT_IMAP_ASYNC,
+            CONF_IMAP_CONNECTIONS: self._data.get(CONF_IMAP_CONNECTIONS)
+            or DEFAULT_IMAP_CONNECTIONS,
+            CONF_IMAP_COMPRESS: self._data.get(
+                CONF_IMAP_COMPRESS, DEFAULT_IMAP_COMPRESS
+            ),
+            CONF_IMAP_PREWARM: self._data.get(CONF_IMAP_PREWARM, DEFAULT_IMAP_PREWARM),
+            CONF_MESSAGE_CACHE: self._data.get(
+                CONF_MESSAGE_CACHE, DEFAULT_MESSAGE_CACHE
+            ),
             CONF_AMAZON_FWDS: self._data.get(CONF_AMAZON_FWDS) or DEFAULT_AMAZON_FWDS,
             CONF_AMAZON_DAYS: self._data.get(CONF_AMAZON_DAYS) or DEFAULT_AMAZON_DAYS,
             CONF_GENERATE_MP4: self._data.get(CONF_GENERATE_MP4),
@@ -49,6 +49,13 @@ CONF_IMAP_TIMEOUT = "imap_timeout"
 CONF_GENERATE_MP4 = "generate_mp4"
 CONF_AMAZON_FWDS = "amazon_fwds"
 CONF_AMAZON_DAYS = "amazon_days"
+CONF_IMAP_IDLE = "imap_idle"
+CONF_IMAP_ASYNC = "imap_async"
+CONF_IMAP_CONNECTIONS = "imap_connections"
+CONF_IMAP_COMPRESS = "imap_compress"
+CONF_IMAP_PREWARM = "imap_prewarm"
+CONF_EXTRA_FOLDERS = "extra_folders"
+CONF_MESSAGE_CACHE = "message_cache"
 
 # Defaults
 DEFAULT_CAMERA_NAME = "Mail USPS Camera"
@@ -66,6 +73,28 @@ DEFAULT_ALLOW_EXTERNAL = False
 DEFAULT_CUSTOM_IMG = False
 DEFAULT_CUSTOM_IMG_FILE = "custom_components/mail_and_packages/images/mail_none.gif"
 DEFAULT_AMAZON_DAYS = 3
+DEFAULT_IMAP_IDLE = False
+DEFAULT_IMAP_ASYNC = False
+DEFAULT_IMAP_CONNECTIONS = 1
+DEFAULT_IMAP_COMPRESS = False
+DEFAULT_IMAP_PREWARM = False
+DEFAULT_EXTRA_FOLDERS = []
+DEFAULT_MESSAGE_CACHE = True
+DEFAULT_CACHE_SIZE = 50 * 1024 * 1024  # bytes of raw email kept on disk
+PARSER_VERSION = 1  # bump when the parsers find something new in emails
+UID_SET_SPAN = 1 << 20  # UIDs a bitmap covers before a UidSet keeps a set
+MAX_IMAP_CONNECTIONS = 4  # sessions per mail server, shared by all entries
+FOLDER_LIST_TTL = 3600  # seconds a mail server's folder listing is reused
+PREWARM_LEAD = 10  # seconds before a scheduled refresh the sessions are opened
+PREFETCH_PARTS = "(BODY.PEEK[])"  # full email, without marking it as read
+
+# IMAP IDLE
+IDLE_DEBOUNCE = 5  # seconds to wait for more mail before refreshing
+IDLE_POLL_INTERVAL = 30  # minutes between polls while IDLE is active
+IDLE_TIMEOUT = 29  # minutes before an IDLE command is renewed
+
+# USPS Informed Delivery announcement images, not mail pieces
+USPS_IGNORE_IMAGES = ["mailerProvidedImage", "ra_0", "Mail Attachment.txt"]
 
 # Amazon
 AMAZON_DOMAINS = [
@@ -108,6 +137,13 @@ AMAZON_TIME_PATTERN = [
     "Dostawa:",
     "Zustellung:",
 ]
+# Text following the Amazon delivery date, the first one found ends it
+AMAZON_TIME_PATTERN_END = [
+    "Previously expected:",
+    "Track your",
+    "Per tracciare il tuo pacco",
+    "View or manage order",
+]
 AMAZON_EXCEPTION_SUBJECT = "Delivery update:"
 AMAZON_EXCEPTION_BODY = "running late"
 AMAZON_EXCEPTION = "amazon_exception"
@@ -370,7 +406,9 @@ SENSOR_DATA = {
         "subject": ["is on its way", "is coming today"],
     },
     "auspost_packages": {},
-    "auspost_tracking": {"pattern": ["\\d{7,10,12}|[A-Za-z]{2}[0-9]{9}AU "]},
+    "auspost_tracking": {
+        "pattern": ["\\b(?:\\d{12}|\\d{10}|\\d{7})\\b|[A-Za-z]{2}[0-9]{9}AU\\b"]
+    },
 }
 
 # Sensor definitions
@@ -1,5 +1,7 @@
 """Helper functions for Mail and Packages."""
 
+import asyncio
+import binascii
 import datetime
 import email
 import hashlib
@@ -10,11 +12,20 @@ import os
 import quopri
 import re
 import subprocess  # nosec
+import threading
+import time
 import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import timezone
-from email.header import decode_header
+from email.header import decode_header, make_header
+from email.message import Message
+from email.parser import BytesFeedParser, BytesHeaderParser
+from functools import lru_cache
+from html.parser import HTMLParser
 from shutil import copyfile, copytree, which
-from typing import Any, List, Optional, Type, Union
+from typing import Any, Callable, Iterator, List, Optional, Pattern, Type, Union
 
 import aiohttp
 import imageio as io
@@ -51,16 +62,13 @@ from .const import (
     AMAZON_PATTERN,
     AMAZON_SHIPMENT_TRACKING,
     AMAZON_TIME_PATTERN,
+    AMAZON_TIME_PATTERN_END,
     ATTR_AMAZON_IMAGE,
-    ATTR_BODY,
     ATTR_CODE,
     ATTR_COUNT,
-    ATTR_EMAIL,
     ATTR_IMAGE_NAME,
     ATTR_IMAGE_PATH,
     ATTR_ORDER,
-    ATTR_PATTERN,
-    ATTR_SUBJECT,
     ATTR_TRACKING,
     ATTR_USPS_MAIL,
     CONF_ALLOW_EXTERNAL,
@@ -69,18 +77,72 @@ from .const import (
     CONF_CUSTOM_IMG,
     CONF_CUSTOM_IMG_FILE,
     CONF_DURATION,
+    CONF_EXTRA_FOLDERS,
     CONF_FOLDER,
     CONF_GENERATE_MP4,
+    CONF_IMAP_COMPRESS,
     CONF_PATH,
     DEFAULT_AMAZON_DAYS,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_FOLDER,
+    DEFAULT_IMAP_COMPRESS,
+    FOLDER_LIST_TTL,
     OVERLAY,
-    SENSOR_DATA,
+    PARSER_VERSION,
+    PREFETCH_PARTS,
     SENSOR_TYPES,
     SHIPPERS,
+    UID_SET_SPAN,
+    USPS_IGNORE_IMAGES,
 )
+from .imap import (
+    RE_ESEARCH_TAG,
+    AsyncImapClient,
+    AsyncImapConnection,
+    AsyncImapConnectionPool,
+    ImapBridge,
+    ImapError,
+    ImaplibPipeline,
+    enable_deflate,
+    release_sessions,
+    remember_tls_session,
+    reserve_sessions,
+    ssl_context,
+)
+from .shippers import SHIPPER_SENSORS, TRACKING_SCANNER, compile_pattern
 
 _LOGGER = logging.getLogger(__name__)
 
+# Headers fetched for every email found by the combined search
+PLAN_FETCH = "(UID INTERNALDATE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])"
+
+RE_BODY_SECTION = re.compile(rb"(BODY|BINARY)\[([\d.]+)\]")
+RE_CONTENT_TYPE = re.compile(
+    rb"^content-type:[ \t]*([^\s;]+).*(?:\r?\n[ \t].*)*",
+    re.IGNORECASE | re.MULTILINE,
+)
+RE_ESEARCH_ALL = re.compile(rb"\bALL ([\d:,]+)", re.IGNORECASE)
+RE_ESEARCH_COUNT = re.compile(rb"\bCOUNT (\d+)", re.IGNORECASE)
+RE_HEADER_END = re.compile(rb"\r?\n\r?\n")
+RE_LITERAL_SIZE = re.compile(rb"\{\d+\}$")
+RE_MIME_BOUNDARY = re.compile(
+    rb'boundary[ \t]*=[ \t]*(?:"([^"]+)"|([^\s;]+))', re.IGNORECASE
+)
+RE_SEXP_TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+RE_UID = re.compile(rb"\bUID (\d+)", re.IGNORECASE)
+RE_AMAZON_HUB_SUBJECT = compile_pattern(AMAZON_HUB_SUBJECT_SEARCH)
+RE_AMAZON_HUB_BODY = compile_pattern(AMAZON_HUB_BODY)
+RE_AMAZON_IMG = compile_pattern(AMAZON_IMG_PATTERN)
+RE_AMAZON_ORDER = compile_pattern(AMAZON_PATTERN)
+RE_SPACE = re.compile(r"\s+")
+
+# IMAP month names are always English, don't depend on the locale
+_MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+# Folder listings by (host, user): time listed, folders
+_FOLDER_LISTS = {}
+_FOLDER_LISTS_LOCK = threading.Lock()
+
 # Config Flow Helpers
 
 
@@ -138,44 +200,233 @@ def default_image_path(
     return "custom_components/mail_and_packages/images/"
 
 
-def process_emails(hass: HomeAssistant, config: ConfigEntry) -> dict:
+def process_emails(
+    hass: HomeAssistant,
+    config: ConfigEntry,
+    plan: Optional["SearchPlan"] = None,
+    connection: Optional["ImapConnection"] = None,
+    cache: Optional["MessageCache"] = None,
+    previous: Optional[dict] = None,
+    pool: Optional["ImapConnectionPool"] = None,
+    images: bool = True,
+) -> dict:
     """Process emails and return value.
 
+    Without images the sensors that create images are skipped, used for
+    folders scanned next to the main one.
+
     Returns dict containing sensor data
     """
+    if connection is not None:
+        # Reuse the session kept open by the coordinator, held until the
+        # update is done so a timed out refresh never shares it
+        with connection.session() as account:
+            if not account:
+                return {}
+            return _process_account(
+                hass, config, account, plan, cache, previous, pool, images
+            )
+
     host = config.get(CONF_HOST)
     port = config.get(CONF_PORT)
     user = config.get(CONF_USERNAME)
     pwd = config.get(CONF_PASSWORD)
     folder = config.get(CONF_FOLDER)
-    resources = config.get(CONF_RESOURCES)
-
-    # Create the dict container
-    data = {}
 
     # Login to email server and select the folder
-    account = login(host, port, user, pwd)
+    account = login(
+        host, port, user, pwd, config.get(CONF_IMAP_COMPRESS, DEFAULT_IMAP_COMPRESS)
+    )
 
     # Do not process if account returns false
     if not account:
-        return data
+        return {}
 
-    if not selectfolder(account, folder):
-        # Bail out on error
-        return data
+    try:
+        if not selectfolder(account, folder):
+            # Bail out on error
+            return {}
+        return _process_account(
+            hass, config, account, plan, cache, previous, images=images
+        )
+    finally:
+        _logout(account)
+
+
+def _process_account(
+    hass: HomeAssistant,
+    config: ConfigEntry,
+    account: Type[imaplib.IMAP4_SSL],
+    plan: Optional["SearchPlan"] = None,
+    cache: Optional["MessageCache"] = None,
+    previous: Optional[dict] = None,
+    pool: Optional["ImapConnectionPool"] = None,
+    images: bool = True,
+) -> dict:
+    """Update every sensor using a logged in account with the folder selected.
+
+    Returns dict containing sensor data, or a copy of previous when the
+    folder is unchanged since the last refresh
+    """
+    # Messages already downloaded are read from disk by email_fetch
+    if cache is not None:
+        account.message_cache = cache
+
+    # Run the combined search once, sensors are answered from its results
+    if plan is None:
+        plan = build_search_plan(config)
+    status = mailbox_status(account, config.get(CONF_FOLDER))
+    if previous and plan.unchanged(status):
+        _LOGGER.debug("No changes in mail folder, keeping sensor data")
+        return _keep_sensor_data(previous)
+    plan.execute(account, status)
+
+    if pool is None:
+        return _update_sensors(hass, config, account, plan, [], images)
+    with pool.session() as sessions:
+        return _update_sensors(hass, config, account, plan, sessions, images)
+
+
+async def async_process_emails(
+    hass: HomeAssistant,
+    config: ConfigEntry,
+    connection: AsyncImapConnection,
+    plan: Optional["SearchPlan"] = None,
+    cache: Optional["MessageCache"] = None,
+    previous: Optional[dict] = None,
+    pool: Optional[AsyncImapConnectionPool] = None,
+    images: bool = True,
+) -> dict:
+    """Process emails using the asyncio IMAP client.
+
+    The folder status, the combined search and the download of the emails
+    the parsers read are awaited on the event loop, so the sensors updated
+    in the executor mostly parse what is already there. Cancelling this
+    also cancels the IMAP commands the sensors are waiting on.
+
+    Returns dict containing sensor data
+    """
+    client = await connection.async_get()
+    if not client:
+        return {}
+
+    if plan is None:
+        plan = build_search_plan(config)
+    status = await async_mailbox_status(client, config.get(CONF_FOLDER))
+    if previous and plan.unchanged(status):
+        _LOGGER.debug("No changes in mail folder, keeping sensor data")
+        return _keep_sensor_data(previous)
+    await plan.async_execute(client, status)
+
+    account = ImapBridge(client, hass.loop)
+    if cache is not None:
+        account.message_cache = cache
+    if plan.ready:
+        clients = [client]
+        if pool is not None:
+            clients.extend(await pool.async_get())
+        await async_prefetch_emails(hass, account, clients, plan.body_uids())
+    try:
+        return await hass.async_add_executor_job(
+            _update_sensors, hass, config, account, plan, None, images
+        )
+    finally:
+        account.cancel()
+
+
+def _keep_sensor_data(previous: dict) -> dict:
+    """Return the sensor data of an unchanged folder for this refresh."""
+    data = previous.copy()
+    if "mail_updated" in data:
+        data["mail_updated"] = update_time()
+    return data
+
+
+def entry_folders(config: ConfigEntry) -> list:
+    """Return the folders scanned for an entry, the main folder first."""
+    folders = [config.get(CONF_FOLDER)]
+    for folder in config.get(CONF_EXTRA_FOLDERS) or []:
+        if folder not in folders:
+            folders.append(folder)
+    return folders
+
+
+class FolderScan:
+    """Session and state of a folder scanned next to the main folder.
+
+    Each folder keeps its own combined search and sensor data, so an
+    unchanged folder isn't searched again on the next refresh.
+    """
+
+    def __init__(self, config: ConfigEntry, folder: str, connection: Any) -> None:
+        """Initialize."""
+        self.config = {**config, CONF_FOLDER: folder}
+        self.folder = folder
+        self.connection = connection
+        self.plan = build_search_plan(self.config)
+        self.data = None
+
+
+def merge_sensor_data(data: dict, other: dict) -> dict:
+    """Add the sensor data of another folder.
+
+    Counts are added up and lists joined, everything else like image
+    names and the update time comes from the main folder.
+
+    Returns merged dict
+    """
+    merged = dict(data)
+    for key, value in other.items():
+        current = merged.get(key)
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(current, bool) or isinstance(value, bool):
+            continue
+        elif isinstance(current, int) and isinstance(value, int):
+            merged[key] = current + value
+        elif isinstance(current, list) and isinstance(value, list):
+            merged[key] = list(dict.fromkeys(current + value))
+    return merged
+
+
+def _update_sensors(
+    hass: HomeAssistant,
+    config: ConfigEntry,
+    account: Type[imaplib.IMAP4_SSL],
+    plan: "SearchPlan",
+    sessions: Optional[list] = None,
+    images: bool = True,
+) -> dict:
+    """Update every sensor once the combined search has run.
+
+    Returns dict containing sensor data
+    """
+    resources = config.get(CONF_RESOURCES)
+    account.search_plan = plan
+    account.messages = {}
+    if not images:
+        resources = [sensor for sensor in resources if sensor != ATTR_USPS_MAIL]
+
+    # Download the day's emails a parser will read over the extra sessions
+    if sessions and plan.ready:
+        prefetch_emails(account, sessions, plan.body_uids())
+
+    # Create the dict container
+    data = {}
 
     # Create image file name dict container
-    _image = {}
+    _image = {ATTR_IMAGE_NAME: None, ATTR_AMAZON_IMAGE: None}
 
-    # USPS Mail Image name
-    image_name = image_file_name(hass, config)
-    _LOGGER.debug("Image name: %s", image_name)
-    _image[ATTR_IMAGE_NAME] = image_name
+    if images:
+        # USPS Mail Image name
+        image_name = image_file_name(hass, config)
+        _LOGGER.debug("Image name: %s", image_name)
+        _image[ATTR_IMAGE_NAME] = image_name
 
-    # Amazon delivery image name
-    image_name = image_file_name(hass, config, True)
-    _LOGGER.debug("Amazon Image Name: %s", image_name)
-    _image[ATTR_AMAZON_IMAGE] = image_name
+        # Amazon delivery image name
+        image_name = image_file_name(hass, config, True)
+        _LOGGER.debug("Amazon Image Name: %s", image_name)
+        _image[ATTR_AMAZON_IMAGE] = image_name
 
     image_path = config.get(CONF_PATH)
     _LOGGER.debug("Image path: %s", image_path)
@@ -183,13 +434,27 @@ def process_emails(hass: HomeAssistant, config: ConfigEntry) -> dict:
     data.update(_image)
 
     # Only update sensors we're intrested in
-    for sensor in resources:
-        fetch(hass, config, account, data, sensor)
+    try:
+        for sensor in resources:
+            fetch(hass, config, account, data, sensor)
+    finally:
+        account.prefetched = {}
+        account.messages = {}
 
     # Copy image file to www directory if enabled
-    if config.get(CONF_ALLOW_EXTERNAL):
+    if images and config.get(CONF_ALLOW_EXTERNAL):
         copy_images(hass, config)
 
+    if (deflate := getattr(account, "deflate", None)) is not None:
+        _LOGGER.debug(
+            "IMAP compression: %s bytes received as %s, %s bytes sent as %s (%.1fx)",
+            deflate.bytes_in,
+            deflate.wire_in,
+            deflate.bytes_out,
+            deflate.wire_out,
+            deflate.ratio,
+        )
+
     return data
 
 
@@ -407,175 +672,2128 @@ def fetch(
             account, sensor, False, img_out_path, hass, amazon_image_name
         )[ATTR_COUNT]
 
-    data.update(count)
-    _LOGGER.debug("Sensor: %s Count: %s", sensor, str(count[sensor]))
-    return count[sensor]
+    data.update(count)
+    _LOGGER.debug("Sensor: %s Count: %s", sensor, str(count[sensor]))
+    return count[sensor]
+
+
+def login(
+    host: str, port: int, user: str, pwd: str, compress: bool = False
+) -> Union[bool, Type[imaplib.IMAP4_SSL]]:
+    """Login to IMAP server.
+
+    With compress the session uses COMPRESS=DEFLATE when the server
+    supports it. The TLS session of the last login to the host is resumed.
+
+    Returns account object
+    """
+    # Catch invalid mail server / host names
+    try:
+        account = imaplib.IMAP4_SSL(host, port, ssl_context=ssl_context())
+
+    except Exception as err:
+        _LOGGER.error("Network error while connecting to server: %s", str(err))
+        return False
+
+    # If login fails give error message
+    try:
+        account.login(user, pwd)
+    except Exception as err:
+        _LOGGER.error("Error logging into IMAP Server: %s", str(err))
+        return False
+    remember_tls_session(host, getattr(account, "sock", None))
+
+    if compress and has_capability(account, "COMPRESS=DEFLATE"):
+        try:
+            enable_deflate(account)
+        except imaplib.IMAP4.abort:
+            # The session is gone, the next one isn't compressed
+            return login(host, port, user, pwd)
+
+    return account
+
+
+def selectfolder(account: Type[imaplib.IMAP4_SSL], folder: str) -> bool:
+    """Select folder inside the mailbox."""
+    try:
+        account.select(folder)
+    except Exception as err:
+        _LOGGER.error("Error selecting folder: %s", str(err))
+        return False
+    account.folder = folder
+    account.uidvalidity = _uidvalidity(account)
+    return True
+
+
+def list_folders(host: str, port: int, user: str, pwd: str) -> list:
+    """List the folders of a mailbox.
+
+    The listing is kept for FOLDER_LIST_TTL seconds per server and user,
+    folders rarely change and listing them needs its own login. The
+    config flows call forget_folders first so they show new folders.
+
+    Returns list of folder names as they are passed to SELECT
+    """
+    key = (host, user)
+    with _FOLDER_LISTS_LOCK:
+        if (cached := _FOLDER_LISTS.get(key)) is not None:
+            if time.monotonic() - cached[0] < FOLDER_LIST_TTL:
+                return list(cached[1])
+
+    account = login(host, port, user, pwd)
+    if not account:
+        return [DEFAULT_FOLDER]
+    try:
+        (server_response, data) = account.list()
+    except Exception as err:
+        _LOGGER.error("Error listing folders: %s", str(err))
+        return [DEFAULT_FOLDER]
+    finally:
+        _logout(account)
+
+    if server_response != "OK":
+        _LOGGER.error("Error listing mailboxes ... using default")
+        return [DEFAULT_FOLDER]
+    folders = _parse_folders(data)
+    with _FOLDER_LISTS_LOCK:
+        _FOLDER_LISTS[key] = (time.monotonic(), folders)
+    return list(folders)
+
+
+def forget_folders(host: str, user: str) -> None:
+    """Drop the folder listing kept by list_folders."""
+    with _FOLDER_LISTS_LOCK:
+        _FOLDER_LISTS.pop((host, user), None)
+
+
+def _parse_folders(data: list) -> list:
+    """Read the folder names of a LIST response.
+
+    Returns list of folder names
+    """
+    folders = []
+    try:
+        for i in data:
+            folders.append(i.decode().split(' "/" ')[1])
+    except IndexError:
+        _LOGGER.error("Error creating folder array trying period")
+        folders = []
+        try:
+            for i in data:
+                folders.append(i.decode().split(' "." ')[1])
+        except IndexError:
+            _LOGGER.error("Error creating folder array, using INBOX")
+            folders = [DEFAULT_FOLDER]
+    return folders
+
+
+def _uidvalidity(account: Type[imaplib.IMAP4_SSL]) -> Optional[int]:
+    """Return the UIDVALIDITY reported when the folder was selected."""
+    try:
+        (_, data) = account.response("UIDVALIDITY")
+        return int(data[0])
+    except Exception:
+        return None
+
+
+def mailbox_status(account: Type[imaplib.IMAP4_SSL], folder: str) -> Optional[dict]:
+    """Get the message count, UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ of a folder.
+
+    Returns dict of status items or None on error
+    """
+    items = _status_items(account)
+    try:
+        (server_response, data) = account.status(folder, f"({' '.join(items)})")
+    except Exception as err:
+        _LOGGER.debug("Error getting folder status: %s", str(err))
+        return None
+    return _parse_status(items, server_response, data)
+
+
+async def async_mailbox_status(client: AsyncImapClient, folder: str) -> Optional[dict]:
+    """Get the folder status using the asyncio client.
+
+    Returns dict of status items or None on error
+    """
+    items = _status_items(client)
+    try:
+        (server_response, data) = await client.status(folder, f"({' '.join(items)})")
+    except (OSError, EOFError, asyncio.TimeoutError, ImapError) as err:
+        _LOGGER.debug("Error getting folder status: %s", str(err))
+        return None
+    return _parse_status(items, server_response, data)
+
+
+def _status_items(account: Any) -> list:
+    items = ["MESSAGES", "UIDNEXT", "UIDVALIDITY"]
+    if "CONDSTORE" in getattr(account, "capabilities", ()):
+        items.append("HIGHESTMODSEQ")
+    return items
+
+
+def _parse_status(items: list, server_response: str, data: list) -> Optional[dict]:
+    """Parse a STATUS response.
+
+    Returns dict of status items or None if any is missing
+    """
+    if server_response != "OK" or not data or not isinstance(data[0], bytes):
+        return None
+
+    # Skip the folder name, only look inside the parenthesized list
+    status = {
+        key.decode(): int(value)
+        for key, value in re.findall(
+            rb"([A-Z]+) (\d+)", data[0].rsplit(b"(", 1)[-1].upper()
+        )
+    }
+    if any(item not in status for item in items):
+        return None
+    return status
+
+
+def _logout(account: Type[imaplib.IMAP4_SSL]) -> None:
+    """Logout of the IMAP server, ignoring a connection that is already gone."""
+    try:
+        account.logout()
+    except Exception as err:
+        _LOGGER.debug("Error logging out of IMAP Server: %s", str(err))
+
+
+class ImapConnection:
+    """Authenticated IMAP session kept open between coordinator refreshes.
+
+    The session is checked with NOOP before it is handed out and rebuilt
+    (login and folder select) when the server has dropped it. Failed
+    reconnects are retried with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        pwd: str,
+        folder: str,
+        retries: int = 3,
+        backoff: float = 1.0,
+        compress: bool = DEFAULT_IMAP_COMPRESS,
+    ) -> None:
+        """Initialize."""
+        self.host = host
+        self.port = port
+        self.user = user
+        self.pwd = pwd
+        self.folder = folder
+        self.retries = retries
+        self.backoff = backoff
+        self.compress = compress
+        self._account = None
+        self.lock = threading.Lock()
+
+    def get(self) -> Union[bool, Type[imaplib.IMAP4_SSL]]:
+        """Return a live session with the folder selected.
+
+        Returns account object or False if the server can't be reached
+        """
+        with self.lock:
+            return self.get_locked()
+
+    @contextmanager
+    def session(self) -> Iterator[Union[bool, Type[imaplib.IMAP4_SSL]]]:
+        """Hold the session while an update uses it.
+
+        imaplib isn't thread-safe: a refresh that timed out keeps running in
+        its executor thread, so the next refresh or pre-warm waits for it
+        instead of sending commands on the same session.
+
+        Yields account object or False if the server can't be reached
+        """
+        with self.lock:
+            yield self.get_locked()
+
+    def get_locked(self) -> Union[bool, Type[imaplib.IMAP4_SSL]]:
+        """Return a live session, the caller holding lock."""
+        if self._account is not None and self._alive(self._account):
+            return self._account
+        self._close()
+
+        for attempt in range(self.retries):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                _LOGGER.debug("Reconnecting to IMAP Server in %s seconds", delay)
+                time.sleep(delay)
+
+            account = login(self.host, self.port, self.user, self.pwd, self.compress)
+            if not account:
+                continue
+            if not selectfolder(account, self.folder):
+                _logout(account)
+                continue
+
+            self._account = account
+            return account
+
+        _LOGGER.error(
+            "Unable to connect to %s after %s attempts", self.host, self.retries
+        )
+        return False
+
+    def close(self) -> None:
+        """Logout and drop the session."""
+        with self.lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._account is not None:
+            _logout(self._account)
+            self._account = None
+
+    @staticmethod
+    def _alive(account: Type[imaplib.IMAP4_SSL]) -> bool:
+        """Check the session with a NOOP."""
+        try:
+            (server_response, _) = account.noop()
+        except Exception as err:
+            _LOGGER.debug("IMAP session lost: %s", str(err))
+            return False
+        return server_response == "OK"
+
+
+class ImapConnectionPool:
+    """Extra IMAP sessions used to download emails in parallel.
+
+    The number of sessions is bounded per mail server by reserve_sessions.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        pwd: str,
+        folder: str,
+        size: int,
+        limit: int,
+        compress: bool = DEFAULT_IMAP_COMPRESS,
+    ) -> None:
+        """Initialize."""
+        self.host = host
+        self.size = reserve_sessions(host, size, limit)
+        self.connections = [
+            ImapConnection(host, port, user, pwd, folder, retries=1, compress=compress)
+            for _ in range(self.size)
+        ]
+
+    def get(self) -> list:
+        """Return the sessions that are up, reconnecting dropped ones.
+
+        Returns list of account objects
+        """
+        with self.session() as accounts:
+            return accounts
+
+    @contextmanager
+    def session(self) -> Iterator[list]:
+        """Hold every session while an update uses them.
+
+        Yields list of account objects
+        """
+        with ExitStack() as stack:
+            for connection in self.connections:
+                stack.enter_context(connection.lock)
+            yield self._get()
+
+    def _get(self) -> list:
+        """Reconnect the dropped sessions in parallel, their locks held."""
+        if not self.connections:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.connections)) as executor:
+            accounts = list(executor.map(ImapConnection.get_locked, self.connections))
+        return [account for account in accounts if account]
+
+    def close(self) -> None:
+        """Logout every session and give them back."""
+        for connection in self.connections:
+            connection.close()
+        release_sessions(self.host, self.size)
+        self.connections = []
+        self.size = 0
+
+
+def get_formatted_date() -> str:
+    """Return today in specific format.
+
+    Returns current timestamp as string
+    """
+    today = datetime.datetime.today().strftime("%d-%b-%Y")
+    #
+    # for testing
+    # today = "11-Jan-2021"
+    #
+    return today
+
+
+def update_time() -> Any:
+    """Get update time.
+
+    Returns current timestamp as string
+    """
+    # updated = datetime.datetime.now().strftime("%b-%d-%Y %I:%M %p")
+    # updated = datetime.datetime.now(timezone.utc).isoformat(timespec="minutes")
+    updated = datetime.datetime.now(timezone.utc)
+
+    return updated
+
+
+def build_search(address: list, date: str, subject: str = None) -> tuple:
+    """Build IMAP search query.
+
+    Return tuple of utf8 flag and search query.
+    """
+    the_date = f"SINCE {date}"
+    imap_search = None
+    utf8_flag = False
+    prefix_list = None
+    email_list = None
+
+    if isinstance(address, list):
+        if len(address) == 1:
+            email_list = address[0]
+        else:
+            email_list = '" FROM "'.join(address)
+            prefix_list = " ".join(["OR"] * (len(address) - 1))
+    else:
+        email_list = address
+
+    _LOGGER.debug("DEBUG subject: %s", subject)
+
+    if subject is not None:
+        if not subject.isascii():
+            # The subject is sent as a UTF-8 literal after the query, so it
+            # has to be the last key, top level keys are ANDed
+            utf8_flag = True
+            if prefix_list is not None:
+                imap_search = f'{prefix_list} FROM "{email_list}" {the_date} SUBJECT'
+            else:
+                imap_search = f'FROM "{email_list}" {the_date} SUBJECT'
+        else:
+            if prefix_list is not None:
+                imap_search = f'({prefix_list} FROM "{email_list}" SUBJECT "{subject}" {the_date})'
+            else:
+                imap_search = f'(FROM "{email_list}" SUBJECT "{subject}" {the_date})'
+    else:
+        if prefix_list is not None:
+            imap_search = f'({prefix_list} FROM "{email_list}" {the_date})'
+        else:
+            imap_search = f'(FROM "{email_list}" {the_date})'
+
+    _LOGGER.debug("DEBUG imap_search: %s", imap_search)
+
+    return (utf8_flag, imap_search)
+
+
+def email_search(
+    account: Type[imaplib.IMAP4_SSL], address: list, date: str, subject: str = None
+) -> tuple:
+    """Search emails with from, subject, senton date.
+
+    Returns a tuple
+    """
+    # Answer from the combined search if this refresh ran one
+    plan = getattr(account, "search_plan", None)
+    if plan is not None and (value := plan.lookup(address, date, subject)):
+        _LOGGER.debug("DEBUG email_search plan value: %s", value)
+        return value
+
+    utf8_flag, search = build_search(address, date, subject)
+
+    if utf8_flag:
+        subject = subject.encode("utf-8")
+        account.literal = subject
+        try:
+            value = account.uid("SEARCH", "CHARSET", "UTF-8", search)
+        except Exception as err:
+            _LOGGER.warning(
+                "Error searching emails with unicode characters: %s", str(err)
+            )
+            value = "BAD", err.args[0]
+    else:
+        try:
+            value = account.uid("SEARCH", search)
+        except Exception as err:
+            _LOGGER.error("Error searching emails: %s", str(err))
+            value = "BAD", err.args[0]
+
+    _LOGGER.debug("DEBUG email_search value: %s", value)
+
+    (check, new_value) = value
+    if new_value[0] is None:
+        _LOGGER.warning("DEBUG email_search value was invalid: None")
+        value = (check, [b""])
+
+    return value
+
+
+def email_search_many(account: Type[imaplib.IMAP4_SSL], queries: list) -> list:
+    """Run several independent email searches.
+
+    Queries are (address, date, subject) tuples. On servers with ESEARCH
+    the ones the combined search can't answer are pipelined: sent to the
+    server back to back, so they cost about one round trip together
+    instead of one each. Other servers are searched one query at a time.
+
+    Returns list of email_search style tuples, in the order of queries
+    """
+    results = [None] * len(queries)
+    plan = getattr(account, "search_plan", None)
+    pending = []
+    for index, (address, date, subject) in enumerate(queries):
+        if plan is not None and (value := plan.lookup(address, date, subject)):
+            results[index] = value
+            continue
+        utf8_flag, search = build_search(address, date, subject)
+        if utf8_flag:
+            results[index] = email_search(account, address, date, subject)
+        else:
+            pending.append((index, search))
+
+    values = None
+    if len(pending) > 1:
+        values = search_pipeline(account, [search for _, search in pending])
+    if values is None:
+        values = [None] * len(pending)
+    for (index, _), value in zip(pending, values):
+        if value is None:
+            value = email_search(account, *queries[index])
+        elif not value[1] or value[1][0] is None:
+            value = (value[0], [b""])
+        results[index] = value
+
+    _LOGGER.debug("DEBUG email_search_many values: %s", results)
+    return results
+
+
+def search_pipeline(
+    account: Type[imaplib.IMAP4_SSL], searches: list, count: bool = False
+) -> Optional[list]:
+    """Send several SEARCH commands without waiting for each answer.
+
+    Servers may answer pipelined commands in any order, so this needs
+    ESEARCH (RFC 4731): the searches ask for RETURN (ALL), or RETURN
+    (COUNT) with count, and each ESEARCH response names its command.
+
+    Returns list of (type, data) tuples, data as email_search returns it
+    or the ESEARCH response with count. An entry is None when the server
+    didn't answer that search with ESEARCH, the list is None if the
+    session can't pipeline
+    """
+    if not has_capability(account, "ESEARCH"):
+        return None
+    if (pipeline := getattr(account, "pipeline", None)) is None:
+        if not ImaplibPipeline.supported(account):
+            return None
+        pipeline = ImaplibPipeline(account).pipeline
+    returns = "COUNT" if count else "ALL"
+    try:
+        values = pipeline(
+            [f"UID SEARCH RETURN ({returns}) {search}" for search in searches]
+        )
+    except Exception as err:
+        _LOGGER.warning("Error running pipelined searches: %s", str(err))
+        return None
+
+    results = []
+    for (server_response, data) in values:
+        response = data[-1] if data else None
+        if server_response != "OK":
+            results.append((server_response, data))
+        elif not isinstance(response, bytes) or not RE_ESEARCH_TAG.match(response):
+            # Answered without ESEARCH, the caller runs it on its own
+            results.append(None)
+        elif count:
+            results.append((server_response, data))
+        else:
+            results.append((server_response, [_esearch_all(response)]))
+    return results
+
+
+def _esearch_all(response: bytes) -> bytes:
+    """Turn the ALL of an ESEARCH response into SEARCH style ids.
+
+    Returns space separated ids, empty if nothing matched
+    """
+    if (match := RE_ESEARCH_ALL.search(response)) is None:
+        return b""
+    ids = []
+    for item in match.group(1).split(b","):
+        first, _, last = item.partition(b":")
+        first, last = sorted((int(first), int(last or first)))
+        ids.extend(range(first, last + 1))
+    return " ".join(str(uid) for uid in ids).encode()
+
+
+def email_count(
+    account: Type[imaplib.IMAP4_SSL], address: list, date: str, subject: str = None
+) -> tuple:
+    """Count emails with from, subject, senton date.
+
+    Servers with ESEARCH answer SEARCH RETURN (COUNT) with just the number,
+    other servers are counted from the ids email_search returns.
+
+    Returns tuple: server response, count
+    """
+    plan = getattr(account, "search_plan", None)
+    if plan is None or not plan.lookup(address, date, subject):
+        utf8_flag, search = build_search(address, date, subject)
+        if not utf8_flag and has_capability(account, "ESEARCH"):
+            if (count := _search_count(account, search)) is not None:
+                _LOGGER.debug("DEBUG email_count value: %s", count)
+                return "OK", count
+
+    (server_response, data) = email_search(account, address, date, subject)
+    if server_response != "OK" or data[0] is None:
+        return server_response, 0
+    return server_response, len(data[0].split())
+
+
+def email_count_many(account: Type[imaplib.IMAP4_SSL], queries: list) -> list:
+    """Count emails for several independent searches.
+
+    Queries are (address, date, subject) tuples. On servers with ESEARCH
+    the counts the combined search can't answer are pipelined like
+    email_search_many does, the rest go through email_count.
+
+    Returns list of email_count style tuples, in the order of queries
+    """
+    results = [None] * len(queries)
+    pending = []
+    if has_capability(account, "ESEARCH"):
+        plan = getattr(account, "search_plan", None)
+        for index, (address, date, subject) in enumerate(queries):
+            if plan is not None and plan.lookup(address, date, subject):
+                continue
+            utf8_flag, search = build_search(address, date, subject)
+            if not utf8_flag:
+                pending.append((index, search))
+
+    if len(pending) > 1 and (
+        values := search_pipeline(
+            account, [search for _, search in pending], count=True
+        )
+    ):
+        for (index, _), value in zip(pending, values):
+            if value is not None and (found := _esearch_count(*value)) is not None:
+                results[index] = ("OK", found)
+
+    for index, query in enumerate(queries):
+        if results[index] is None:
+            results[index] = email_count(account, *query)
+
+    _LOGGER.debug("DEBUG email_count_many values: %s", results)
+    return results
+
+
+def _search_count(account: Type[imaplib.IMAP4_SSL], search: str) -> Optional[int]:
+    """Run SEARCH RETURN (COUNT) (RFC 4731).
+
+    Returns count or None if the server didn't answer with one
+    """
+    try:
+        (server_response, _) = account.uid("SEARCH", "RETURN (COUNT)", search)
+        (_, data) = account.response("ESEARCH")
+    except Exception as err:
+        _LOGGER.debug("Error counting emails: %s", str(err))
+        return None
+    return _esearch_count(server_response, data)
+
+
+def _esearch_count(server_response: str, data: list) -> Optional[int]:
+    """Read the count from an ESEARCH response.
+
+    Returns count or None if the response doesn't hold one
+    """
+    if server_response != "OK" or not data or not isinstance(data[-1], bytes):
+        return None
+    if (match := RE_ESEARCH_COUNT.search(data[-1])) is None:
+        # No COUNT means nothing matched
+        return 0
+    return int(match.group(1))
+
+
+def has_capability(account: Type[imaplib.IMAP4_SSL], name: str) -> bool:
+    """Check if the server supports an extension.
+
+    Servers often announce more once logged in, so the capabilities are
+    asked for again the first time this is called for a session.
+    """
+    if not getattr(account, "capabilities_probed", False):
+        try:
+            (server_response, data) = account.capability()
+            if server_response == "OK" and data and isinstance(data[-1], bytes):
+                account.capabilities = tuple(data[-1].decode().upper().split())
+        except Exception as err:
+            _LOGGER.debug("Error checking server capabilities: %s", str(err))
+        account.capabilities_probed = True
+    return name in getattr(account, "capabilities", ())
+
+
+def build_search_plan(config: ConfigEntry) -> "SearchPlan":
+    """Collect the sender addresses and subjects used by the enabled sensors.
+
+    Returns SearchPlan
+    """
+    resources = config.get(CONF_RESOURCES) or []
+    amazon_fwds = config.get(CONF_AMAZON_FWDS)
+    if isinstance(amazon_fwds, str):
+        amazon_fwds = amazon_fwds.split(",")
+    amazon_fwds = _process_amazon_forwards(amazon_fwds)
+    addresses = []
+    queries = {}
+    days = 0
+
+    def _add(sensor: str, values: list, subjects: list) -> None:
+        for value in values:
+            if value not in addresses:
+                addresses.append(value)
+        queries[sensor] = (values, subjects)
+
+    amazon = [f"{AMAZON_EMAIL}{domain}" for domain in AMAZON_DOMAINS]
+    for sensor in resources:
+        if sensor == AMAZON_PACKAGES:
+            shipped = [
+                f"{address}@{domain}"
+                for domain in AMAZON_DOMAINS
+                for address in AMAZON_SHIPMENT_TRACKING
+            ]
+            _add(sensor, [fwd.strip('"') for fwd in amazon_fwds] + shipped, [None])
+            days = config.get(CONF_AMAZON_DAYS) or DEFAULT_AMAZON_DAYS
+        elif sensor == AMAZON_DELIVERED:
+            fwds = [fwd.strip('"') for fwd in amazon_fwds]
+            _add(sensor, fwds + amazon, AMAZON_DELIVERED_SUBJECT)
+        elif sensor == AMAZON_EXCEPTION:
+            fwds = [fwd.strip('"') for fwd in amazon_fwds]
+            _add(sensor, fwds + amazon, [AMAZON_EXCEPTION_SUBJECT])
+        elif sensor == AMAZON_HUB:
+            _add(sensor, amazon_fwds + AMAZON_HUB_EMAIL, [AMAZON_HUB_SUBJECT])
+        else:
+            prefix = "_".join(sensor.split("_")[:-1])
+            for key, shipper in SHIPPER_SENSORS.items():
+                if shipper.shipper == prefix:
+                    _add(key, list(shipper.senders), list(shipper.subjects) or [None])
+
+    _LOGGER.debug("Search plan covers %s addresses", len(addresses))
+    bodies = {sensor: _body_reader(sensor) for sensor in queries}
+    return SearchPlan(addresses, days, queries, bodies)
+
+
+def _body_reader(sensor: str) -> Union[bool, Pattern, None]:
+    """Tell if the parser of a sensor downloads the emails it finds.
+
+    Returns True, False, or the tracking pattern of a sensor that only reads
+    the emails without a tracking number in the subject
+    """
+    if sensor in (AMAZON_PACKAGES, AMAZON_EXCEPTION, AMAZON_HUB):
+        return True
+    if sensor == ATTR_USPS_MAIL or (shipper := SHIPPER_SENSORS.get(sensor)) is None:
+        return False
+    if shipper.bodies:
+        return True
+    if sensor.endswith("_delivering") and shipper.tracking is not None:
+        return re.compile(shipper.tracking.pattern, re.IGNORECASE)
+    return False
+
+
+def _internal_date(meta: bytes) -> Optional[datetime.date]:
+    """Parse the date portion of an INTERNALDATE fetch item.
+
+    Returns date or None
+    """
+    found = re.search(rb'INTERNALDATE "\s?(\d{1,2})-(\w{3})-(\d{4})', meta)
+    if found is None:
+        return None
+    try:
+        return datetime.date(
+            int(found.group(3)),
+            _MONTHS.index(found.group(2).decode().title()) + 1,
+            int(found.group(1)),
+        )
+    except ValueError:
+        return None
+
+
+def _sender_key(address: str) -> str:
+    """Normalize a sender address or name for the routing table."""
+    return address.strip().strip('"').strip().lower()
+
+
+class SubjectMatcher:
+    """Aho-Corasick automaton finding every known subject in a subject line.
+
+    All subjects are found in one pass over the subject line, also when
+    one subject is part of another.
+    """
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, subjects: list) -> None:
+        """Initialize."""
+        self._goto = [{}]
+        self._out = [set()]
+        for subject in subjects:
+            state = 0
+            for char in subject:
+                if (nxt := self._goto[state].get(char)) is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(subject)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> set:
+        """Find the subjects contained in text.
+
+        Returns set of subjects
+        """
+        found = set(self._out[0])
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+
+def _header_text(value: Any) -> str:
+    """Decode an encoded-word header into plain text.
+
+    Returns string
+    """
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:  # pylint: disable=broad-except
+        return str(value)
+
+
+class SearchPlan:
+    """Single combined search answering every sensor search of a refresh.
+
+    Instead of one SEARCH per sensor, subject and domain the plan issues one
+    SEARCH for all known senders, fetches the sender, subject and internal
+    date of the matches in one FETCH and answers email_search lookups from
+    that table.
+
+    Each email is routed once as its headers arrive: the sensor addresses
+    contained in the From header are found in a single pass, like the
+    server's FROM search matches them, and the subject is matched against
+    all subjects used with those senders the same way. Lookups then read
+    the emails indexed under their address and subject.
+
+    The folder status of the last run is kept so the next refresh only has
+    to search the emails that arrived since then.
+    """
+
+    def __init__(
+        self,
+        addresses: list,
+        days: int = 0,
+        queries: dict = None,
+        bodies: dict = None,
+    ) -> None:
+        """Initialize."""
+        self.addresses = addresses
+        self.days = days
+        self.bodies = bodies or {}
+        self.since = None
+        self.status = None
+        self.messages = {}
+        self.subjects = {}
+        self.routes = {}
+        self.ready = False
+        self._index = {}
+
+        # Sender address or name -> subject automaton and sensors per subject
+        subjects = {_sender_key(address): {None: set()} for address in addresses}
+        for sensor, (senders, sensor_subjects) in (queries or {}).items():
+            for sender in senders:
+                known = subjects.setdefault(_sender_key(sender), {None: set()})
+                for subject in sensor_subjects:
+                    subject = subject.lower() if subject is not None else None
+                    known.setdefault(subject, set()).add(sensor)
+        self._senders = {
+            sender: (SubjectMatcher([s for s in known if s is not None]), known)
+            for sender, known in subjects.items()
+        }
+        # Senders are found anywhere in the From header, as FROM searches do
+        self._sender_matcher = SubjectMatcher(list(self._senders))
+
+    def unchanged(self, status: Optional[dict]) -> bool:
+        """Check if the folder is the same as when the plan last ran."""
+        return (
+            self.ready
+            and status is not None
+            and status == self.status
+            and self.since == self._since()
+        )
+
+    def execute(
+        self, account: Type[imaplib.IMAP4_SSL], status: Optional[dict] = None
+    ) -> bool:
+        """Run the combined search against the selected folder.
+
+        Returns True when lookups can be answered from the plan
+        """
+        if (search := self._start(status)) is None:
+            return False
+
+        try:
+            (server_response, data) = account.uid("SEARCH", search)
+        except Exception as err:
+            _LOGGER.warning("Error running combined search: %s", str(err))
+            return self._reset()
+
+        if (mail_list := self._search_result(server_response, data)) is None:
+            return self._reset()
+
+        if mail_list:
+            try:
+                (server_response, data) = account.uid(
+                    "FETCH", _sequence_set(mail_list), PLAN_FETCH
+                )
+            except Exception as err:
+                _LOGGER.warning("Error fetching combined search headers: %s", err)
+                return self._reset()
+            if server_response != "OK":
+                return self._reset()
+            self._parse_headers(data)
+
+        return self._finish(status)
+
+    async def async_execute(
+        self, client: AsyncImapClient, status: Optional[dict] = None
+    ) -> bool:
+        """Run the combined search using the asyncio client.
+
+        Returns True when lookups can be answered from the plan
+        """
+        if (search := self._start(status)) is None:
+            return False
+
+        try:
+            (server_response, data) = await client.uid("SEARCH", search)
+            if (mail_list := self._search_result(server_response, data)) is None:
+                return self._reset()
+            if mail_list:
+                (server_response, data) = await client.uid(
+                    "FETCH", _sequence_set(mail_list), PLAN_FETCH
+                )
+                if server_response != "OK":
+                    return self._reset()
+                self._parse_headers(data)
+        except (OSError, EOFError, asyncio.TimeoutError, ImapError) as err:
+            _LOGGER.warning("Error running combined search: %s", str(err))
+            return self._reset()
+
+        return self._finish(status)
+
+    def _start(self, status: Optional[dict]) -> Optional[str]:
+        """Prepare a run, keeping the table when only new emails arrived.
+
+        Returns search query or None if there is nothing to search for
+        """
+        since = self._since()
+        uidnext = None
+        if self._can_merge(status, since):
+            uidnext = self.status["UIDNEXT"]
+        else:
+            self._clear()
+        self.since = since
+        self.status = None
+        self.ready = False
+        if not self.addresses:
+            return None
+
+        _, search = build_search(self.addresses, since.strftime("%d-%b-%Y"))
+        if uidnext is not None:
+            # Only look at emails that arrived since the last run
+            search = f"(UID {uidnext}:* {search})"
+        return search
+
+    @staticmethod
+    def _search_result(server_response: str, data: list) -> Optional[list]:
+        if server_response != "OK" or not data or not isinstance(data[0], bytes):
+            return None
+        mail_list = uid_list(data[0])
+        _LOGGER.debug("Combined search found %s emails", len(mail_list))
+        return mail_list
+
+    def _finish(self, status: Optional[dict]) -> bool:
+        self.status = status
+        self.ready = True
+        return True
+
+    def _reset(self) -> bool:
+        """Drop the message table after a failed run."""
+        self._clear()
+        return False
+
+    def _clear(self) -> None:
+        self.messages = {}
+        self.subjects = {}
+        self.routes = {}
+        self._index = {}
+
+    def _since(self) -> datetime.date:
+        return datetime.date.today() - datetime.timedelta(days=self.days)
+
+    def _can_merge(self, status: Optional[dict], since: datetime.date) -> bool:
+        """Check if new emails can be merged into the current table.
+
+        Deleted emails would stay in the table, so it is only kept when
+        every email since the last run is a new one.
+        """
+        if not self.ready or status is None or self.status is None:
+            return False
+        if since != self.since:
+            return False
+        if status["UIDVALIDITY"] != self.status["UIDVALIDITY"]:
+            return False
+        added = status["MESSAGES"] - self.status["MESSAGES"]
+        return added >= 0 and added == status["UIDNEXT"] - self.status["UIDNEXT"]
+
+    def _parse_headers(self, data: list) -> None:
+        """Build the message table from a header FETCH response."""
+        for index, response_part in enumerate(data):
+            if not isinstance(response_part, tuple):
+                continue
+            meta = response_part[0]
+            if (uid := _response_uid(data, index)) is None:
+                continue
+            received = _internal_date(meta)
+            # Some servers send INTERNALDATE after the header literal
+            if received is None and index + 1 < len(data):
+                trailer = data[index + 1]
+                if isinstance(trailer, bytes):
+                    received = _internal_date(trailer)
+
+            msg = email.message_from_bytes(response_part[1])
+            sender = _header_text(msg["from"]).lower()
+            self.subjects[uid] = _header_text(msg["subject"])
+            subject = self.subjects[uid].lower()
+            self.messages[uid] = (sender, subject, received)
+            self._route(uid, sender, subject)
+
+    def _route(self, uid: int, sender: str, subject: str) -> None:
+        """Index an email under every address and subject it answers."""
+        sensors = set()
+        for key in self._sender_matcher.search(sender):
+            (matcher, known) = self._senders[key]
+            sensors |= known[None]
+            self._index.setdefault((key, None), []).append(uid)
+            for found in matcher.search(subject):
+                sensors |= known[found]
+                self._index.setdefault((key, found), []).append(uid)
+        self.routes[uid] = frozenset(sensors)
+
+    def body_uids(self) -> list:
+        """Return the emails a sensor parser will download.
+
+        Emails only counted, or with the tracking number in the subject, are
+        left out.
+
+        Returns list of UIDs
+        """
+        uids = []
+        for uid, sensors in self.routes.items():
+            subject = self.messages[uid][1]
+            for sensor in sensors:
+                reader = self.bodies.get(sensor)
+                if reader is True or (reader and not reader.search(subject)):
+                    uids.append(uid)
+                    break
+        return uids
+
+    def lookup(
+        self, address: Union[str, list], date: str, subject: Optional[str] = None
+    ) -> Optional[tuple]:
+        """Answer an email_search call from the plan.
+
+        Returns email_search style tuple or None if the plan can't answer
+        """
+        if not self.ready:
+            return None
+
+        addresses = [address] if isinstance(address, str) else list(address)
+        if not addresses or any(addr not in self.addresses for addr in addresses):
+            return None
+
+        try:
+            since = datetime.datetime.strptime(date, "%d-%b-%Y").date()
+        except ValueError:
+            return None
+        if since < self.since:
+            return None
+
+        subject = subject.lower() if subject is not None else None
+        found = set()
+        for sender in addresses:
+            key = _sender_key(sender)
+            if subject in self._senders[key][1]:
+                uids = self._index.get((key, subject), [])
+            else:
+                # Subject not known up front, check the sender's emails
+                uids = [
+                    uid
+                    for uid in self._index.get((key, None), [])
+                    if subject in self.messages[uid][1]
+                ]
+            for uid in uids:
+                received = self.messages[uid][2]
+                if received is None or received >= since:
+                    found.add(uid)
+
+        return ("OK", [b" ".join(str(uid).encode() for uid in sorted(found))])
+
+
+class UidSet:
+    """Compact set of UIDs, a bitmap starting at the lowest UID added.
+
+    UIDs spread over more than UID_SET_SPAN values are kept in a plain set
+    instead, so a few far apart UIDs don't build a huge bitmap.
+    """
+
+    __slots__ = ("_base", "_bits", "_uids")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._base = None
+        self._bits = 0
+        self._uids = None
+
+    def add(self, uid: Any) -> None:
+        """Add a UID."""
+        uid = int(uid)
+        if self._uids is not None:
+            self._uids.add(uid)
+            return
+        if self._base is None:
+            self._base = uid
+        low = min(uid, self._base)
+        high = max(uid, self._base + self._bits.bit_length() - 1)
+        if high - low >= UID_SET_SPAN:
+            self._uids = set(self._bitmap())
+            self._uids.add(uid)
+            self._base = None
+            self._bits = 0
+            return
+        if uid < self._base:
+            self._bits <<= self._base - uid
+            self._base = uid
+        self._bits |= 1 << (uid - self._base)
+
+    def _bitmap(self) -> Iterator[int]:
+        """Yield the UIDs held in the bitmap."""
+        bits = self._bits
+        while bits:
+            lowest = bits & -bits
+            yield self._base + lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __contains__(self, uid: Any) -> bool:
+        """Check if a UID was added."""
+        if self._uids is not None:
+            return int(uid) in self._uids
+        if self._base is None or int(uid) < self._base:
+            return False
+        return bool(self._bits >> (int(uid) - self._base) & 1)
+
+    def __len__(self) -> int:
+        """Return the number of UIDs added."""
+        if self._uids is not None:
+            return len(self._uids)
+        return bin(self._bits).count("1")
+
+
+class MessageCache:
+    """On-disk cache of raw messages.
+
+    Messages are stored by folder, UIDVALIDITY and UID so each email is only
+    downloaded once. The least recently used messages are removed once the
+    cache grows past max_size bytes.
+
+    The UIDs a parser found nothing in are kept in memory for the day, so
+    they aren't fetched and parsed again on the next refresh.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Initialize."""
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self._index = None
+        self._lock = threading.Lock()
+        self._rejected = {}
+        self._rejected_version = None
+
+    def get(self, folder: str, uidvalidity: int, uid: int) -> Optional[bytes]:
+        """Return the cached message or None."""
+        name = self._name(folder, uidvalidity, uid)
+        with self._lock:
+            index = self._load()
+            if name not in index:
+                return None
+            try:
+                with open(os.path.join(self.path, name), "rb") as file:
+                    raw = file.read()
+            except OSError as err:
+                _LOGGER.debug("Error reading cached email: %s", str(err))
+                self.size -= index.pop(name)
+                return None
+            index.move_to_end(name)
+            return raw
+
+    def has(self, folder: str, uidvalidity: int, uid: int) -> bool:
+        """Check if a message is cached without reading it."""
+        with self._lock:
+            return self._name(folder, uidvalidity, uid) in self._load()
+
+    def put(self, folder: str, uidvalidity: int, uid: int, raw: bytes) -> None:
+        """Store a message and evict the oldest ones over the size budget."""
+        if len(raw) > self.max_size:
+            return
+        name = self._name(folder, uidvalidity, uid)
+        with self._lock:
+            index = self._load()
+            try:
+                with open(os.path.join(self.path, name), "wb") as file:
+                    file.write(raw)
+            except OSError as err:
+                _LOGGER.debug("Error caching email: %s", str(err))
+                return
+            self.size += len(raw) - index.pop(name, 0)
+            index[name] = len(raw)
+
+            while self.size > self.max_size:
+                oldest, size = index.popitem(last=False)
+                self.size -= size
+                try:
+                    os.remove(os.path.join(self.path, oldest))
+                except OSError as err:
+                    _LOGGER.debug("Error removing cached email: %s", str(err))
+
+    def rejected(self, folder: str, uidvalidity: int, parser: tuple) -> UidSet:
+        """Return the UIDs of a folder a parser found nothing in today.
+
+        parser names the parser and the patterns it looks for, so changed
+        SENSOR_DATA patterns start a new set. All sets are dropped on the
+        next day or when PARSER_VERSION changes.
+        """
+        version = (datetime.date.today(), PARSER_VERSION)
+        with self._lock:
+            if self._rejected_version != version:
+                self._rejected = {}
+                self._rejected_version = version
+            return self._rejected.setdefault((folder, uidvalidity, parser), UidSet())
+
+    def _load(self) -> OrderedDict:
+        """Read the cache index from disk on first use, oldest first."""
+        if self._index is None:
+            self._index = OrderedDict()
+            self.size = 0
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                entries = [
+                    entry
+                    for entry in os.scandir(self.path)
+                    if entry.name.endswith(".eml")
+                ]
+            except OSError as err:
+                _LOGGER.error("Error opening email cache: %s", str(err))
+                entries = []
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self._index[entry.name] = entry.stat().st_size
+                self.size += entry.stat().st_size
+        return self._index
+
+    @staticmethod
+    def _name(folder: str, uidvalidity: int, uid: int) -> str:
+        folder_hash = hashlib.sha1(folder.encode()).hexdigest()[:12]  # nosec
+        return f"{folder_hash}_{uidvalidity}_{uid}.eml"
+
+
+def _cache_key(account: Type[imaplib.IMAP4_SSL], uid: Any) -> Optional[tuple]:
+    """Return the (folder, UIDVALIDITY, UID) of a message if known."""
+    folder = getattr(account, "folder", None)
+    uidvalidity = getattr(account, "uidvalidity", None)
+    if folder is None or uidvalidity is None:
+        return None
+    return (folder, uidvalidity, int(uid))
+
+
+def _rejected(account: Type[imaplib.IMAP4_SSL], parser: tuple) -> Optional[UidSet]:
+    """Return the UIDs parser rejected in the selected folder, if known."""
+    cache = getattr(account, "message_cache", None)
+    folder = getattr(account, "folder", None)
+    uidvalidity = getattr(account, "uidvalidity", None)
+    if cache is None or folder is None or uidvalidity is None:
+        return None
+    return cache.rejected(folder, uidvalidity, parser)
+
+
+def _skip_rejected(ids: list, rejected: Optional[UidSet]) -> list:
+    """Leave out the UIDs a parser already found nothing in.
+
+    Returns list of UIDs to fetch
+    """
+    if not rejected:
+        return ids
+    kept = [i for i in ids if i not in rejected]
+    if len(kept) < len(ids):
+        _LOGGER.debug("Skipping %s emails without results", len(ids) - len(kept))
+    return kept
+
+
+def uid_list(data: Optional[bytes]) -> List[int]:
+    """Read the UIDs of a SEARCH response.
+
+    Returns list of UIDs
+    """
+    if not data:
+        return []
+    return [int(uid) for uid in data.split() if uid.isdigit()]
+
+
+def email_fetch(
+    account: Type[imaplib.IMAP4_SSL], num: Any, parts: str = "(RFC822)"
+) -> tuple:
+    """Download specified email for parsing.
+
+    num is a UID or a UID set.
+
+    Returns tuple
+    """
+    if isinstance(num, int):
+        num = str(num)
+    cache = getattr(account, "message_cache", None)
+    key = None
+    if cache is not None and parts == "(RFC822)" and num.isdigit():
+        key = _cache_key(account, num)
+    if key is not None and (raw := cache.get(*key)) is not None:
+        _LOGGER.debug("Using cached email: %s", num)
+        return ("OK", [(_cached_meta(num, raw), raw), b")"])
+
+    try:
+        value = account.uid("FETCH", num, parts)
+    except Exception as err:
+        _LOGGER.error("Error fetching emails: %s", str(err))
+        value = "BAD", err.args[0]
+
+    if key is not None and value[0] == "OK":
+        for response_part in value[1]:
+            if isinstance(response_part, tuple):
+                cache.put(*key, response_part[1])
+                break
+
+    return value
+
+
+def _sequence_set(ids: list) -> str:
+    """Build a compact IMAP sequence set, e.g. 1,4,9:12.
+
+    Returns sequence set as string
+    """
+    nums = sorted({int(i) for i in ids})
+    ranges = []
+    for num in nums:
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1][1] = num
+        else:
+            ranges.append([num, num])
+    return ",".join(
+        str(first) if first == last else f"{first}:{last}" for first, last in ranges
+    )
+
+
+def email_fetch_batch(
+    account: Type[imaplib.IMAP4_SSL], ids: list, parts: str = "(RFC822)"
+) -> dict:
+    """Download several emails with a single FETCH.
+
+    Returns dict of message id to response parts, in the order of ids
+    """
+    if not ids:
+        return {}
+
+    cache = getattr(account, "message_cache", None)
+    fetched = {}
+    missing = []
+    for i in ids:
+        if parts == "(RFC822)" and (local := _local_fetch(account, i)) is not None:
+            fetched[i] = local
+        else:
+            missing.append(i)
+
+    if missing:
+        _LOGGER.debug("Fetching %s emails", len(missing))
+        (server_response, data) = email_fetch(account, _sequence_set(missing), parts)
+        if server_response == "OK":
+            fetched.update(_split_fetch(missing, data))
+
+        if cache is not None and parts == "(RFC822)":
+            for i in missing:
+                key = _cache_key(account, i)
+                if key is None or i not in fetched:
+                    continue
+                for response_part in fetched[i]:
+                    if isinstance(response_part, tuple):
+                        cache.put(*key, response_part[1])
+                        break
+
+    return {i: fetched[i] for i in ids if i in fetched}
+
+
+def _local_fetch(account: Type[imaplib.IMAP4_SSL], num: Any) -> Optional[list]:
+    """Return the (RFC822) response of an email already downloaded.
+
+    Returns response parts or None if the email has to be fetched
+    """
+    prefetched = getattr(account, "prefetched", None) or {}
+    if int(num) in prefetched:
+        return prefetched[int(num)]
+    cache = getattr(account, "message_cache", None)
+    key = _cache_key(account, num) if cache is not None else None
+    if key is not None and (raw := cache.get(*key)) is not None:
+        return [(_cached_meta(num, raw), raw), b")"]
+    return None
+
+
+def _cached_meta(uid: Any, raw: bytes) -> bytes:
+    """Build the FETCH response line of a message read from the cache."""
+    return f"{int(uid)} (UID {int(uid)} RFC822 {{{len(raw)}}}".encode()
+
+
+class _TextMessage(Message):
+    """Message part that only keeps the payload sensors can read."""
+
+    def set_payload(self, payload: Any, charset: Any = None) -> None:
+        """Drop the payload of binary parts, keeping their headers."""
+        if isinstance(payload, str) and self.get_content_maintype() not in (
+            "text",
+            "multipart",
+            "message",
+        ):
+            payload = ""
+        super().set_payload(payload, charset)
+
+
+def parse_text_parts(raw: bytes) -> Message:
+    """Parse an email without keeping its images and attachments.
+
+    The MIME boundaries are scanned first and the bodies of binary parts
+    are never handed to the parser, so it doesn't split them into lines.
+    Anything the scan misses is dropped once parsed, the tree only holds
+    the headers and the text parts.
+
+    Returns parsed message
+    """
+    parser = BytesFeedParser(_factory=_TextMessage)
+    start = 0
+    for skip_start, skip_end in _binary_bodies(raw, 0, len(raw)):
+        parser.feed(raw[start:skip_start])
+        start = skip_end
+    parser.feed(raw[start:])
+    return parser.close()
+
+
+def _binary_bodies(raw: bytes, start: int, end: int) -> list:
+    """Find the bodies of the binary parts in raw[start:end].
+
+    Returns list of (start, end) offsets, in order
+    """
+    if (found := _part_type(raw, start, end)) is None:
+        return []
+    (maintype, content_type, body) = found
+    if maintype == b"multipart":
+        return _multipart_bodies(raw, content_type, body, end)
+    if maintype in (b"text", b"message") or body >= end:
+        return []
+    return [(body, end)]
+
+
+def _part_type(raw: bytes, start: int, end: int) -> Optional[tuple]:
+    """Read the Content-Type of the part in raw[start:end].
+
+    Returns tuple of main type, Content-Type header and body offset, or
+    None for parts without one, which default to text/plain
+    """
+    if raw.startswith((b"\r\n", b"\n"), start):
+        return None
+    if (found := RE_HEADER_END.search(raw, start, end)) is None:
+        return None
+    content_type = RE_CONTENT_TYPE.search(raw[start : found.end()])
+    if content_type is None:
+        return None
+    maintype = content_type.group(1).split(b"/")[0].lower()
+    return maintype, content_type.group(0), found.end()
+
+
+def _multipart_bodies(raw: bytes, content_type: bytes, body: int, end: int) -> list:
+    """Find the bodies of the binary parts inside a multipart body.
+
+    Returns list of (start, end) offsets, in order
+    """
+    if (boundary := RE_MIME_BOUNDARY.search(content_type)) is None:
+        return []
+
+    # Part bodies end at the line break before the next delimiter line
+    delimiter = re.compile(
+        rb"(?:^|\r?\n)--"
+        + re.escape(boundary.group(1) or boundary.group(2))
+        + rb"(--)?[ \t]*(?=\r?\n|$)",
+        re.MULTILINE,
+    )
+    skipped = []
+    part = None
+    for match in delimiter.finditer(raw, body, end):
+        if part is not None:
+            skipped.extend(_binary_bodies(raw, part, match.start()))
+        if match.group(1):
+            # Closing delimiter
+            return skipped
+        if (line_end := raw.find(b"\n", match.end(), end)) == -1:
+            return skipped
+        part = line_end + 1
+    if part is not None:
+        # No closing delimiter, the last part runs to the end
+        skipped.extend(_binary_bodies(raw, part, end))
+    return skipped
+
+
+class _HtmlText(HTMLParser):
+    """Collect the text of an HTML document, leaving out styles and scripts."""
+
+    BLOCKS = frozenset(
+        {"br", "div", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "p", "table"}
+        | {"td", "th", "tr"}
+    )
+    SKIPPED = frozenset({"script", "style"})
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self._skip = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        """Start skipping styles and scripts, break lines on blocks."""
+        if tag in self.SKIPPED:
+            self._skip += 1
+        elif tag in self.BLOCKS:
+            self.text.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        """Stop skipping styles and scripts, break lines on blocks."""
+        if tag in self.SKIPPED:
+            self._skip = max(self._skip - 1, 0)
+        elif tag in self.BLOCKS:
+            self.text.append("\n")
+
+    def handle_data(self, data: str) -> None:
+        """Keep text outside styles and scripts."""
+        if not self._skip:
+            self.text.append(RE_SPACE.sub(" ", data))
+
+
+def html_to_text(html: str, region: Optional[tuple] = None) -> str:
+    """Extract the text of an HTML email part.
+
+    Tags, styles and scripts are left out and the whitespace of each line
+    is collapsed, so patterns only walk what the email shows. region is an
+    optional (start, end) pair the result is limited to, see text_region.
+
+    Returns text, or the HTML unchanged if it can't be parsed
+    """
+    parser = _HtmlText()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as err:
+        _LOGGER.debug("Problem reading HTML email: %s", str(err))
+        return html
+    lines = "".join(parser.text).split("\n")
+    text = "\n".join(" ".join(line.split()) for line in lines if line.strip())
+    return text if region is None else text_region(text, *region)
+
+
+def text_region(text: str, start: Optional[str], end: Optional[str]) -> str:
+    """Limit a text to the part from the first start to the following end.
+
+    The part keeps start and leaves out end. A missing start keeps the text
+    from its beginning, a missing end keeps it to its end.
+
+    Returns text
+    """
+    offset = 0
+    if start and (index := text.find(start)) != -1:
+        text = text[index:]
+        offset = len(start)
+    if end and (index := text.find(end, offset)) != -1:
+        text = text[:index]
+    return text
+
+
+class MessageView:
+    """A downloaded email, parsed once for every sensor reading it.
+
+    The message, its subject and its text parts are only decoded when a
+    sensor first asks for them, then kept for the others.
+    """
+
+    def __init__(self, uid: int, data: list) -> None:
+        """Initialize from the (RFC822) response parts of the email."""
+        self.uid = uid
+        # Released once the message is parsed
+        self.raw = next((part[1] for part in data if isinstance(part, tuple)), None)
+        self._cache = {}
+
+    def _cached(self, name: str, build: Callable) -> Any:
+        """Return a decoded value, building it on first use."""
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def message(self) -> Optional[Message]:
+        """Parsed message without binary parts, None if the response had no body."""
+        return self._cached("message", self._message)
+
+    @property
+    def subject(self) -> str:
+        """Decoded subject."""
+        return self._cached(
+            "subject",
+            lambda: ""
+            if self.message is None
+            else _header_text(self.message["subject"]),
+        )
+
+    @property
+    def texts(self) -> list:
+        """Text of the text/html and text/plain parts, in message order.
+
+        HTML parts are read as the text they show.
+        """
+        return self._cached(
+            "texts",
+            lambda: [
+                html_to_text(text) if content == "text/html" else text
+                for content, text in self._parts()
+            ],
+        )
+
+    @property
+    def html(self) -> list:
+        """Decoded text/html parts, in message order."""
+        return self._cached(
+            "html",
+            lambda: [text for content, text in self._parts() if content == "text/html"],
+        )
+
+    @property
+    def first_part(self) -> Optional[str]:
+        """Quoted-printable decoded first part, None if it can't be decoded."""
+        return self._cached("first_part", self._first_part)
+
+    @property
+    def tracking(self) -> list:
+        """Tracking numbers of every shipper, one scan per text part."""
+        return self._cached(
+            "tracking", lambda: [TRACKING_SCANNER.scan(text) for text in self.texts]
+        )
+
+    def _parts(self) -> list:
+        """Decode the text parts once for texts and html."""
+        if "parts" not in self._cache:
+            parts = []
+            if self.message is not None:
+                for part in self.message.walk():
+                    _LOGGER.debug("Content type: %s", part.get_content_type())
+                    if part.get_content_type() not in ["text/html", "text/plain"]:
+                        continue
+                    email_msg = part.get_payload(decode=True)
+                    parts.append(
+                        (part.get_content_type(), email_msg.decode("utf-8", "ignore"))
+                    )
+            self._cache["parts"] = parts
+        return self._cache["parts"]
+
+    def _message(self) -> Optional[Message]:
+        raw, self.raw = self.raw, None
+        return None if raw is None else parse_text_parts(raw)
+
+    def _first_part(self) -> Optional[str]:
+        try:
+            email_msg = quopri.decodestring(str(self.message.get_payload(0)))
+        except Exception as err:
+            _LOGGER.debug("Problem decoding email message: %s", str(err))
+            return None
+        return email_msg.decode("utf-8", "ignore")
+
 
+def fetch_messages(account: Type[imaplib.IMAP4_SSL], ids: list) -> dict:
+    """Get the emails of ids as message views.
 
-def login(
-    host: str, port: int, user: str, pwd: str
-) -> Union[bool, Type[imaplib.IMAP4_SSL]]:
-    """Login to IMAP server.
+    During an update the views are kept on the account, so an email is
+    downloaded and parsed once however many sensors read it.
 
-    Returns account object
+    Returns dict of message id to MessageView, in the order of ids
     """
-    # Catch invalid mail server / host names
-    try:
-        account = imaplib.IMAP4_SSL(host, port)
+    table = getattr(account, "messages", None)
+    if table is None:
+        table = {}
+    missing = [i for i in ids if i not in table]
+    for i, data in email_fetch_batch(account, missing).items():
+        table[i] = MessageView(i, data)
+    return {i: table[i] for i in ids if i in table}
 
-    except Exception as err:
-        _LOGGER.error("Network error while connecting to server: %s", str(err))
-        return False
 
-    # If login fails give error message
-    try:
-        account.login(user, pwd)
-    except Exception as err:
-        _LOGGER.error("Error logging into IMAP Server: %s", str(err))
-        return False
+def _shards(ids: list, count: int) -> list:
+    """Split ids into at most count contiguous runs of similar size.
 
-    return account
+    Returns list of lists of ids
+    """
+    size = -(-len(ids) // count) if count else len(ids)
+    return [ids[start : start + size] for start in range(0, len(ids), size or 1)]
 
 
-def selectfolder(account: Type[imaplib.IMAP4_SSL], folder: str) -> bool:
-    """Select folder inside the mailbox."""
-    try:
-        account.list()
-    except Exception as err:
-        _LOGGER.error("Error listing folders: %s", str(err))
-        return False
-    try:
-        account.select(folder)
-    except Exception as err:
-        _LOGGER.error("Error selecting folder: %s", str(err))
-        return False
-    return True
+def _fetch_shard(session: Type[imaplib.IMAP4_SSL], shard: list) -> dict:
+    """Download one shard of emails on its own session.
 
+    Returns dict of message id to response parts
+    """
+    (server_response, data) = email_fetch(session, _sequence_set(shard), PREFETCH_PARTS)
+    if server_response != "OK":
+        return {}
+    return _split_fetch(shard, data)
 
-def get_formatted_date() -> str:
-    """Return today in specific format.
 
-    Returns current timestamp as string
+def prefetch_emails(
+    account: Type[imaplib.IMAP4_SSL], sessions: list, ids: list
+) -> None:
+    """Download emails in parallel before the sensors ask for them.
+
+    The emails not in the message cache are split in contiguous shards,
+    one per session including the account itself, and fetched at the same
+    time. The responses are merged in shard order, so the sensors see the
+    same data however the downloads interleave, and kept on the account
+    for email_fetch_batch.
     """
-    today = datetime.datetime.today().strftime("%d-%b-%Y")
-    #
-    # for testing
-    # today = "11-Jan-2021"
-    #
-    return today
+    prefetched = {}
+    account.prefetched = prefetched
 
+    missing = _prefetch_missing(account, ids)
+    if not sessions or not missing:
+        return
 
-def update_time() -> Any:
-    """Get update time.
+    shards = _shards(missing, len(sessions) + 1)
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        results = list(executor.map(_fetch_shard, [account, *sessions], shards))
 
-    Returns current timestamp as string
+    _keep_prefetched(account, results)
+    _LOGGER.debug("Prefetched %s emails over %s sessions", len(prefetched), len(shards))
+
+
+async def async_prefetch_emails(
+    hass: HomeAssistant, account: ImapBridge, clients: list, ids: list
+) -> None:
+    """Download emails on the event loop before the sensors ask for them.
+
+    Works like prefetch_emails with one shard per asyncio client, so the
+    sensors running in the executor don't wait on these downloads. The
+    message cache is read and written in the executor.
     """
-    # updated = datetime.datetime.now().strftime("%b-%d-%Y %I:%M %p")
-    # updated = datetime.datetime.now(timezone.utc).isoformat(timespec="minutes")
-    updated = datetime.datetime.now(timezone.utc)
+    account.prefetched = {}
+    missing = await hass.async_add_executor_job(_prefetch_missing, account, ids)
+    if not missing:
+        return
 
-    return updated
+    shards = _shards(missing, len(clients))
+    replies = await asyncio.gather(
+        *[
+            client.uid("FETCH", _sequence_set(shard), PREFETCH_PARTS)
+            for client, shard in zip(clients, shards)
+        ],
+        return_exceptions=True,
+    )
+    results = []
+    for shard, reply in zip(shards, replies):
+        if isinstance(reply, Exception):
+            _LOGGER.debug("Error prefetching emails: %s", str(reply))
+        elif reply[0] == "OK":
+            results.append(_split_fetch(shard, reply[1]))
+    await hass.async_add_executor_job(_keep_prefetched, account, results)
+    _LOGGER.debug(
+        "Prefetched %s emails over %s sessions", len(account.prefetched), len(shards)
+    )
 
 
-def build_search(address: list, date: str, subject: str = None) -> tuple:
-    """Build IMAP search query.
+def _prefetch_missing(account: Type[imaplib.IMAP4_SSL], ids: list) -> list:
+    """Return the ids not in the message cache, in UID order."""
+    cache = getattr(account, "message_cache", None)
+    missing = []
+    for i in sorted(ids, key=int):
+        key = _cache_key(account, i) if cache is not None else None
+        if key is None or not cache.has(*key):
+            missing.append(i)
+    return missing
+
+
+def _keep_prefetched(account: Type[imaplib.IMAP4_SSL], results: list) -> None:
+    """Keep downloaded shards on the account and in the message cache."""
+    cache = getattr(account, "message_cache", None)
+    for result in results:
+        for i, response in result.items():
+            account.prefetched[int(i)] = response
+            key = _cache_key(account, i) if cache is not None else None
+            if key is None:
+                continue
+            for response_part in response:
+                if isinstance(response_part, tuple):
+                    cache.put(*key, response_part[1])
+                    break
 
-    Return tuple of utf8 flag and search query.
+
+def _split_fetch(ids: list, data: list) -> dict:
+    """Split a multi-message UID FETCH response by UID.
+
+    Responses without one of the requested UIDs are dropped, they can't
+    be told apart safely.
+
+    Returns dict of UID to response parts
     """
-    the_date = f"SINCE {date}"
-    imap_search = None
-    utf8_flag = False
-    prefix_list = None
-    email_list = None
+    by_uid = {int(i): i for i in ids}
+    result = {}
+    current = None
+    for position, response_part in enumerate(data):
+        if isinstance(response_part, tuple):
+            current = by_uid.get(_response_uid(data, position))
+            if current is not None:
+                result.setdefault(current, []).append(response_part)
+        elif current is not None:
+            result[current].append(response_part)
+    return result
 
-    if isinstance(address, list):
-        if len(address) == 1:
-            email_list = address[0]
-        else:
-            email_list = '" FROM "'.join(address)
-            prefix_list = " ".join(["OR"] * (len(address) - 1))
-    else:
-        email_list = address
 
-    _LOGGER.debug("DEBUG subject: %s", subject)
+def _response_uid(data: list, index: int) -> Optional[int]:
+    """Find the UID of the message in a FETCH response part.
 
-    if subject is not None:
-        if not subject.isascii():
-            utf8_flag = True
-            # if prefix_list is not None:
-            #     imap_search = f"CHARSET UTF-8 {prefix_list}"
-            #     imap_search = f'{imap_search} FROM "{email_list} {the_date} SUBJECT'
-            # else:
-            #     imap_search = (
-            #         f"CHARSET UTF-8 FROM {email_list} {the_date} SUBJECT"
-            #     )
-            imap_search = f"{the_date} SUBJECT"
-        else:
-            if prefix_list is not None:
-                imap_search = f'({prefix_list} FROM "{email_list}" SUBJECT "{subject}" {the_date})'
-            else:
-                imap_search = f'(FROM "{email_list}" SUBJECT "{subject}" {the_date})'
-    else:
-        if prefix_list is not None:
-            imap_search = f'({prefix_list} FROM "{email_list}" {the_date})'
-        else:
-            imap_search = f'(FROM "{email_list}" {the_date})'
+    The UID item may follow the literal, then it is in the next part.
 
-    _LOGGER.debug("DEBUG imap_search: %s", imap_search)
+    Returns UID or None
+    """
+    if (found := RE_UID.search(data[index][0])) is None and index + 1 < len(data):
+        if isinstance(data[index + 1], bytes):
+            found = RE_UID.search(data[index + 1])
+    return int(found.group(1)) if found is not None else None
 
-    return (utf8_flag, imap_search)
 
+def _mail_images(account: Type[imaplib.IMAP4_SSL], ids: list) -> Any:
+    """Get the mail piece images of Informed Delivery emails.
 
-def email_search(
-    account: Type[imaplib.IMAP4_SSL], address: list, date: str, subject: str = None
-) -> tuple:
-    """Search emails with from, subject, senton date.
+    Emails already downloaded are read in full. For the others only the
+    BODYSTRUCTURE is fetched, then the image sections that aren't USPS
+    announcements, plus the text of the last email to look for the
+    placeholder image. Servers without BODYSTRUCTURE get a full download.
 
-    Returns a tuple
+    Yields tuple: list of (filename, image bytes), email text
     """
-    utf8_flag, search = build_search(address, date, subject)
+    remote = [i for i in ids if _local_fetch(account, i) is None]
+    structures = _fetch_structures(account, remote)
+    full = [i for i in ids if i not in structures]
+    fetched = email_fetch_batch(account, full) if full else {}
+
+    for num in ids:
+        if num in structures:
+            yield _fetch_sections(account, num, structures[num], num == ids[-1])
+            continue
+        if num not in fetched:
+            continue
+        msg = email.message_from_string(fetched[num][0][1].decode("utf-8"))
 
-    if utf8_flag:
-        subject = subject.encode("utf-8")
-        account.literal = subject
-        try:
-            value = account.uid("SEARCH", "CHARSET", "UTF-8", search)
-        except Exception as err:
-            _LOGGER.warning(
-                "Error searching emails with unicode characters: %s", str(err)
-            )
-            value = "BAD", err.args[0]
+        # walking through the email parts to find images
+        attachments = []
+        for part in msg.walk():
+            if part.get_content_maintype() == "multipart":
+                continue
+            if part.get("Content-Disposition") is None:
+                continue
+            filename = part.get_filename()
+            if filename is not None and _usps_ignored(filename):
+                continue
+            attachments.append((filename, part.get_payload(decode=True)))
+        yield attachments, str(msg)
+
+
+def _usps_ignored(filename: str) -> bool:
+    """Check if an attachment is a USPS announcement image."""
+    return any(ignore in filename for ignore in USPS_IGNORE_IMAGES)
+
+
+def _fetch_structures(account: Type[imaplib.IMAP4_SSL], ids: list) -> dict:
+    """Fetch the BODYSTRUCTURE of several emails.
+
+    Returns dict of message id to list of body parts, missing ids couldn't
+    be read
+    """
+    if not ids:
+        return {}
+    try:
+        (server_response, data) = account.uid(
+            "FETCH", _sequence_set(ids), "(UID BODYSTRUCTURE)"
+        )
+    except Exception as err:
+        _LOGGER.debug("Error fetching email structure: %s", str(err))
+        return {}
+    if server_response != "OK":
+        return {}
+
+    try:
+        responses = _parse_fetch_items(data)
+    except (IndexError, ValueError) as err:
+        _LOGGER.debug("Unable to parse email structure: %s", str(err))
+        return {}
+
+    by_uid = {int(i): i for i in ids}
+    structures = {}
+    for uid, items in responses.items():
+        structure = items.get("BODYSTRUCTURE")
+        if uid in by_uid and isinstance(structure, list):
+            structures[by_uid[uid]] = _body_parts(structure)
+    return structures
+
+
+def _parse_fetch_items(data: list) -> dict:
+    """Parse FETCH responses into UID and item dicts.
+
+    Responses without a UID item are keyed by their message number.
+
+    Returns dict of UID to dict of item name to value
+    """
+    tokens = []
+    for response_part in data:
+        if isinstance(response_part, tuple):
+            tokens.extend(_sexp_tokens(RE_LITERAL_SIZE.sub(b"", response_part[0])))
+            tokens.append(("literal", response_part[1]))
+        elif isinstance(response_part, bytes):
+            tokens.extend(_sexp_tokens(response_part))
+
+    responses = {}
+    pos = 0
+    while pos < len(tokens):
+        num = int(tokens[pos][1])
+        items, pos = _parse_sexp(tokens, pos + 1)
+        if not isinstance(items, list):
+            raise ValueError("FETCH response without item list")
+        fields = {
+            str(items[index]).upper(): items[index + 1]
+            for index in range(0, len(items) - 1, 2)
+        }
+        uid = fields.get("UID")
+        responses[int(uid) if uid and str(uid).isdigit() else num] = fields
+    return responses
+
+
+def _sexp_tokens(text: bytes) -> list:
+    """Split IMAP response text into tokens."""
+    return [("token", token) for token in RE_SEXP_TOKEN.findall(text)]
+
+
+def _parse_sexp(tokens: list, pos: int) -> tuple:
+    """Parse one value, parenthesized lists become python lists.
+
+    Returns tuple: value, position after the value
+    """
+    kind, token = tokens[pos]
+    if kind == "literal":
+        return token.decode(errors="ignore"), pos + 1
+    if token == b"(":
+        value = []
+        pos += 1
+        while tokens[pos] != ("token", b")"):
+            item, pos = _parse_sexp(tokens, pos)
+            value.append(item)
+        return value, pos + 1
+    if token == b")":
+        raise ValueError("Unexpected end of list")
+    if token.startswith(b'"'):
+        return re.sub(r"\\(.)", r"\1", token[1:-1].decode(errors="ignore")), pos + 1
+    if token.upper() == b"NIL":
+        return None, pos + 1
+    return token.decode(errors="ignore"), pos + 1
+
+
+def _body_parts(structure: list, prefix: str = "") -> list:
+    """Flatten a BODYSTRUCTURE into its leaf parts.
+
+    Returns list of dicts with section, type, params, encoding and filename
+    """
+    if isinstance(structure[0], list):
+        parts = []
+        for index, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(_body_parts(child, f"{prefix}{index}."))
+        return parts
+
+    maintype = str(structure[0]).lower()
+    subtype = str(structure[1]).lower()
+    params = _sexp_params(structure[2])
+    if maintype == "text":
+        disposition_index = 9
+    elif (maintype, subtype) == ("message", "rfc822"):
+        disposition_index = 11
     else:
-        try:
-            value = account.search(None, search)
-        except Exception as err:
-            _LOGGER.error("Error searching emails: %s", str(err))
-            value = "BAD", err.args[0]
+        disposition_index = 8
 
-    _LOGGER.debug("DEBUG email_search value: %s", value)
+    disposition = None
+    filename = None
+    if len(structure) > disposition_index and isinstance(
+        structure[disposition_index], list
+    ):
+        disposition = str(structure[disposition_index][0]).lower()
+        filename = _sexp_params(structure[disposition_index][1]).get("filename")
+    if filename is None:
+        filename = params.get("name")
+
+    return [
+        {
+            "section": prefix.rstrip(".") or "1",
+            "type": f"{maintype}/{subtype}",
+            "params": params,
+            "encoding": str(structure[5]).lower(),
+            "disposition": disposition,
+            "filename": _header_text(filename) if filename is not None else None,
+        }
+    ]
+
+
+def _sexp_params(value: Any) -> dict:
+    """Turn a ("name" "value" ...) parameter list into a dict."""
+    if not isinstance(value, list):
+        return {}
+    return {
+        str(value[index]).lower(): value[index + 1]
+        for index in range(0, len(value) - 1, 2)
+    }
 
-    (check, new_value) = value
-    if new_value[0] is None:
-        _LOGGER.warning("DEBUG email_search value was invalid: None")
-        value = (check, [b""])
 
-    return value
+def _fetch_sections(
+    account: Type[imaplib.IMAP4_SSL], num: Any, parts: list, with_text: bool
+) -> tuple:
+    """Download the image sections of an Informed Delivery email.
+
+    Returns tuple: list of (filename, image bytes), email text
+    """
+    images = [
+        part
+        for part in parts
+        if part["disposition"] is not None
+        and part["filename"] is not None
+        and not _usps_ignored(part["filename"])
+    ]
+    texts = []
+    if with_text:
+        texts = [part for part in parts if part["type"].startswith("text/")]
+    if not images and not texts:
+        return [], ""
+
+    # RFC 3516 lets the server undo the transfer encoding of the images
+    binary = bool(images) and has_capability(account, "BINARY")
+    (server_response, data) = _fetch_section_items(account, num, images, texts, binary)
+    if server_response != "OK" and binary:
+        # Servers refuse BINARY for encodings they don't know, ask for the raw body
+        binary = False
+        (server_response, data) = _fetch_section_items(
+            account, num, images, texts, binary
+        )
+    if server_response != "OK":
+        return [], ""
+
+    sections = {}
+    for response_part in data:
+        if isinstance(response_part, tuple):
+            if section := RE_BODY_SECTION.search(response_part[0]):
+                sections[section.group(2).decode()] = response_part[1]
+
+    attachments = [
+        (
+            part["filename"],
+            sections[part["section"]]
+            if binary
+            else _decode_section(part, sections[part["section"]]),
+        )
+        for part in images
+        if part["section"] in sections
+    ]
+    text = "\n".join(
+        _decode_section(part, sections[part["section"]]).decode(
+            part["params"].get("charset") or "utf-8", errors="ignore"
+        )
+        for part in texts
+        if part["section"] in sections
+    )
+    return attachments, text
 
 
-def email_fetch(
-    account: Type[imaplib.IMAP4_SSL], num: int, parts: str = "(RFC822)"
+def _fetch_section_items(
+    account: Type[imaplib.IMAP4_SSL],
+    num: Any,
+    images: list,
+    texts: list,
+    binary: bool,
 ) -> tuple:
-    """Download specified email for parsing.
+    """Fetch the image and text sections of an email in one command.
 
-    Returns tuple
+    Returns tuple: server response, fetch data
     """
+    image_item = "BINARY.PEEK" if binary else "BODY.PEEK"
+    items = " ".join(
+        [f"{image_item}[{part['section']}]" for part in images]
+        + [f"BODY.PEEK[{part['section']}]" for part in texts]
+    )
     try:
-        value = account.fetch(num, parts)
+        return account.uid("FETCH", str(int(num)), f"({items})")
     except Exception as err:
         _LOGGER.error("Error fetching emails: %s", str(err))
-        value = "BAD", err.args[0]
+        return "BAD", []
 
-    return value
+
+def _decode_section(part: dict, payload: bytes) -> bytes:
+    """Undo the transfer encoding of a body section."""
+    try:
+        if part["encoding"] == "base64":
+            return binascii.a2b_base64(payload)
+        if part["encoding"] == "quoted-printable":
+            return quopri.decodestring(payload)
+    except ValueError as err:
+        _LOGGER.debug("Error decoding email section: %s", str(err))
+    return payload
 
 
 def get_mails(
@@ -597,9 +2815,9 @@ def get_mails(
 
     (server_response, data) = email_search(
         account,
-        SENSOR_DATA[ATTR_USPS_MAIL][ATTR_EMAIL],
+        list(SHIPPER_SENSORS[ATTR_USPS_MAIL].senders),
         get_formatted_date(),
-        SENSOR_DATA[ATTR_USPS_MAIL][ATTR_SUBJECT][0],
+        SHIPPER_SENSORS[ATTR_USPS_MAIL].subjects[0],
     )
 
     # Bail out on error
@@ -623,28 +2841,16 @@ def get_mails(
 
     if server_response == "OK":
         _LOGGER.debug("Informed Delivery email found processing...")
-        for num in data[0].split():
-            msg = email.message_from_string(
-                email_fetch(account, num, "(RFC822)")[1][0][1].decode("utf-8")
-            )
-
-            # walking through the email parts to find images
-            for part in msg.walk():
-                if part.get_content_maintype() == "multipart":
-                    continue
-                if part.get("Content-Disposition") is None:
-                    continue
-
+        for attachments, msg in _mail_images(account, uid_list(data[0])):
+            for filename, payload in attachments:
                 _LOGGER.debug("Extracting image from email")
 
                 # Log error message if we are unable to open the filepath for
                 # some reason
                 try:
-                    with open(
-                        image_output_path + part.get_filename(), "wb"
-                    ) as the_file:
-                        the_file.write(part.get_payload(decode=True))
-                        images.append(image_output_path + part.get_filename())
+                    with open(image_output_path + filename, "wb") as the_file:
+                        the_file.write(payload)
+                        images.append(image_output_path + filename)
                         image_count = image_count + 1
                 except Exception as err:
                     _LOGGER.critical("Error opening filepath: %s", str(err))
@@ -663,16 +2869,6 @@ def get_mails(
             image_count = image_count + 1
             _LOGGER.debug("Placeholder image found using: image-no-mailpieces700.jpg.")
 
-        # Remove USPS announcement images
-        _LOGGER.debug("Removing USPS announcement images.")
-        images = [
-            el
-            for el in images
-            if not any(
-                ignore in el
-                for ignore in ["mailerProvidedImage", "ra_0", "Mail Attachment.txt"]
-            )
-        ]
         image_count = len(images)
         _LOGGER.debug("Image Count: %s", str(image_count))
 
@@ -841,7 +3037,6 @@ def get_count(
     tracking = []
     result = {}
     today = get_formatted_date()
-    track = None
     found = []
 
     # Return Amazon delivered info
@@ -851,49 +3046,51 @@ def get_count(
         return result
 
     # Bail out if unknown sensor type
-    if ATTR_EMAIL not in SENSOR_DATA[sensor_type]:
+    if (shipper := SHIPPER_SENSORS.get(sensor_type)) is None:
         _LOGGER.debug("Unknown sensor type: %s", str(sensor_type))
         result[ATTR_COUNT] = count
         result[ATTR_TRACKING] = ""
         return result
 
-    subjects = SENSOR_DATA[sensor_type][ATTR_SUBJECT]
-    for subject in subjects:
+    senders = list(shipper.senders)
+    body = shipper.bodies[0] if shipper.bodies else None
+    queries = [(senders, today, subject) for subject in shipper.subjects]
+    if get_tracking_num or body is not None:
+        searches = email_search_many(account, queries)
+    else:
+        # Only the number of emails is needed
+        searches = email_count_many(account, queries)
+    for index, subject in enumerate(shipper.subjects):
 
         _LOGGER.debug(
             "Attempting to find mail from (%s) with subject (%s)",
-            SENSOR_DATA[sensor_type][ATTR_EMAIL],
+            senders,
             subject,
         )
 
-        (server_response, data) = email_search(
-            account, SENSOR_DATA[sensor_type][ATTR_EMAIL], today, subject
-        )
+        if not get_tracking_num and body is None:
+            (server_response, found_count) = searches[index]
+            if server_response == "OK":
+                count += found_count
+            continue
+
+        (server_response, data) = searches[index]
         if server_response == "OK" and data[0] is not None:
-            if ATTR_BODY in SENSOR_DATA[sensor_type].keys():
-                count += find_text(
-                    data, account, SENSOR_DATA[sensor_type][ATTR_BODY][0]
-                )
+            if body is not None:
+                count += find_text(data, account, body)
             else:
                 count += len(data[0].split())
 
             _LOGGER.debug(
                 "Search for (%s) with subject (%s) results: %s count: %s",
-                SENSOR_DATA[sensor_type][ATTR_EMAIL],
+                senders,
                 subject,
                 data[0],
                 count,
             )
             found.append(data[0])
 
-    if (
-        ATTR_PATTERN
-        in SENSOR_DATA[f"{'_'.join(sensor_type.split('_')[:-1])}_tracking"].keys()
-    ):
-        track = SENSOR_DATA[f"{'_'.join(sensor_type.split('_')[:-1])}_tracking"][
-            ATTR_PATTERN
-        ][0]
-
+    track = shipper.tracking
     if track is not None and get_tracking_num and count > 0:
         for sdata in found:
             tracking.extend(get_tracking(sdata, account, track))
@@ -909,56 +3106,124 @@ def get_count(
     return result
 
 
+@lru_cache(maxsize=64)
+def _compile(pattern: str) -> Pattern:
+    return compile_pattern(pattern)
+
+
+def _pattern(value: Union[str, Pattern]) -> Pattern:
+    """Return a compiled pattern, compiling a regex string only once."""
+    if isinstance(value, str):
+        return _compile(value)
+    return value
+
+
+def _fetch_headers(account: Type[imaplib.IMAP4_SSL], mail_list: list) -> list:
+    """Fetch the headers of several emails in a single FETCH.
+
+    Subjects the combined search already read and emails already downloaded
+    are answered locally.
+
+    Returns list of (message id, header message) tuples, the header message
+    is None when the headers could not be fetched
+    """
+    plan = getattr(account, "search_plan", None)
+    subjects = plan.subjects if plan is not None and plan.ready else {}
+    fetched = {}
+    known = {}
+    remote = []
+    for i in mail_list:
+        if int(i) in subjects:
+            known[i] = Message()
+            known[i]["subject"] = subjects[int(i)]
+        elif (local := _local_fetch(account, i)) is not None:
+            fetched[i] = local
+        else:
+            remote.append(i)
+    fetched.update(
+        email_fetch_batch(
+            account,
+            remote,
+            "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)])",
+        )
+    )
+    headers = []
+    for i in mail_list:
+        msg = known.get(i)
+        for response_part in fetched.get(i, []):
+            if isinstance(response_part, tuple):
+                msg = BytesHeaderParser().parsebytes(response_part[1])
+        headers.append((i, msg))
+    return headers
+
+
 def get_tracking(
-    sdata: Any, account: Type[imaplib.IMAP4_SSL], the_format: Optional[str] = None
+    sdata: Any,
+    account: Type[imaplib.IMAP4_SSL],
+    the_format: Union[str, Pattern, None] = None,
 ) -> list:
     """Parse tracking numbers from email.
 
+    the_format is a compiled pattern from the shipper table or a regex.
+
     Returns list of tracking numbers
     """
     tracking = []
-    pattern = None
-    mail_list = sdata.split()
+    pattern = _pattern(the_format)
+    the_format = pattern.pattern
+    rejected = _rejected(account, ("tracking", the_format))
+    mail_list = _skip_rejected(uid_list(sdata), rejected)
     _LOGGER.debug("Searching for tracking numbers in %s messages...", len(mail_list))
 
-    pattern = re.compile(rf"{the_format}")
-    for i in mail_list:
-        data = email_fetch(account, i, "(RFC822)")[1]
-        for response_part in data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                _LOGGER.debug("Checking message subject...")
-
-                # Search subject for a tracking number
-                email_subject = msg["subject"]
-                if (found := pattern.findall(email_subject)) and len(found) > 0:
-                    _LOGGER.debug(
-                        "Found tracking number in email subject: (%s)",
-                        found[0],
-                    )
-                    if found[0] not in tracking:
-                        tracking.append(found[0])
-                    continue
+    # Check the subjects first, only download emails that need a body search
+    body_list = []
+    for i, msg in _fetch_headers(account, mail_list):
+        if msg is None:
+            body_list.append(i)
+            continue
+        _LOGGER.debug("Checking message subject...")
 
-                # Search in email body for tracking number
-                _LOGGER.debug("Checking message body using %s ...", the_format)
-                for part in msg.walk():
-                    _LOGGER.debug("Content type: %s", part.get_content_type())
-                    if part.get_content_type() not in ["text/html", "text/plain"]:
-                        continue
-                    email_msg = part.get_payload(decode=True)
-                    email_msg = email_msg.decode("utf-8", "ignore")
-                    if (found := pattern.findall(email_msg)) and len(found) > 0:
-                        # DHL is special
-                        if " " in the_format:
-                            found[0] = found[0].split(" ")[1]
-
-                        _LOGGER.debug(
-                            "Found tracking number in email body: %s", found[0]
-                        )
-                        if found[0] not in tracking:
-                            tracking.append(found[0])
-                        continue
+        # Search subject for a tracking number
+        email_subject = str(msg["subject"] or "")
+        if (found := pattern.findall(email_subject)) and len(found) > 0:
+            _LOGGER.debug(
+                "Found tracking number in email subject: (%s)",
+                found[0],
+            )
+            if found[0] not in tracking:
+                tracking.append(found[0])
+            continue
+        body_list.append(i)
+
+    messages = fetch_messages(account, body_list)
+    if (name := TRACKING_SCANNER.name(pattern)) is not None:
+        _LOGGER.debug("Checking message bodies for %s tracking numbers ...", name)
+        bodies = {
+            i: [scan[name] for scan in view.tracking] for i, view in messages.items()
+        }
+    else:
+        _LOGGER.debug("Checking message bodies using %s ...", the_format)
+        bodies = {
+            i: [pattern.findall(text) for text in view.texts]
+            for i, view in messages.items()
+        }
+
+    for i, parts in bodies.items():
+        matched = False
+        for found in parts:
+            if not found:
+                continue
+            matched = True
+            found = found[0]
+            # DHL is special
+            if " " in the_format:
+                found = found.split(" ")[1]
+
+            _LOGGER.debug("Found tracking number in email body: %s", found)
+            if found not in tracking:
+                tracking.append(found)
+        if not matched and rejected is not None:
+            rejected.add(i)
 
     if len(tracking) == 0:
         _LOGGER.debug("No tracking numbers found")
@@ -966,34 +3231,31 @@ def get_tracking(
     return tracking
 
 
-def find_text(sdata: Any, account: Type[imaplib.IMAP4_SSL], search: str) -> int:
+def find_text(
+    sdata: Any, account: Type[imaplib.IMAP4_SSL], search: Union[str, Pattern]
+) -> int:
     """Filter for specific words in email.
 
+    search is a compiled pattern from the shipper table or a regex.
+
     Return count of items found as integer
     """
+    pattern = _pattern(search)
+    search = pattern.pattern
     _LOGGER.debug("Searching for (%s) in (%s) emails", search, len(sdata))
-    mail_list = sdata[0].split()
+    rejected = _rejected(account, ("text", search))
+    mail_list = _skip_rejected(uid_list(sdata[0]), rejected)
     count = 0
     found = None
 
-    for i in mail_list:
-        data = email_fetch(account, i, "(RFC822)")[1]
-        for response_part in data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-
-                for part in msg.walk():
-                    _LOGGER.debug("Content type: %s", part.get_content_type())
-                    if part.get_content_type() not in ["text/html", "text/plain"]:
-                        continue
-                    email_msg = part.get_payload(decode=True)
-                    email_msg = email_msg.decode("utf-8", "ignore")
-                    pattern = re.compile(rf"{search}")
-                    if (found := pattern.findall(email_msg)) and len(found) > 0:
-                        _LOGGER.debug(
-                            "Found (%s) in email %s times.", search, str(len(found))
-                        )
-                        count += len(found)
+    for i, view in fetch_messages(account, mail_list).items():
+        before = count
+        for email_msg in view.texts:
+            if (found := pattern.findall(email_msg)) and len(found) > 0:
+                _LOGGER.debug("Found (%s) in email %s times.", search, str(len(found)))
+                count += len(found)
+        if count == before and rejected is not None:
+            rejected.add(i)
 
     _LOGGER.debug("Search for (%s) count results: %s", search, count)
     return count
@@ -1015,18 +3277,19 @@ def amazon_search(
     today = get_formatted_date()
     count = 0
 
-    for domain in AMAZON_DOMAINS:
-        for subject in subjects:
-            email_address = AMAZON_EMAIL + domain
-            _LOGGER.debug("Amazon email search address: %s", str(email_address))
-
-            (server_response, data) = email_search(
-                account, email_address, today, subject
-            )
+    queries = [
+        (AMAZON_EMAIL + domain, today, subject)
+        for domain in AMAZON_DOMAINS
+        for subject in subjects
+    ]
+    results = email_search_many(account, queries)
+    for (email_address, _, _), (server_response, data) in zip(queries, results):
+        _LOGGER.debug("Amazon email search address: %s", str(email_address))
 
-            if server_response == "OK" and data[0] is not None:
-                count += len(data[0].split())
-                _LOGGER.debug("Amazon delivered email(s) found: %s", count)
+        if server_response == "OK" and data[0] is not None:
+            count += len(data[0].split())
+            _LOGGER.debug("Amazon delivered email(s) found: %s", count)
+            if amazon_image_name is not None:
                 get_amazon_image(data[0], account, image_path, hass, amazon_image_name)
 
     return count
@@ -1043,31 +3306,19 @@ def get_amazon_image(
     _LOGGER.debug("Searching for Amazon image in emails...")
 
     img_url = None
-    mail_list = sdata.split()
+    mail_list = uid_list(sdata)
     _LOGGER.debug("HTML Amazon emails found: %s", len(mail_list))
 
-    for i in mail_list:
-        data = email_fetch(account, i, "(RFC822)")[1]
-        for response_part in data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                _LOGGER.debug("Email Multipart: %s", str(msg.is_multipart()))
-                _LOGGER.debug("Content Type: %s", str(msg.get_content_type()))
-
-                for part in msg.walk():
-                    if part.get_content_type() != "text/html":
-                        continue
-                    _LOGGER.debug("Processing HTML email...")
-                    part = part.get_payload(decode=True)
-                    part = part.decode("utf-8", "ignore")
-                    pattern = re.compile(rf"{AMAZON_IMG_PATTERN}")
-                    found = pattern.findall(part)
-                    for url in found:
-                        if url[1] != "us-prod-temp.s3.amazonaws.com":
-                            continue
-                        img_url = url[0] + url[1] + url[2]
-                        _LOGGER.debug("Amazon img URL: %s", img_url)
-                        break
+    for view in fetch_messages(account, mail_list).values():
+        for part in view.html:
+            _LOGGER.debug("Processing HTML email...")
+            found = RE_AMAZON_IMG.findall(part)
+            for url in found:
+                if url[1] != "us-prod-temp.s3.amazonaws.com":
+                    continue
+                img_url = url[0] + url[1] + url[2]
+                _LOGGER.debug("Amazon img URL: %s", img_url)
+                break
 
     if img_url is not None:
         # Download the image we found
@@ -1118,14 +3369,15 @@ def amazon_hub(account: Type[imaplib.IMAP4_SSL], fwds: Optional[str] = None) ->
     subject_regex = AMAZON_HUB_SUBJECT_SEARCH
     info = {}
     today = get_formatted_date()
+    rejected = _rejected(account, ("amazon_hub", subject_regex, body_regex))
 
     email_addresses.extend(AMAZON_HUB_EMAIL)
     _LOGGER.debug("[Hub] Amazon email list: %s", str(email_addresses))
 
-    for address in email_addresses:
-        (server_response, sdata) = email_search(
-            account, address, today, subject=AMAZON_HUB_SUBJECT
-        )
+    results = email_search_many(
+        account, [(address, today, AMAZON_HUB_SUBJECT) for address in email_addresses]
+    )
+    for (server_response, sdata) in results:
 
         # Bail out on error
         if server_response != "OK" or sdata[0] is None:
@@ -1137,37 +3389,23 @@ def amazon_hub(account: Type[imaplib.IMAP4_SSL], fwds: Optional[str] = None) ->
             return info
 
         found = []
-        id_list = sdata[0].split()
+        id_list = _skip_rejected(uid_list(sdata[0]), rejected)
         _LOGGER.debug("Amazon hub emails found: %s", str(len(id_list)))
-        for i in id_list:
-            data = email_fetch(account, i, "(RFC822)")[1]
-            for response_part in data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-
-                    # Get combo number from subject line
-                    email_subject = msg["subject"]
-                    pattern = re.compile(rf"{subject_regex}")
-                    search = pattern.search(email_subject)
-                    if search is not None:
-                        if len(search.groups()) > 1:
-                            found.append(search.group(3))
-                            continue
-
-                    # Get combo number from message body
-                    try:
-                        email_msg = quopri.decodestring(
-                            str(msg.get_payload(0))
-                        )  # msg.get_payload(0).encode('utf-8')
-                    except Exception as err:
-                        _LOGGER.debug("Problem decoding email message: %s", str(err))
-                        continue
-                    email_msg = email_msg.decode("utf-8", "ignore")
-                    pattern = re.compile(rf"{body_regex}")
-                    search = pattern.search(email_msg)
-                    if search is not None:
-                        if len(search.groups()) > 1:
-                            found.append(search.group(2))
+        for i, view in fetch_messages(account, id_list).items():
+            before = len(found)
+            if view.message is not None:
+                # Get combo number from subject line
+                search = RE_AMAZON_HUB_SUBJECT.search(view.subject)
+                if search is not None and len(search.groups()) > 1:
+                    found.append(search.group(3))
+
+                # Get combo number from message body
+                elif (email_msg := view.first_part) is not None:
+                    search = RE_AMAZON_HUB_BODY.search(email_msg)
+                    if search is not None and len(search.groups()) > 1:
+                        found.append(search.group(2))
+            if len(found) == before and rejected is not None:
+                rejected.add(i)
 
     info[ATTR_COUNT] = len(found)
     info[ATTR_CODE] = found
@@ -1195,6 +3433,7 @@ def amazon_exception(
 
     _LOGGER.debug("Amazon domains to be checked: %s", str(domains))
 
+    queries = []
     for domain in domains:
         if "@" in domain:
             email_address = domain.strip('"')
@@ -1203,15 +3442,13 @@ def amazon_exception(
             email_address = []
             email_address.append(f"{AMAZON_EMAIL}{domain}")
             _LOGGER.debug("Amazon email search address: %s", str(email_address))
+        queries.append((email_address, tfmt, AMAZON_EXCEPTION_SUBJECT))
 
-        (server_response, sdata) = email_search(
-            account, email_address, tfmt, AMAZON_EXCEPTION_SUBJECT
-        )
-
+    for (server_response, sdata) in email_search_many(account, queries):
         if server_response == "OK":
             count += len(sdata[0].split())
             _LOGGER.debug("Found %s Amazon exceptions", count)
-            order_numbers = get_tracking(sdata[0], account, AMAZON_PATTERN)
+            order_numbers = get_tracking(sdata[0], account, RE_AMAZON_ORDER)
             for order in order_numbers:
                 order_number.append(order)
 
@@ -1239,6 +3476,7 @@ def get_items(
     deliveries_today = []
     order_number = []
     domains = _process_amazon_forwards(fwds)
+    rejected = _rejected(account, ("amazon_items",))
 
     for main_domain in AMAZON_DOMAINS:
         domains.append(main_domain)
@@ -1260,45 +3498,29 @@ def get_items(
 
         if server_response == "OK":
             mail_ids = sdata[0]
-            id_list = mail_ids.split()
+            id_list = _skip_rejected(uid_list(mail_ids), rejected)
             _LOGGER.debug("Amazon emails found: %s", str(len(id_list)))
-            for i in id_list:
-                data = email_fetch(account, i, "(RFC822)")[1]
-                for response_part in data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-
-                        _LOGGER.debug("Email Multipart: %s", str(msg.is_multipart()))
-                        _LOGGER.debug("Content Type: %s", str(msg.get_content_type()))
-
-                        # Get order number from subject line
-                        encoding = decode_header(msg["subject"])[0][1]
-                        if encoding is not None:
-                            email_subject = decode_header(msg["subject"])[0][0].decode(
-                                encoding, "ignore"
-                            )
-                        else:
-                            email_subject = decode_header(msg["subject"])[0][0]
-                        _LOGGER.debug("Amazon Subject: %s", str(email_subject))
-                        pattern = re.compile(r"[0-9]{3}-[0-9]{7}-[0-9]{7}")
-
-                        # Don't add the same order number twice
-                        if (
-                            (found := pattern.findall(email_subject))
-                            and len(found) > 0
-                            and found[0] not in order_number
-                        ):
-                            order_number.append(found[0])
-
-                        try:
-                            email_msg = quopri.decodestring(str(msg.get_payload(0)))
-                        except Exception as err:
-                            _LOGGER.debug(
-                                "Problem decoding email message: %s", str(err)
-                            )
-                            continue
-                        email_msg = email_msg.decode("utf-8", "ignore")
-
+            for i, view in fetch_messages(account, id_list).items():
+                matched = False
+                if (msg := view.message) is not None:
+                    _LOGGER.debug("Email Multipart: %s", str(msg.is_multipart()))
+                    _LOGGER.debug("Content Type: %s", str(msg.get_content_type()))
+
+                    # Get order number from subject line
+                    email_subject = view.subject
+                    _LOGGER.debug("Amazon Subject: %s", str(email_subject))
+                    pattern = RE_AMAZON_ORDER
+
+                    # Don't add the same order number twice
+                    if (
+                        (found := pattern.findall(email_subject))
+                        and len(found) > 0
+                        and found[0] not in order_number
+                    ):
+                        order_number.append(found[0])
+                    matched = matched or bool(found)
+
+                    if (email_msg := view.first_part) is not None:
                         _LOGGER.debug("RAW EMAIL: %s", email_msg)
 
                         # Check message body for order number
@@ -1308,24 +3530,25 @@ def get_items(
                             and found[0] not in order_number
                         ):
                             order_number.append(found[0])
+                        matched = matched or bool(found)
 
                         for search in AMAZON_TIME_PATTERN:
                             _LOGGER.debug("Looking for: %s", search)
                             if search not in email_msg:
                                 continue
 
-                            start = email_msg.find(search) + len(search)
-                            end = -1
-                            if email_msg.find("Previously expected:") != -1:
-                                end = email_msg.find("Previously expected:")
-                            elif email_msg.find("Track your") != -1:
-                                end = email_msg.find("Track your")
-                            elif email_msg.find("Per tracciare il tuo pacco") != -1:
-                                end = email_msg.find("Per tracciare il tuo pacco")
-                            elif email_msg.find("View or manage order") != -1:
-                                end = email_msg.find("View or manage order")
-
-                            arrive_date = email_msg[start:end].replace(">", "").strip()
+                            end = next(
+                                (
+                                    marker
+                                    for marker in AMAZON_TIME_PATTERN_END
+                                    if marker in email_msg
+                                ),
+                                None,
+                            )
+                            arrive_date = text_region(email_msg, search, end)
+                            arrive_date = (
+                                arrive_date[len(search) :].replace(">", "").strip()
+                            )
                             _LOGGER.debug("First pass: %s", arrive_date)
                             arrive_date = arrive_date.split(" ")
                             arrive_date = arrive_date[0:3]
@@ -1371,6 +3594,9 @@ def get_items(
                                     and dateobj.month == datetime.date.today().month
                                 ):
                                     deliveries_today.append("Amazon Order")
+                                    matched = True
+                if not matched and rejected is not None:
+                    rejected.add(i)
 
     value = None
     if param == "count":
@@ -0,0 +1,145 @@
+"""IMAP IDLE push updates for Mail and Packages."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Optional
+
+from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_PORT, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import CONF_FOLDER, IDLE_DEBOUNCE, IDLE_POLL_INTERVAL, IDLE_TIMEOUT
+from .imap import AsyncImapClient, ImapError
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_BACKOFF = 300
+
+
+class IdleListener:
+    """Hold an IDLE session on the mail folder and refresh on new mail.
+
+    While the session is up the coordinator only polls every
+    IDLE_POLL_INTERVAL minutes as a safety net. If the server doesn't
+    support IDLE, or the session is lost, the configured scan interval
+    is used again.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: DataUpdateCoordinator,
+        config: dict,
+    ) -> None:
+        """Initialize."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.host = config.get(CONF_HOST)
+        self.port = config.get(CONF_PORT)
+        self.user = config.get(CONF_USERNAME)
+        self.pwd = config.get(CONF_PASSWORD)
+        self.folder = config.get(CONF_FOLDER)
+        self.poll_interval = coordinator.update_interval
+        self.supported = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._client: Optional[AsyncImapClient] = None
+        self._debouncer = Debouncer(
+            hass,
+            _LOGGER,
+            cooldown=IDLE_DEBOUNCE,
+            immediate=False,
+            function=coordinator.async_refresh,
+        )
+
+    def async_start(self) -> None:
+        """Start the background IDLE task."""
+        if self._task is None:
+            self._stopping = False
+            self._task = self.hass.loop.create_task(self._run())
+
+    async def async_stop(self, *_: Any) -> None:
+        """Stop the background IDLE task and close the session."""
+        self._debouncer.async_cancel()
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fallback()
+
+    async def _run(self) -> None:
+        """Keep an IDLE session open, reconnecting with backoff."""
+        backoff = 1
+        while not self._stopping:
+            try:
+                await self._connect()
+                if not self.supported:
+                    _LOGGER.info(
+                        "%s does not support IDLE, polling every %s",
+                        self.host,
+                        self.poll_interval,
+                    )
+                    await self._close()
+                    return
+                self.coordinator.update_interval = max(
+                    self.poll_interval, timedelta(minutes=IDLE_POLL_INTERVAL)
+                )
+                backoff = 1
+                # A cancel racing a finished read can be lost, check the flag
+                while not self._stopping:
+                    await self._idle()
+            except asyncio.CancelledError:
+                await self._close()
+                raise
+            except (OSError, EOFError, asyncio.TimeoutError, ImapError) as err:
+                _LOGGER.warning(
+                    "IDLE session to %s lost: %s, retrying in %s seconds",
+                    self.host,
+                    str(err) or type(err).__name__,
+                    backoff,
+                )
+            await self._close()
+            self._fallback()
+            if self._stopping:
+                return
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    async def _connect(self) -> None:
+        """Open, authenticate and select the folder."""
+        self._client = AsyncImapClient(self.host, self.port)
+        await self._client.connect()
+        (server_response, data) = await self._client.login(self.user, self.pwd)
+        if server_response != "OK":
+            raise ImapError(data[0].decode(errors="ignore"))
+        self.supported = "IDLE" in self._client.capabilities
+        if self.supported:
+            (server_response, data) = await self._client.select(self.folder)
+            if server_response != "OK":
+                raise ImapError(data[0].decode(errors="ignore"))
+
+    async def _idle(self) -> None:
+        """Run a single IDLE command, refresh when the folder changed."""
+        # Servers drop IDLE after 30 minutes, renew it before that
+        changes = await self._client.idle(IDLE_TIMEOUT * 60)
+        for change in changes:
+            _LOGGER.debug("IDLE update: %s", change)
+        if changes:
+            await self._debouncer.async_call()
+
+    async def _close(self) -> None:
+        """Close the session without waiting on the server."""
+        if self._client is not None:
+            await self._client.logout()
+            self._client = None
+
+    def _fallback(self) -> None:
+        """Go back to the configured scan interval."""
+        self.coordinator.update_interval = self.poll_interval
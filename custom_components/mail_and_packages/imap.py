@@ -0,0 +1,1036 @@
+"""Asyncio IMAP client for Mail and Packages."""
+from __future__ import annotations
+
+import asyncio
+import imaplib
+import logging
+import re
+import ssl
+import threading
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional, Union
+
+_LOGGER = logging.getLogger(__name__)
+
+STARTTLS_PORT = 143
+# imaplib internals needed to pipeline commands
+IMAPLIB_PIPELINE = ("_command", "_command_complete", "untagged_responses")
+
+RE_LITERAL = re.compile(rb"\{(\d+)\}\r\n$")
+RE_MAILBOX_CHANGE = re.compile(rb"^\* \d+ (EXISTS|EXPUNGE)", re.IGNORECASE)
+RE_ESEARCH_TAG = re.compile(rb'^(?:\* ESEARCH )?\(TAG "([^"]+)"\)', re.IGNORECASE)
+RE_RESPONSE_CODE = re.compile(rb"^\[(?P<code>[A-Z-]+)( (?P<data>[^\]]*))?\]")
+RE_UNTAGGED = re.compile(rb"^\* (?P<type>[A-Z-]+)( (?P<data>.*))?$", re.DOTALL)
+RE_UNTAGGED_NUM = re.compile(
+    rb"^\* (?P<num>\d+) (?P<type>[A-Z-]+)( (?P<data>.*))?$", re.DOTALL
+)
+
+_HOST_SESSIONS: dict = {}
+_HOST_LOCK = threading.Lock()
+_NO_COMPRESS: set = set()  # hosts whose compressed stream broke
+_TLS_SESSIONS: dict = {}
+_SSL_CONTEXT: Optional[ssl.SSLContext] = None
+
+
+class ImapError(Exception):
+    """IMAP server rejected a command or the session is gone."""
+
+
+class _ResumingContext(ssl.SSLContext):
+    """SSL context offering the last TLS session of a host for resumption.
+
+    Both imaplib and asyncio pass the host as server_hostname, which is
+    used to find the session kept by remember_tls_session.
+    """
+
+    def wrap_socket(
+        self,
+        sock: Any,
+        server_side: bool = False,
+        do_handshake_on_connect: bool = True,
+        suppress_ragged_eofs: bool = True,
+        server_hostname: Optional[str] = None,
+        session: Optional[ssl.SSLSession] = None,
+    ) -> ssl.SSLSocket:
+        """Wrap a socket, resuming the host's last session."""
+        if session is None and not server_side:
+            session = _TLS_SESSIONS.get(server_hostname)
+        return super().wrap_socket(
+            sock,
+            server_side=server_side,
+            do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+    def wrap_bio(
+        self,
+        incoming: ssl.MemoryBIO,
+        outgoing: ssl.MemoryBIO,
+        server_side: bool = False,
+        server_hostname: Optional[str] = None,
+        session: Optional[ssl.SSLSession] = None,
+    ) -> ssl.SSLObject:
+        """Wrap memory buffers for asyncio, resuming the host's last session."""
+        if session is None and not server_side:
+            session = _TLS_SESSIONS.get(server_hostname)
+        return super().wrap_bio(
+            incoming,
+            outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+
+def ssl_context() -> ssl.SSLContext:
+    """Return the SSL context shared by all IMAP sessions.
+
+    Matches imaplib.IMAP4_SSL, which doesn't verify the server certificate.
+    Sessions opened with the shared context resume the TLS session of the
+    last login to the same host, skipping most of the handshake.
+    """
+    global _SSL_CONTEXT  # pylint: disable=global-statement
+    if _SSL_CONTEXT is None:
+        context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _SSL_CONTEXT = context
+    return _SSL_CONTEXT
+
+
+def remember_tls_session(host: str, ssl_object: Any) -> None:
+    """Keep the TLS session of a logged in connection for the next one.
+
+    TLS 1.3 servers send the session ticket after the handshake, so this
+    is called once the server has answered a command.
+    """
+    if not isinstance(ssl_object, (ssl.SSLSocket, ssl.SSLObject)):
+        return
+    if ssl_object.session_reused:
+        _LOGGER.debug("Resumed TLS session to %s", host)
+    if (session := ssl_object.session) is not None:
+        _TLS_SESSIONS[host] = session
+
+
+def reserve_sessions(host: str, count: int, limit: int) -> int:
+    """Claim extra sessions to a mail server, shared by every entry.
+
+    Returns number of sessions granted, at most count
+    """
+    with _HOST_LOCK:
+        used = _HOST_SESSIONS.get(host, 0)
+        granted = max(0, min(count, limit - used))
+        _HOST_SESSIONS[host] = used + granted
+    if granted < count:
+        _LOGGER.debug(
+            "Limited to %s extra sessions to %s, %s already in use", granted, host, used
+        )
+    return granted
+
+
+def release_sessions(host: str, count: int) -> None:
+    """Give back sessions claimed with reserve_sessions."""
+    with _HOST_LOCK:
+        used = _HOST_SESSIONS.get(host, 0) - count
+        if used > 0:
+            _HOST_SESSIONS[host] = used
+        else:
+            _HOST_SESSIONS.pop(host, None)
+
+
+class Deflate:
+    """COMPRESS=DEFLATE (RFC 4978) stream with byte counters.
+
+    bytes_* count the IMAP data, wire_* what went over the connection.
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15
+        )
+        self._decompressor = zlib.decompressobj(-15)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.wire_in = 0
+        self.wire_out = 0
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data to send, flushed so the server can read it."""
+        wire = self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+        self.bytes_out += len(data)
+        self.wire_out += len(wire)
+        return wire
+
+    def decompress(self, wire: bytes) -> bytes:
+        """Decompress data received."""
+        data = self._decompressor.decompress(wire)
+        self.wire_in += len(wire)
+        self.bytes_in += len(data)
+        return data
+
+    @property
+    def ratio(self) -> float:
+        """Return how many bytes of data each byte on the wire carried."""
+        wire = self.wire_in + self.wire_out
+        if not wire:
+            return 1.0
+        return (self.bytes_in + self.bytes_out) / wire
+
+
+def compression_failed(host: str, err: Exception) -> None:
+    """Stop compressing sessions to a host after its stream broke."""
+    _LOGGER.warning(
+        "IMAP compression to %s failed, using uncompressed sessions: %s",
+        host,
+        str(err),
+    )
+    _NO_COMPRESS.add(host)
+
+
+def enable_deflate(account: imaplib.IMAP4) -> Optional[Deflate]:
+    """Turn on COMPRESS=DEFLATE on an imaplib session.
+
+    imaplib reads and writes through read, readline and send, so those
+    are replaced on the session to go through the compressed stream.
+    A broken stream aborts the session and later sessions to the host
+    aren't compressed.
+
+    Returns Deflate stream or None if the server refused
+    """
+    if account.host in _NO_COMPRESS:
+        return None
+    imaplib.Commands.setdefault("COMPRESS", ("AUTH", "SELECTED"))
+    try:
+        # pylint: disable=protected-access
+        (server_response, _) = account._simple_command("COMPRESS", "DEFLATE")
+    except imaplib.IMAP4.abort as err:
+        compression_failed(account.host, err)
+        raise
+    except imaplib.IMAP4.error as err:
+        _LOGGER.debug("Error enabling compression: %s", str(err))
+        return None
+    if server_response != "OK":
+        return None
+
+    deflate = Deflate()
+    buffer = bytearray()
+    raw = account.file
+
+    def fill() -> bool:
+        chunk = raw.read1(16384)
+        if not chunk:
+            return False
+        try:
+            buffer.extend(deflate.decompress(chunk))
+        except zlib.error as err:
+            compression_failed(account.host, err)
+            raise imaplib.IMAP4.abort(f"compressed stream broken: {err}") from err
+        return True
+
+    def read(size: int) -> bytes:
+        while len(buffer) < size and fill():
+            pass
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        return data
+
+    def readline() -> bytes:
+        while (end := buffer.find(b"\n")) < 0:
+            if not fill():
+                end = len(buffer) - 1
+                break
+        line = bytes(buffer[: end + 1])
+        del buffer[: end + 1]
+        return line
+
+    def send(data: bytes) -> None:
+        account.sock.sendall(deflate.compress(data))
+
+    account.read = read
+    account.readline = readline
+    account.send = send
+    account.deflate = deflate
+    _LOGGER.debug("IMAP compression enabled")
+    return deflate
+
+
+class ImaplibPipeline:
+    """Pipelines ESEARCH commands on an imaplib session.
+
+    imaplib can send a command without reading its response and read the
+    tagged response later. These are imaplib internals, so they are only
+    used here and supported checks they exist. Works like
+    AsyncImapClient.pipeline.
+    """
+
+    def __init__(self, account: imaplib.IMAP4) -> None:
+        """Initialize."""
+        self.account = account
+
+    @staticmethod
+    def supported(account: Any) -> bool:
+        """Check if an imaplib session has the internals pipelining needs."""
+        return isinstance(getattr(account, "untagged_responses", None), dict) and all(
+            hasattr(account, name) for name in IMAPLIB_PIPELINE
+        )
+
+    def pipeline(self, commands: list) -> list:
+        """Send several commands back to back and collect their results.
+
+        imaplib keeps all untagged ESEARCH responses together, they are
+        handed to the commands by the tag they name once every command is
+        done. A BAD result is returned, not raised.
+
+        Returns list of imaplib style (type, data) tuples
+        """
+        # pylint: disable=protected-access
+        account = self.account
+        account.untagged_responses.pop("ESEARCH", None)
+        sent = []
+        for command in commands:
+            name, _, args = command.partition(" ")
+            sent.append((name.upper(), account._command(name.upper(), args)))
+
+        tagged = []
+        for name, tag in sent:
+            try:
+                tagged.append(account._command_complete(name, tag))
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error as err:
+                tagged.append(("BAD", [str(err).encode()]))
+
+        responses = {}
+        for line in account.untagged_responses.pop("ESEARCH", []):
+            if isinstance(line, bytes) and (match := RE_ESEARCH_TAG.match(line)):
+                responses.setdefault(match.group(1), []).append(line)
+        return [
+            (typ, responses.get(tag, data))
+            for (_, tag), (typ, data) in zip(sent, tagged)
+        ]
+
+
+def quote(value: str) -> str:
+    """Quote a string argument for an IMAP command."""
+    value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+
+class _ImapProtocol(asyncio.Protocol):
+    """Buffer the server's bytes and hand them out by line or literal."""
+
+    def __init__(self, host: str) -> None:
+        """Initialize."""
+        self.host = host
+        self.transport = None
+        self.deflate: Optional[Deflate] = None
+        self._buffer = bytearray()
+        self._waiter: Optional[asyncio.Future] = None
+        self.closed = False
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        if self.deflate is not None:
+            try:
+                data = self.deflate.decompress(data)
+            except zlib.error as err:
+                compression_failed(self.host, err)
+                self.transport.close()
+                self.closed = True
+                self._wake()
+                return
+        self._buffer.extend(data)
+        self._wake()
+
+    def eof_received(self) -> bool:
+        self.closed = True
+        self._wake()
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+        self._wake()
+
+    async def readline(self) -> bytes:
+        """Return the next line including the CRLF."""
+        while (end := self._buffer.find(b"\r\n")) < 0:
+            await self._wait()
+        line = bytes(self._buffer[: end + 2])
+        del self._buffer[: end + 2]
+        return line
+
+    async def readexactly(self, size: int) -> bytes:
+        """Return the next size bytes."""
+        while len(self._buffer) < size:
+            await self._wait()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data: bytes) -> None:
+        """Send data to the server."""
+        if self.closed or self.transport is None:
+            raise EOFError("connection closed")
+        if self.deflate is not None:
+            data = self.deflate.compress(data)
+        self.transport.write(data)
+
+    async def _wait(self) -> None:
+        if self.closed:
+            raise EOFError("connection closed by server")
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class AsyncImapClient:
+    """IMAP client running on the event loop.
+
+    Commands return the same (type, data) tuples as imaplib so results can
+    be handled by the existing helpers. Port 143 is upgraded with STARTTLS,
+    any other port uses SSL from the start.
+    """
+
+    def __init__(self, host: str, port: int, timeout: int = 30) -> None:
+        """Initialize."""
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.capabilities = ()
+        self.folder = None
+        self.uidvalidity = None
+        self._protocol: Optional[_ImapProtocol] = None
+        self._responses = {}
+        self._tag = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        """Open the connection and read the greeting."""
+        loop = asyncio.get_running_loop()
+        context = ssl_context()
+        starttls = self.port == STARTTLS_PORT
+        _, self._protocol = await asyncio.wait_for(
+            loop.create_connection(
+                lambda: _ImapProtocol(self.host),
+                self.host,
+                self.port,
+                ssl=None if starttls else context,
+            ),
+            timeout=self.timeout,
+        )
+        greeting = await asyncio.wait_for(self._protocol.readline(), self.timeout)
+        if not greeting.startswith((b"* OK", b"* PREAUTH")):
+            raise ImapError(greeting.decode(errors="ignore").strip())
+        await self.capability()
+
+        if starttls and context is not None:
+            if "STARTTLS" not in self.capabilities:
+                raise ImapError(f"{self.host} does not support STARTTLS")
+            await self._simple("STARTTLS")
+            self._protocol.transport = await loop.start_tls(
+                self._protocol.transport,
+                self._protocol,
+                context,
+                server_hostname=self.host,
+            )
+            await self.capability()
+
+    @property
+    def connected(self) -> bool:
+        """Return if the connection is open."""
+        return self._protocol is not None and not self._protocol.closed
+
+    async def capability(self) -> tuple:
+        """Refresh the server capabilities."""
+        result = await self._simple("CAPABILITY")
+        if result[1] and isinstance(result[1][-1], bytes):
+            self.capabilities = tuple(result[1][-1].decode().upper().split())
+        return result
+
+    async def login(self, user: str, pwd: str) -> tuple:
+        """Authenticate."""
+        result = await self._simple(f"LOGIN {quote(user)} {quote(pwd)}")
+        if self._protocol.transport is not None:
+            remember_tls_session(
+                self.host, self._protocol.transport.get_extra_info("ssl_object")
+            )
+        # Servers may announce more capabilities once logged in
+        await self.capability()
+        return result
+
+    async def compress(self) -> bool:
+        """Turn on COMPRESS=DEFLATE (RFC 4978) if the server supports it.
+
+        A broken stream closes the session and later sessions to the host
+        aren't compressed.
+
+        Returns True when the session is compressed
+        """
+        if (
+            "COMPRESS=DEFLATE" not in self.capabilities
+            or self.deflate is not None
+            or self.host in _NO_COMPRESS
+        ):
+            return False
+        try:
+            (server_response, _) = await self._simple("COMPRESS DEFLATE")
+        except (OSError, EOFError) as err:
+            compression_failed(self.host, err)
+            raise
+        if server_response != "OK":
+            return False
+        # The server compresses everything after the tagged OK
+        self._protocol.deflate = Deflate()
+        _LOGGER.debug("IMAP compression enabled")
+        return True
+
+    @property
+    def deflate(self) -> Optional[Deflate]:
+        """Return the compressed stream, if any."""
+        return self._protocol.deflate if self._protocol is not None else None
+
+    async def list(self) -> tuple:
+        """List the folders."""
+        return await self._simple('LIST "" "*"')
+
+    async def select(self, mailbox: str = "INBOX") -> tuple:
+        """Select a folder, remembering its UIDVALIDITY."""
+        result = await self._simple(f"SELECT {mailbox}", "EXISTS")
+        if result[0] == "OK":
+            self.folder = mailbox
+            uidvalidity = self._responses.pop("UIDVALIDITY", [None])[-1]
+            self.uidvalidity = int(uidvalidity) if uidvalidity else None
+        return result
+
+    async def status(self, mailbox: str, names: str) -> tuple:
+        """Get the status of a folder."""
+        return await self._simple(f"STATUS {mailbox} {names}")
+
+    async def search(
+        self, charset: Optional[str], *criteria: str, literal: Optional[bytes] = None
+    ) -> tuple:
+        """Search the selected folder.
+
+        A literal, like imaplib's, is sent after the criteria.
+        """
+        command = "SEARCH"
+        if charset:
+            command = f"{command} CHARSET {charset}"
+        return await self._simple(" ".join([command, *criteria]), literal=literal)
+
+    async def fetch(self, message_set: str, message_parts: str) -> tuple:
+        """Fetch parts of one or more emails."""
+        return await self._simple(f"FETCH {message_set} {message_parts}")
+
+    async def uid(
+        self, command: str, *args: str, literal: Optional[bytes] = None
+    ) -> tuple:
+        """Run a command addressing emails by UID, like imaplib does."""
+        command = command.upper()
+        return await self._simple(
+            " ".join(["UID", command, *args]), command, literal=literal
+        )
+
+    def response(self, code: str) -> tuple:
+        """Return and forget untagged responses of the last command.
+
+        Returns imaplib style (code, data) tuple
+        """
+        return code, self._responses.pop(code.upper(), [None])
+
+    async def noop(self) -> tuple:
+        """Check the session."""
+        return await self._simple("NOOP")
+
+    async def logout(self) -> None:
+        """Logout and close the connection without waiting on the server."""
+        if self._protocol is None:
+            return
+        try:
+            self._protocol.write(f"{self._next_tag()} LOGOUT\r\n".encode())
+            self._protocol.transport.close()
+        except Exception as err:
+            _LOGGER.debug("Error logging out of IMAP Server: %s", str(err))
+        self._protocol = None
+
+    def _close(self) -> None:
+        """Drop the connection without a word to the server."""
+        if self._protocol is None:
+            return
+        if self._protocol.transport is not None:
+            self._protocol.transport.close()
+        self._protocol = None
+
+    @asynccontextmanager
+    async def _exclusive(self) -> AsyncIterator[None]:
+        """Run one command at a time.
+
+        A command cut short by a timeout or a cancelled refresh leaves the
+        rest of its response on the way, which the next command would read
+        as its own, so the connection is dropped instead.
+        """
+        async with self._lock:
+            try:
+                yield
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                _LOGGER.debug("IMAP command interrupted, closing the session")
+                self._close()
+                raise
+
+    async def idle(self, timeout: float) -> list:
+        """Wait in IDLE until the folder changes or timeout seconds pass.
+
+        Returns list of EXISTS and EXPUNGE responses received
+        """
+        loop = asyncio.get_running_loop()
+        if self._protocol is None:
+            raise ImapError("not connected")
+        async with self._exclusive():
+            tag = self._next_tag()
+            self._protocol.write(f"{tag} IDLE\r\n".encode())
+            line = await asyncio.wait_for(self._protocol.readline(), self.timeout)
+            if not line.startswith(b"+"):
+                raise ImapError(line.decode(errors="ignore").strip())
+
+            changes = []
+            end = loop.time() + timeout
+            while not changes and (remaining := end - loop.time()) > 0:
+                try:
+                    line = await asyncio.wait_for(
+                        self._protocol.readline(), timeout=remaining
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if RE_MAILBOX_CHANGE.match(line):
+                    changes.append(line.strip())
+
+            self._protocol.write(b"DONE\r\n")
+            await asyncio.wait_for(self._response(tag), self.timeout)
+            return changes
+
+    async def _simple(
+        self,
+        command: str,
+        name: Optional[str] = None,
+        literal: Optional[bytes] = None,
+    ) -> tuple:
+        """Run a command and collect its untagged responses.
+
+        Returns imaplib style (type, data) tuple
+        """
+        if self._protocol is None:
+            raise ImapError("not connected")
+        name = name or command.split(" ", 1)[0].upper()
+        async with self._exclusive():
+            self._responses = {}
+            tag = self._next_tag()
+            if literal is None:
+                self._protocol.write(f"{tag} {command}\r\n".encode())
+            elif "LITERAL+" in self.capabilities:
+                # Non-synchronizing literal (RFC 7888), no continuation wait
+                self._protocol.write(
+                    f"{tag} {command} {{{len(literal)}+}}\r\n".encode()
+                    + literal
+                    + b"\r\n"
+                )
+            else:
+                self._protocol.write(f"{tag} {command} {{{len(literal)}}}\r\n".encode())
+                result = await asyncio.wait_for(self._continuation(tag), self.timeout)
+                if result is not None:
+                    return result[0], [result[1]]
+                self._protocol.write(literal + b"\r\n")
+            typ, text = await asyncio.wait_for(self._response(tag), self.timeout)
+            data = self._responses.pop(name, None)
+            return typ, data if data is not None else [text]
+
+    async def pipeline(self, commands: list) -> list:
+        """Send several commands back to back and collect their results.
+
+        Servers may run pipelined commands at the same time, so only
+        ESEARCH responses, which name their command's tag (RFC 4731), are
+        handed to a command. Other untagged responses can't be told apart
+        and are dropped, pipeline only SEARCH RETURN commands. A BAD result
+        is returned, not raised, so the other commands can still be read.
+
+        Returns list of imaplib style (type, data) tuples
+        """
+        if self._protocol is None:
+            raise ImapError("not connected")
+        if not commands:
+            return []
+        async with self._exclusive():
+            tags = [self._next_tag() for _ in commands]
+            self._protocol.write(
+                b"".join(
+                    f"{tag} {command}\r\n".encode()
+                    for tag, command in zip(tags, commands)
+                )
+            )
+            responses = {tag: {} for tag in tags}
+            tagged = await asyncio.wait_for(
+                self._pipeline_responses(responses), self.timeout
+            )
+            self._responses = {}
+
+        results = []
+        for tag in tags:
+            typ, text = tagged[tag]
+            data = responses[tag].pop("ESEARCH", None)
+            results.append((typ, data if data is not None else [text]))
+        return results
+
+    async def _pipeline_responses(self, responses: dict) -> dict:
+        """Read responses until every tag in responses is done.
+
+        Returns dict of tag to tagged result and text
+        """
+        pending = list(responses)
+        tagged = {}
+        while pending:
+            line = await self._protocol.readline()
+            if line.startswith(b"* "):
+                self._responses = {}
+                if (match := RE_ESEARCH_TAG.match(line)) is not None:
+                    self._responses = responses.get(match.group(1).decode(), {})
+                await self._untagged(line)
+                continue
+            tag, _, rest = line.strip().partition(b" ")
+            tag = tag.decode(errors="ignore")
+            if tag in pending:
+                typ, _, text = rest.partition(b" ")
+                tagged[tag] = (typ.decode().upper(), text)
+                pending.remove(tag)
+        return tagged
+
+    async def _response(self, tag: str) -> tuple:
+        """Read responses until the tagged one arrives.
+
+        Returns the tagged result and text
+        """
+        tagged = f"{tag} ".encode()
+        while True:
+            line = await self._protocol.readline()
+            if line.startswith(tagged):
+                typ, _, text = line[len(tagged) :].strip().partition(b" ")
+                typ = typ.decode().upper()
+                if typ == "BAD":
+                    raise ImapError(text.decode(errors="ignore"))
+                return typ, text
+            if line.startswith(b"* "):
+                await self._untagged(line)
+
+    async def _continuation(self, tag: str) -> Optional[tuple]:
+        """Wait for the server to ask for a literal.
+
+        Returns None to go on sending, or the tagged result and text if
+        the server refused the command
+        """
+        tagged = f"{tag} ".encode()
+        while True:
+            line = await self._protocol.readline()
+            if line.startswith(b"+"):
+                return None
+            if line.startswith(tagged):
+                typ, _, text = line[len(tagged) :].strip().partition(b" ")
+                typ = typ.decode().upper()
+                if typ == "BAD":
+                    raise ImapError(text.decode(errors="ignore"))
+                return typ, text
+            if line.startswith(b"* "):
+                await self._untagged(line)
+
+    async def _untagged(self, line: bytes) -> None:
+        """Store an untagged response, reading any literals it contains."""
+        data = []
+        while match := RE_LITERAL.search(line):
+            literal = await self._protocol.readexactly(int(match.group(1)))
+            data.append((line[: match.start() + len(match.group(0)) - 2], literal))
+            line = await self._protocol.readline()
+        line = line[:-2] if line.endswith(b"\r\n") else line
+
+        if data:
+            head = data[0][0]
+            if (match := RE_UNTAGGED_NUM.match(head)) is not None:
+                data[0] = (
+                    match.group("num") + b" " + (match.group("data") or b""),
+                    data[0][1],
+                )
+            elif (match := RE_UNTAGGED.match(head)) is not None:
+                data[0] = (match.group("data") or b"", data[0][1])
+            typ = match.group("type").decode().upper() if match else "UNKNOWN"
+            if line:
+                data.append(line)
+            self._responses.setdefault(typ, []).extend(data)
+            return
+
+        if (match := RE_UNTAGGED_NUM.match(line)) is not None:
+            value = match.group("num")
+            if match.group("data"):
+                value = value + b" " + match.group("data")
+        elif (match := RE_UNTAGGED.match(line)) is not None:
+            value = match.group("data") or b""
+            if match.group("type").upper() == b"BYE":
+                raise EOFError(value.decode(errors="ignore"))
+            if code := RE_RESPONSE_CODE.match(value):
+                self._responses.setdefault(code.group("code").decode(), []).append(
+                    code.group("data") or b""
+                )
+        else:
+            return
+        self._responses.setdefault(match.group("type").decode().upper(), []).append(
+            value
+        )
+
+    def _next_tag(self) -> str:
+        self._tag += 1
+        return f"MP{self._tag:04d}"
+
+
+class AsyncImapConnection:
+    """Asyncio IMAP session kept open between coordinator refreshes.
+
+    Works like helpers.ImapConnection: the session is checked with NOOP and
+    rebuilt with an exponential backoff when the server has dropped it.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        pwd: str,
+        folder: str,
+        timeout: int = 30,
+        retries: int = 3,
+        backoff: float = 1.0,
+        compress: bool = False,
+    ) -> None:
+        """Initialize."""
+        self.host = host
+        self.port = port
+        self.user = user
+        self.pwd = pwd
+        self.folder = folder
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.compress = compress
+        self._client: Optional[AsyncImapClient] = None
+        self._lock = asyncio.Lock()
+
+    async def async_get(self) -> Union[bool, AsyncImapClient]:
+        """Return a live session with the folder selected.
+
+        Returns client or False if the server can't be reached
+        """
+        async with self._lock:
+            if self._client is not None and await self._alive(self._client):
+                return self._client
+            await self._close()
+
+            for attempt in range(self.retries):
+                if attempt:
+                    delay = self.backoff * 2 ** (attempt - 1)
+                    _LOGGER.debug("Reconnecting to IMAP Server in %s seconds", delay)
+                    await asyncio.sleep(delay)
+
+                client = AsyncImapClient(self.host, self.port, self.timeout)
+                try:
+                    await client.connect()
+                    (server_response, data) = await client.login(self.user, self.pwd)
+                    if server_response != "OK":
+                        raise ImapError(data[0].decode(errors="ignore"))
+                    if self.compress:
+                        await client.compress()
+                    (server_response, data) = await client.select(self.folder)
+                    if server_response != "OK":
+                        raise ImapError(data[0].decode(errors="ignore"))
+                except (OSError, EOFError, asyncio.TimeoutError, ImapError) as err:
+                    _LOGGER.error("Error connecting to IMAP Server: %s", str(err))
+                    await client.logout()
+                    continue
+
+                self._client = client
+                return client
+
+            _LOGGER.error(
+                "Unable to connect to %s after %s attempts", self.host, self.retries
+            )
+            return False
+
+    async def async_close(self) -> None:
+        """Logout and drop the session."""
+        async with self._lock:
+            await self._close()
+
+    async def _close(self) -> None:
+        if self._client is not None:
+            await self._client.logout()
+            self._client = None
+
+    @staticmethod
+    async def _alive(client: AsyncImapClient) -> bool:
+        """Check the session with a NOOP."""
+        if not client.connected:
+            return False
+        try:
+            (server_response, _) = await client.noop()
+        except (OSError, EOFError, asyncio.TimeoutError, ImapError) as err:
+            _LOGGER.debug("IMAP session lost: %s", str(err))
+            return False
+        return server_response == "OK"
+
+
+class AsyncImapConnectionPool:
+    """Extra asyncio sessions used to download emails in parallel.
+
+    The number of sessions is bounded per mail server by reserve_sessions.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        pwd: str,
+        folder: str,
+        size: int,
+        limit: int,
+        timeout: int = 30,
+        compress: bool = False,
+    ) -> None:
+        """Initialize."""
+        self.host = host
+        self.size = reserve_sessions(host, size, limit)
+        self.connections = [
+            AsyncImapConnection(
+                host, port, user, pwd, folder, timeout, retries=1, compress=compress
+            )
+            for _ in range(self.size)
+        ]
+
+    async def async_get(self) -> list:
+        """Return the sessions that are up, reconnecting dropped ones.
+
+        Returns list of clients
+        """
+        clients = await asyncio.gather(
+            *[connection.async_get() for connection in self.connections]
+        )
+        return [client for client in clients if client]
+
+    async def async_close(self) -> None:
+        """Logout every session and give them back."""
+        await asyncio.gather(
+            *[connection.async_close() for connection in self.connections]
+        )
+        release_sessions(self.host, self.size)
+        self.connections = []
+        self.size = 0
+
+
+class ImapBridge:
+    """Blocking imaplib style view of an AsyncImapClient.
+
+    Lets the helpers, running in the executor, use a session owned by the
+    event loop. Commands run on the loop, so cancel() stops the ones in
+    flight and makes the rest fail straight away.
+    """
+
+    def __init__(
+        self, client: AsyncImapClient, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """Initialize."""
+        self.client = client
+        self.loop = loop
+        self.capabilities = client.capabilities
+        self.capabilities_probed = True
+        self.deflate = client.deflate
+        self.folder = client.folder
+        self.uidvalidity = client.uidvalidity
+        self.literal = None
+        self._cancelled = False
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def search(self, charset: Optional[str], *criteria: str) -> tuple:
+        """Search the selected folder, sending literal like imaplib does."""
+        literal, self.literal = self.literal, None
+        return self._call(self.client.search(charset, *criteria, literal=literal))
+
+    def fetch(self, message_set: str, message_parts: str) -> tuple:
+        """Fetch parts of one or more emails."""
+        return self._call(self.client.fetch(message_set, message_parts))
+
+    def uid(self, command: str, *args: str) -> tuple:
+        """Run a command addressing emails by UID."""
+        literal, self.literal = self.literal, None
+        return self._call(self.client.uid(command, *args, literal=literal))
+
+    def pipeline(self, commands: list) -> list:
+        """Send several commands back to back."""
+        return self._call(self.client.pipeline(commands))
+
+    def status(self, mailbox: str, names: str) -> tuple:
+        """Get the status of a folder."""
+        return self._call(self.client.status(mailbox, names))
+
+    def select(self, mailbox: str = "INBOX") -> tuple:
+        """Select a folder."""
+        return self._call(self.client.select(mailbox))
+
+    def list(self) -> tuple:
+        """List the folders."""
+        return self._call(self.client.list())
+
+    def noop(self) -> tuple:
+        """Check the session."""
+        return self._call(self.client.noop())
+
+    def response(self, code: str) -> tuple:
+        """Return untagged responses of the last command."""
+        if code == "UIDVALIDITY" and self.uidvalidity is not None:
+            return code, [str(self.uidvalidity).encode()]
+        return self.client.response(code)
+
+    def logout(self) -> None:
+        """Session belongs to the loop, nothing to do."""
+
+    def cancel(self) -> None:
+        """Cancel running commands and refuse new ones."""
+        with self._lock:
+            self._cancelled = True
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    def _call(self, coro: Any) -> Any:
+        with self._lock:
+            if self._cancelled:
+                coro.close()
+                raise ImapError("refresh cancelled")
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            self._futures.add(future)
+        try:
+            return future.result()
+        except Exception as err:
+            if future.cancelled():
+                raise ImapError("refresh cancelled") from err
+            raise
+        finally:
+            with self._lock:
+                self._futures.discard(future)
@@ -0,0 +1,183 @@
+"""Compiled shipper table for Mail and Packages."""
+from __future__ import annotations
+
+import logging
+import re
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Pattern
+
+from .const import ATTR_BODY, ATTR_EMAIL, ATTR_PATTERN, ATTR_SUBJECT, SENSOR_DATA
+
+_LOGGER = logging.getLogger(__name__)
+
+# Python reads braces that aren't a valid repeat as literal text
+RE_OPEN_BRACE = re.compile(r"(?<!\\)\{")
+RE_REPEAT = re.compile(r"\{(\d+(,\d*)?|,\d+)\}")
+RE_WORD_RUN = re.compile(r"\w+")
+# Pattern syntax that can match a space, an end of the text or a group of
+# another pattern, so the pattern can't be joined with the others
+RE_CROSS_RUN = re.compile(r"\\[1-9sSWDAZx]|\(\?P[<=]|\(\?\(|\[\^|[ .^$]")
+DEFAULT_FLAGS = re.compile("").flags
+
+
+class ShipperSensor(NamedTuple):
+    """Search settings of a SENSOR_DATA entry, compiled once.
+
+    tracking is the pattern of the shipper's *_tracking entry.
+    """
+
+    key: str
+    shipper: str
+    senders: tuple
+    sender_set: frozenset
+    subjects: tuple
+    bodies: tuple
+    tracking: Optional[Pattern]
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    """Compile a SENSOR_DATA regex.
+
+    Raises ValueError for invalid patterns, also for braces re would
+    silently match as text, like a repeat with two commas.
+    """
+    for brace in RE_OPEN_BRACE.finditer(pattern):
+        if not RE_REPEAT.match(pattern, brace.start()):
+            raise ValueError(f"invalid repeat at position {brace.start()} in {pattern}")
+    try:
+        return re.compile(pattern)
+    except re.error as err:
+        raise ValueError(f"{err} in {pattern}") from err
+
+
+def _compile_all(key: str, patterns: list) -> tuple:
+    """Compile the patterns of an entry, logging and leaving out bad ones."""
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(compile_pattern(pattern))
+        except ValueError as err:
+            _LOGGER.error("Invalid pattern for %s: %s", key, str(err))
+    return tuple(compiled)
+
+
+def compile_sensor_data(data: dict) -> Mapping[str, ShipperSensor]:
+    """Build the shipper table from SENSOR_DATA.
+
+    Returns read-only dict of sensor key to ShipperSensor, entries without
+    senders are left out
+    """
+    tracking = {}
+    for key, value in data.items():
+        if key.endswith("_tracking"):
+            patterns = _compile_all(key, value.get(ATTR_PATTERN, []))
+            tracking[key[: -len("_tracking")]] = patterns[0] if patterns else None
+
+    table = {}
+    for key, value in data.items():
+        if ATTR_EMAIL not in value:
+            continue
+        shipper = "_".join(key.split("_")[:-1])
+        senders = tuple(value[ATTR_EMAIL])
+        table[key] = ShipperSensor(
+            key,
+            shipper,
+            senders,
+            frozenset(sender.lower() for sender in senders),
+            tuple(value.get(ATTR_SUBJECT, [])),
+            _compile_all(key, value.get(ATTR_BODY, [])),
+            tracking.get(shipper),
+        )
+    return MappingProxyType(table)
+
+
+class TrackingScanner:
+    """Finds the tracking numbers of several shippers in a text.
+
+    Tracking numbers are runs of letters and digits holding at least one
+    digit. Only those runs of a text are handed to the shipper patterns,
+    which then skip the prose and markup that make up most of an email.
+
+    The patterns are also joined into one alternation that walks those runs
+    once and keeps the runs where any shipper matches. Each pattern then
+    runs on the kept runs alone, usually a word or two per email. Every
+    pattern still returns what its own findall on the text would.
+    """
+
+    def __init__(self, patterns: Mapping[str, Pattern]) -> None:
+        """Keep the patterns by name, each pattern once, and join them."""
+        self._patterns = {}
+        for name, pattern in patterns.items():
+            if pattern is not None and pattern.pattern not in self._patterns:
+                self._patterns[pattern.pattern] = (name, pattern)
+
+        self._joined = [
+            entry for entry in self._patterns.values() if _in_one_run(entry[1])
+        ]
+        # Patterns that could match across or between runs run on their own
+        self._separate = [
+            entry for entry in self._patterns.values() if entry not in self._joined
+        ]
+        self._combined = None
+        if self._joined:
+            try:
+                self._combined = re.compile(
+                    "|".join(f"(?:{pattern.pattern})" for _, pattern in self._joined)
+                )
+            except re.error as err:
+                _LOGGER.debug("Tracking patterns can't be joined: %s", str(err))
+                self._separate = list(self._patterns.values())
+                self._joined = []
+
+    @property
+    def names(self) -> tuple:
+        """Names of the patterns the scanner finds."""
+        return tuple(name for name, _ in self._patterns.values())
+
+    def name(self, pattern: Pattern) -> Optional[str]:
+        """Name of a pattern, None if the scanner doesn't know it."""
+        if (entry := self._patterns.get(pattern.pattern)) is None:
+            return None
+        return entry[0]
+
+    def scan(self, text: str) -> dict:
+        """Find every pattern in a text.
+
+        Returns dict of name to list of matches, in findall order
+        """
+        candidates = " ".join(
+            run for run in RE_WORD_RUN.findall(text) if not run.isalpha()
+        )
+        found = {name: pattern.findall(candidates) for name, pattern in self._separate}
+        if self._combined is not None:
+            matched = []
+            last = -1
+            for match in self._combined.finditer(candidates):
+                start = candidates.rfind(" ", 0, match.start()) + 1
+                if start == last:
+                    continue
+                end = candidates.find(" ", match.end())
+                matched.append(candidates[start : end if end >= 0 else None])
+                last = start
+            runs = " ".join(matched)
+            for name, pattern in self._joined:
+                found[name] = pattern.findall(runs) if runs else []
+        return {name: found[name] for name, _ in self._patterns.values()}
+
+
+def _in_one_run(pattern: Pattern) -> bool:
+    """Return whether every match of a pattern stays inside one run."""
+    if pattern.flags != DEFAULT_FLAGS or RE_CROSS_RUN.search(pattern.pattern):
+        return False
+    match = pattern.search("0 a")
+    return pattern.fullmatch("") is None and (match is None or match.end() > 0)
+
+
+SHIPPER_SENSORS = compile_sensor_data(SENSOR_DATA)
+TRACKING_SCANNER = TrackingScanner(
+    {
+        sensor.shipper: sensor.tracking
+        for sensor in SHIPPER_SENSORS.values()
+        if sensor.tracking is not None
+    }
+)
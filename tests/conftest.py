@@ -1,15 +1,24 @@
 """Fixtures for Mail and Packages tests."""
+import asyncio
 import datetime
 import errno
 import imaplib
+import re
+import ssl
 import time
+import zlib
 from datetime import timezone
 from unittest import mock
 from unittest.mock import patch
 
 import pytest
 from aioresponses import aioresponses
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
 
+from custom_components.mail_and_packages import helpers, imap
 from tests.const import FAKE_UPDATE_DATA
 
 pytest_plugins = "pytest_homeassistant_custom_component"
@@ -26,11 +35,49 @@ def mock_update():
         yield mock_update
 
 
+def _uid_commands(mock_conn):
+    """Answer UID SEARCH and UID FETCH from the search and fetch mocks."""
+
+    def uid(command, *args):
+        if command.upper() == "SEARCH":
+            if args[:1] == ("CHARSET",):
+                return mock_conn.search(*args[1:])
+            return mock_conn.search(None, *args)
+        reply = getattr(mock_conn, command.lower())(*args)
+        if command.upper() == "FETCH":
+            return _with_uids(args[0], reply)
+        return reply
+
+    return uid
+
+
+def _with_uids(message_set, reply):
+    """Add the UID item a server sends with UID FETCH, in request order."""
+    if not isinstance(reply, tuple) or not isinstance(reply[1], list):
+        return reply
+    if isinstance(message_set, bytes):
+        message_set = message_set.decode()
+    uids = iter(_message_set(str(message_set).replace(" ", ",")))
+    data = []
+    for response_part in reply[1]:
+        if isinstance(response_part, tuple) and b"UID " not in response_part[0]:
+            meta = response_part[0]
+            uid = f"UID {next(uids, 0)}".encode()
+            if b"(" in meta:
+                meta = meta.replace(b"(", b"(" + uid + b" ", 1)
+            else:
+                meta = (meta + b" (" + uid + b")").lstrip()
+            response_part = (meta,) + response_part[1:]
+        data.append(response_part)
+    return reply[0], data
+
+
 @pytest.fixture()
 def mock_imap():
     """Mock imap class values."""
     with patch("custom_components.mail_and_packages.helpers.imaplib") as mock_imap:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -42,7 +89,6 @@ def mock_imap():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         mock_conn.select.return_value = ("OK", [])
         yield mock_conn
 
@@ -54,6 +100,7 @@ def mock_imap_login_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_login_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_login_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.side_effect = Exception("Invalid username or password")
@@ -68,6 +115,7 @@ def mock_imap_select_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_select_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_select_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -91,6 +139,7 @@ def mock_imap_list_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_list_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_list_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -110,6 +159,7 @@ def mock_imap_no_email():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_no_email:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_no_email.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -121,7 +171,6 @@ def mock_imap_no_email():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b""])
-        mock_conn.uid.return_value = ("OK", [b""])
         mock_conn.select.return_value = ("OK", [])
         yield mock_conn
 
@@ -133,6 +182,7 @@ def mock_imap_search_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_search_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_search_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -155,6 +205,7 @@ def mock_imap_fetch_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_fetch_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_fetch_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -166,7 +217,6 @@ def mock_imap_fetch_error():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         mock_conn.select.return_value = ("OK", [])
         mock_conn.fetch.side_effect = Exception("Invalid Email")
         yield mock_conn
@@ -179,6 +229,7 @@ def mock_imap_index_error():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_index_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_index_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -200,6 +251,7 @@ def mock_imap_index_error_2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_index_error:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_index_error.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -211,7 +263,6 @@ def mock_imap_index_error_2():
             [b'(\\HasNoChildren) ";" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"0"])
-        mock_conn.uid.return_value = ("OK", [b"0"])
         yield mock_imap_index_error
 
 
@@ -222,6 +273,7 @@ def mock_imap_mailbox_format2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_mailbox_format2:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_mailbox_format2.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -233,7 +285,6 @@ def mock_imap_mailbox_format2():
             [b'(\\HasNoChildren) "." "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"0"])
-        mock_conn.uid.return_value = ("OK", [b"0"])
         yield mock_conn
 
 
@@ -244,6 +295,7 @@ def mock_imap_usps_informed_digest():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_usps_informed_digest:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_usps_informed_digest.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -255,7 +307,6 @@ def mock_imap_usps_informed_digest():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/informed_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -270,6 +321,7 @@ def mock_imap_usps_informed_digest_missing():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_usps_informed_digest_missing:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_usps_informed_digest_missing.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -281,7 +333,6 @@ def mock_imap_usps_informed_digest_missing():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/informed_delivery_missing_mailpiece.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -296,6 +347,7 @@ def mock_imap_usps_informed_digest_no_mail():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_usps_informed_digest_no_mail:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_usps_informed_digest_no_mail.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -307,7 +359,6 @@ def mock_imap_usps_informed_digest_no_mail():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/informed_delivery_no_mail.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -322,6 +373,7 @@ def mock_imap_ups_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_ups_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_ups_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -333,7 +385,6 @@ def mock_imap_ups_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/ups_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -348,6 +399,7 @@ def mock_imap_ups_out_for_delivery_html():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_ups_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_ups_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -359,7 +411,6 @@ def mock_imap_ups_out_for_delivery_html():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/ups_out_for_delivery_new.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -374,6 +425,7 @@ def mock_imap_dhl_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_dhl_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_dhl_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -385,7 +437,6 @@ def mock_imap_dhl_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/dhl_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -400,6 +451,7 @@ def mock_imap_fedex_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_dhl_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_dhl_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -411,7 +463,6 @@ def mock_imap_fedex_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/fedex_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -426,6 +477,7 @@ def mock_imap_fedex_out_for_delivery_2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_dhl_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_dhl_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -437,7 +489,6 @@ def mock_imap_fedex_out_for_delivery_2():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/fedex_out_for_delivery_2.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -452,6 +503,7 @@ def mock_imap_usps_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_usps_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_usps_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -463,7 +515,6 @@ def mock_imap_usps_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/usps_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -478,6 +529,7 @@ def mock_imap_amazon_shipped():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -489,7 +541,6 @@ def mock_imap_amazon_shipped():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_shipped.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -504,6 +555,7 @@ def mock_imap_amazon_shipped_uk():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -515,7 +567,6 @@ def mock_imap_amazon_shipped_uk():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_uk_shipped.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -530,6 +581,7 @@ def mock_imap_amazon_shipped_uk_2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -541,7 +593,6 @@ def mock_imap_amazon_shipped_uk_2():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_uk_shipped_2.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -556,6 +607,7 @@ def mock_imap_amazon_shipped_alt():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped_alt:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped_alt.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -567,7 +619,6 @@ def mock_imap_amazon_shipped_alt():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_shipped_alt.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -582,6 +633,7 @@ def mock_imap_amazon_shipped_alt_2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped_alt_2:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped_alt_2.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -593,7 +645,6 @@ def mock_imap_amazon_shipped_alt_2():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_shipped_alt_2.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -608,6 +659,7 @@ def mock_imap_amazon_shipped_it():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped_it:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped_it.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -619,7 +671,6 @@ def mock_imap_amazon_shipped_it():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_shipped_it.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -634,6 +685,7 @@ def mock_imap_amazon_shipped_alt_timeformat():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_shipped:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_shipped.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -645,7 +697,6 @@ def mock_imap_amazon_shipped_alt_timeformat():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_shipped_alt_timeformat.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -660,6 +711,7 @@ def mock_imap_amazon_delivered():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_delivered:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_delivered.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -671,7 +723,6 @@ def mock_imap_amazon_delivered():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_delivered.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -686,6 +737,7 @@ def mock_imap_amazon_delivered_it():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_delivered_it:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_delivered_it.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -697,7 +749,6 @@ def mock_imap_amazon_delivered_it():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_delivered_it.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -712,6 +763,7 @@ def mock_imap_amazon_the_hub():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_the_hub:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_the_hub.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -723,7 +775,6 @@ def mock_imap_amazon_the_hub():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_hub_notice.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -738,6 +789,7 @@ def mock_imap_amazon_the_hub_2():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_the_hub:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_the_hub.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -749,7 +801,6 @@ def mock_imap_amazon_the_hub_2():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_hub_notice_2.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -983,6 +1034,7 @@ def mock_imap_hermes_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_hermes_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_hermes_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -994,7 +1046,6 @@ def mock_imap_hermes_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/hermes_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1009,6 +1060,7 @@ def mock_imap_royal_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_royal_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_royal_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1020,7 +1072,6 @@ def mock_imap_royal_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/royal_mail_uk_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1103,6 +1154,7 @@ def mock_imap_usps_exception():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_usps_informed_digest:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_usps_informed_digest.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1114,7 +1166,6 @@ def mock_imap_usps_exception():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/usps_exception.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1171,6 +1222,7 @@ def mock_imap_amazon_exception():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_exception:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_exception.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1182,7 +1234,6 @@ def mock_imap_amazon_exception():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_exception.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1197,6 +1248,7 @@ def mock_imap_auspost_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_auspost_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_auspost_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1208,7 +1260,6 @@ def mock_imap_auspost_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/auspost_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1223,6 +1274,7 @@ def mock_imap_auspost_delivered():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_auspost_delivered:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_auspost_delivered.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1234,7 +1286,6 @@ def mock_imap_auspost_delivered():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/auspost_delivered.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1249,6 +1300,7 @@ def mock_imap_poczta_polska_delivering():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_poczta_polska_delivering:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_poczta_polska_delivering.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1260,7 +1312,6 @@ def mock_imap_poczta_polska_delivering():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/poczta_polska_delivering.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1275,6 +1326,7 @@ def mock_imap_inpost_pl_out_for_delivery():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_inpost_pl_out_for_delivery:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_inpost_pl_out_for_delivery.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1286,7 +1338,6 @@ def mock_imap_inpost_pl_out_for_delivery():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/inpost_pl_out_for_delivery.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1301,6 +1352,7 @@ def mock_imap_inpost_pl_delivered():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_inpost_pl_delivered:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_inpost_pl_delivered.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1312,7 +1364,6 @@ def mock_imap_inpost_pl_delivered():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/inpost_pl_delivered.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1327,6 +1378,7 @@ def mock_imap_dpd_com_pl_delivering():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_dpd_com_pl_delivering:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_dpd_com_pl_delivering.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1338,7 +1390,6 @@ def mock_imap_dpd_com_pl_delivering():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/dpd_com_pl_delivering.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1353,6 +1404,7 @@ def mock_imap_search_error_none():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_search_error_none:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_search_error_none.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1375,6 +1427,7 @@ def mock_imap_amazon_fwd():
         "custom_components.mail_and_packages.helpers.imaplib"
     ) as mock_imap_amazon_fwd:
         mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
         mock_imap_amazon_fwd.IMAP4_SSL.return_value = mock_conn
 
         mock_conn.login.return_value = (
@@ -1386,7 +1439,6 @@ def mock_imap_amazon_fwd():
             [b'(\\HasNoChildren) "/" "INBOX"'],
         )
         mock_conn.search.return_value = ("OK", [b"1"])
-        mock_conn.uid.return_value = ("OK", [b"1"])
         f = open("tests/test_emails/amazon_fwd.eml", "r")
         email_file = f.read()
         mock_conn.fetch.return_value = ("OK", [(b"", email_file.encode("utf-8"))])
@@ -1394,7 +1446,327 @@ def mock_imap_amazon_fwd():
         yield mock_conn
 
 
+@pytest.fixture()
+def mock_imap_search_plan():
+    """Mock imap class values for the combined search."""
+    with patch(
+        "custom_components.mail_and_packages.helpers.imaplib"
+    ) as mock_imap_search_plan:
+        mock_conn = mock.Mock(spec=imaplib.IMAP4_SSL)
+        mock_conn.uid.side_effect = _uid_commands(mock_conn)
+        mock_imap_search_plan.IMAP4_SSL.return_value = mock_conn
+
+        today = datetime.date.today()
+        past = today - datetime.timedelta(days=2)
+        mock_conn.search.return_value = ("OK", [b"101 102 103"])
+        mock_conn.fetch.return_value = (
+            "OK",
+            [
+                (
+                    f'1 (UID 101 INTERNALDATE "{today:%d}-{today:%b}-{today:%Y} 08:00:00 +0000" '
+                    "BODY[HEADER.FIELDS (FROM SUBJECT)] {70}".encode(),
+                    b"From: UPS <mcinfo@ups.com>\r\n"
+                    b"Subject: Your UPS Package was delivered\r\n\r\n",
+                ),
+                b")",
+                (
+                    b"2 (UID 102 BODY[HEADER.FIELDS (FROM SUBJECT)] {80}",
+                    b"From: TrackingUpdates@fedex.com\r\n"
+                    b"Subject: =?utf-8?q?Delivery_scheduled_for_today?=\r\n\r\n",
+                ),
+                f' INTERNALDATE "{today:%d}-{today:%b}-{today:%Y} 09:00:00 +0000")'.encode(),
+                (
+                    f'3 (UID 103 INTERNALDATE "{past:%d}-{past:%b}-{past:%Y} 10:00:00 +0000" '
+                    "BODY[HEADER.FIELDS (FROM SUBJECT)] {80}".encode(),
+                    b"From: shipment-tracking@amazon.com\r\n"
+                    b"Subject: Your Amazon.com order has shipped\r\n\r\n",
+                ),
+                b")",
+            ],
+        )
+        mock_conn.select.return_value = ("OK", [])
+        yield mock_conn
+
+
+class FakeImapServer:
+    """Minimal IMAP server on localhost for the asyncio client."""
+
+    def __init__(self, capabilities="IMAP4rev1 IDLE", messages=None):
+        """Initialize."""
+        self.capabilities = capabilities
+        self.messages = messages or []
+        self.uidvalidity = 1650000000
+        self.commands = []
+        self.idle_events = [b"* 2 EXISTS"]
+        self.stalled = set()
+        self.broken_deflate = False
+        # Answer each pair of pipelined commands in reverse order
+        self.out_of_order = False
+        self.server = None
+        self.port = None
+        self.writers = []
+
+    async def start(self, ssl_context=None):
+        """Start listening on a free port."""
+        self.server = await asyncio.start_server(
+            self._handle, "127.0.0.1", 0, ssl=ssl_context
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Close the connections and stop listening."""
+        self.drop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop(self):
+        """Close every client connection."""
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def _handle(self, reader, writer):
+        try:
+            await self._session(reader, writer)
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _session(self, reader, writer):
+        self.writers.append(writer)
+        stream = _FakeStream(reader, writer)
+        stream.write(b"* OK fake IMAP ready\r\n")
+        idle_tag = None
+        held = None
+        while line := await stream.readline():
+            while literal := re.search(rb"\{(\d+)(\+?)\}\r\n$", line):
+                if not literal.group(2):
+                    stream.write(b"+ go ahead\r\n")
+                    await writer.drain()
+                data = await stream.readexactly(int(literal.group(1)))
+                line = line[: literal.start()] + data + await stream.readline()
+            command = line.decode().strip()
+            self.commands.append(command)
+            if command == "DONE":
+                stream.write(f"{idle_tag} OK IDLE terminated\r\n".encode())
+                continue
+            tag, name, args = (command.split(" ", 2) + [""])[:3]
+            name = name.upper()
+            uid = name == "UID"
+            if uid:
+                name, args = (args.split(" ", 1) + [""])[:2]
+                name = name.upper()
+            if name in self.stalled:
+                continue
+            if name == "IDLE":
+                idle_tag = tag
+                stream.write(b"+ idling\r\n")
+                for event in self.idle_events:
+                    stream.write(event + b"\r\n")
+                self.idle_events = []
+            else:
+                reply = self._respond(tag, name, args, uid)
+                reply += f"{tag} OK {name} completed\r\n".encode()
+                if self.out_of_order and held is None and name == "SEARCH":
+                    held = reply
+                    continue
+                stream.write(reply)
+                if held is not None:
+                    stream.write(held)
+                    held = None
+            await writer.drain()
+            if name == "COMPRESS":
+                stream.start_deflate(self.broken_deflate)
+            if name == "LOGOUT":
+                break
+
+    def _respond(self, tag, name, args, uid=False):
+        if name == "CAPABILITY":
+            return f"* CAPABILITY {self.capabilities}\r\n".encode()
+        if name == "SELECT":
+            return (
+                f"* {len(self.messages)} EXISTS\r\n"
+                f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n"
+            ).encode()
+        if name == "STATUS":
+            return (
+                f"* STATUS {args.split(' ')[0]} (MESSAGES {len(self.messages)} "
+                f"UIDNEXT {100 + len(self.messages) + 1} "
+                f"UIDVALIDITY {self.uidvalidity})\r\n"
+            ).encode()
+        if name == "SEARCH":
+            first = 101 if uid else 1
+            if "ESEARCH" in self.capabilities and "RETURN (" in args:
+                return self._esearch(tag, args, first, uid)
+            found = " ".join(str(num + first) for num in range(len(self.messages)))
+            return f"* SEARCH {found}\r\n".encode()
+        if name == "FETCH":
+            message_set, parts = args.split(" ", 1)
+            nums = _message_set(message_set)
+            if uid:
+                nums = [num - 100 for num in nums]
+            return b"".join(self._fetch(num, parts) for num in nums)
+        if name == "LOGOUT":
+            return b"* BYE logging out\r\n"
+        return b""
+
+    def _esearch(self, tag, args, first, uid):
+        response = f'* ESEARCH (TAG "{tag}")' + (" UID" if uid else "")
+        if self.messages and "RETURN (ALL)" in args:
+            last = first + len(self.messages) - 1
+            response += f" ALL {first}:{last}" if last > first else f" ALL {first}"
+        if "RETURN (COUNT)" in args:
+            response += f" COUNT {len(self.messages)}"
+        return f"{response}\r\n".encode()
+
+    def _fetch(self, num, parts):
+        if not 0 < num <= len(self.messages):
+            return b""
+        raw = self.messages[num - 1]
+        if "HEADER.FIELDS" in parts:
+            item = re.search(r"BODY\.PEEK(\[[^\]]*\])", parts).group(1)
+            data = raw.split(b"\n\n", 1)[0] + b"\n\n"
+            return (
+                f"* {num} FETCH (UID {100 + num} BODY{item} {{{len(data)}}}\r\n".encode()
+                + data
+                + b")\r\n"
+            )
+        item = "BODY[]" if "BODY.PEEK[]" in parts else "RFC822"
+        return (
+            f"* {num} FETCH (UID {100 + num} {item} {{{len(raw)}}}\r\n".encode()
+            + raw
+            + b")\r\n"
+        )
+
+
+class _FakeStream:
+    """Line based server stream that can switch to COMPRESS=DEFLATE."""
+
+    def __init__(self, reader, writer):
+        """Initialize."""
+        self.reader = reader
+        self.writer = writer
+        self.buffer = bytearray()
+        self.compressor = None
+        self.decompressor = None
+        self.broken = False
+
+    def start_deflate(self, broken=False):
+        """Compress everything from now on, or send a broken stream."""
+        self.broken = broken
+        self.compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15
+        )
+        self.decompressor = zlib.decompressobj(-15)
+
+    async def readline(self):
+        """Read the next line, empty at the end of the stream."""
+        while (end := self.buffer.find(b"\n")) < 0:
+            chunk = await self.reader.read(4096)
+            if not chunk:
+                return b""
+            if self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            self.buffer.extend(chunk)
+        line = bytes(self.buffer[: end + 1])
+        del self.buffer[: end + 1]
+        return line
+
+    async def readexactly(self, size):
+        """Read size bytes."""
+        while len(self.buffer) < size:
+            chunk = await self.reader.read(4096)
+            if not chunk:
+                raise ConnectionError("connection closed")
+            if self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            self.buffer.extend(chunk)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def write(self, data):
+        """Send data to the client."""
+        if self.broken:
+            # Invalid deflate block type
+            data = b"\x07" + data
+        elif self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        self.writer.write(data)
+
+
+def _message_set(message_set):
+    """Expand an IMAP sequence set."""
+    nums = []
+    for item in message_set.split(","):
+        first, _, last = item.partition(":")
+        nums.extend(range(int(first), int(last or first) + 1))
+    return nums
+
+
+@pytest.fixture()
+async def fake_imap_server(hass):
+    """Local IMAP server, connected to without SSL."""
+    server = FakeImapServer()
+    await server.start()
+    with patch(
+        "custom_components.mail_and_packages.imap.ssl_context", return_value=None
+    ):
+        yield server
+    await server.stop()
+
+
+def _server_ssl_context(path):
+    """Return a server SSL context with a self-signed certificate."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_file = path / "cert.pem"
+    key_file = path / "key.pem"
+    cert_file.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+@pytest.fixture()
+async def fake_imap_server_tls(hass, tmp_path):
+    """Local IMAP server using SSL."""
+    server = FakeImapServer()
+    await server.start(_server_ssl_context(tmp_path))
+    imap._TLS_SESSIONS.clear()
+    yield server
+    imap._TLS_SESSIONS.clear()
+    await server.stop()
+
+
 @pytest.fixture(autouse=True)
 def auto_enable_custom_integrations(enable_custom_integrations):
     """Enable custom integration tests."""
     yield
+
+
+@pytest.fixture(autouse=True)
+def clear_folder_lists():
+    """Forget folder listings cached by other tests."""
+    helpers._FOLDER_LISTS.clear()
+    yield
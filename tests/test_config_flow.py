@@ -87,6 +87,13 @@ from tests.const import FAKE_CONFIG_DATA, FAKE_CONFIG_DATA_BAD
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -249,6 +256,13 @@ async def test_form(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -441,6 +455,13 @@ async def test_form_connection_error(input_1, step_id_2, hass, mock_imap):
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -578,6 +599,13 @@ async def test_form_invalid_ffmpeg(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -724,6 +752,13 @@ async def test_form_index_error(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -869,6 +904,13 @@ async def test_form_index_error_2(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -1050,6 +1092,13 @@ async def test_imap_login_error(mock_imap_login_error, caplog):
                 "image_path": "custom_components/mail_and_packages/images/",
                 "image_security": True,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 15,
                 "resources": [
                     "amazon_packages",
@@ -1226,6 +1275,13 @@ async def test_options_flow(
                 "image_path": "custom_components/mail_and_packages/images/",
                 "image_security": True,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 15,
                 "resources": [
                     "amazon_packages",
@@ -1447,6 +1503,13 @@ async def test_options_flow_connection_error(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -1595,6 +1658,13 @@ async def test_options_flow_invalid_ffmpeg(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -1744,6 +1814,13 @@ async def test_options_flow_index_error(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -1893,6 +1970,13 @@ async def test_options_flow_index_error_2(
                 "generate_mp4": False,
                 "gif_duration": 5,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 20,
                 "resources": [
                     "amazon_packages",
@@ -2043,6 +2127,13 @@ async def test_options_flow_mailbox_format2(
                 "image_path": "custom_components/mail_and_packages/images/",
                 "image_security": True,
                 "imap_timeout": 30,
+                "imap_idle": False,
+                "imap_async": False,
+                "imap_connections": 1,
+                "imap_compress": False,
+                "imap_prewarm": False,
+                "message_cache": True,
+                "extra_folders": [],
                 "scan_interval": 15,
                 "resources": [
                     "amazon_packages",
@@ -1,7 +1,12 @@
 """Tests for helpers module."""
 import datetime
+import email
 import errno
+import imaplib
+import os
+import threading
 from datetime import date, timezone
+from email.parser import BytesFeedParser
 from unittest import mock
 from unittest.mock import call, mock_open, patch
 
@@ -11,26 +16,50 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from custom_components.mail_and_packages.const import DOMAIN
 from custom_components.mail_and_packages.helpers import (
+    ImapConnection,
+    MessageCache,
+    MessageView,
+    SubjectMatcher,
+    UidSet,
     _generate_mp4,
     amazon_exception,
     amazon_hub,
     amazon_search,
+    build_search_plan,
     cleanup_images,
     download_img,
+    email_count,
     email_fetch,
+    email_fetch_batch,
     email_search,
+    entry_folders,
+    find_text,
+    forget_folders,
     get_count,
     get_formatted_date,
     get_items,
     get_mails,
+    get_tracking,
     hash_file,
+    html_to_text,
     image_file_name,
+    list_folders,
     login,
+    mailbox_status,
+    merge_sensor_data,
+    parse_text_parts,
+    prefetch_emails,
     process_emails,
     resize_images,
+    search_pipeline,
     selectfolder,
+    text_region,
     update_time,
 )
+from custom_components.mail_and_packages.shippers import (
+    SHIPPER_SENSORS,
+    TRACKING_SCANNER,
+)
 from tests.const import (
     FAKE_CONFIG_DATA,
     FAKE_CONFIG_DATA_BAD,
@@ -629,6 +658,135 @@ async def test_informed_delivery_missing_mailpiece(
         assert result == 5
 
 
+def _informed_delivery_uid(command, *args):
+    """Answer the UID SEARCH, BODYSTRUCTURE and section FETCH of a digest."""
+    if command == "SEARCH":
+        return ("OK", [b"101"])
+    (_, parts) = args
+    if parts == "(UID BODYSTRUCTURE)":
+        return (
+            "OK",
+            [
+                (
+                    b'1 (UID 101 BODYSTRUCTURE (("TEXT" "HTML" ("CHARSET" "UTF-8")'
+                    b' NIL NIL "QUOTED-PRINTABLE" 44 1 NIL NIL NIL NIL)("IMAGE"'
+                    b' "JPEG" ("NAME" "mailerProvidedImage0") NIL NIL "BASE64" 8'
+                    b' NIL ("INLINE" ("FILENAME" "mailerProvidedImage0")) NIL NIL)'
+                    b'("IMAGE" "JPEG" NIL NIL NIL "BASE64" 8 NIL ("INLINE"'
+                    b' ("FILENAME" {18}',
+                    b"1038048032-101.jpg",
+                ),
+                b')) NIL NIL) "RELATED" ("BOUNDARY" "xyz") NIL NIL))',
+            ],
+        )
+    return (
+        "OK",
+        [
+            (b"1 (UID 101 BODY[3] {8}", b"aW1hZ2Ux"),
+            (b" BODY[1] {44}", b'<img src=3D"image-no-mailpieces700.jpg">\r\n'),
+            b")",
+        ],
+    )
+
+
+async def test_informed_delivery_bodystructure(
+    mock_listdir,
+    mock_osremove,
+    mock_osmakedir,
+    mock_os_path_splitext,
+    mock_image,
+    mock_io,
+    mock_resizeimage,
+    mock_copyfile,
+):
+    account = mock.Mock(spec=imaplib.IMAP4_SSL)
+    account.uid.side_effect = _informed_delivery_uid
+
+    m_open = mock_open()
+    with patch("builtins.open", m_open, create=True):
+        result = get_mails(account, "./", "5", "mail_today.gif", False)
+
+    # One mail piece plus the placeholder, the announcement isn't downloaded
+    assert result == 2
+    assert account.uid.call_args_list[1:] == [
+        call("FETCH", "101", "(UID BODYSTRUCTURE)"),
+        call("FETCH", "101", "(BODY.PEEK[3] BODY.PEEK[1])"),
+    ]
+    m_open.assert_any_call("./1038048032-101.jpg", "wb")
+    m_open().write.assert_any_call(b"image1")
+
+
+def _informed_delivery_binary(command, *args):
+    """Answer the UID FETCH of a digest from a server with BINARY."""
+    if args[-1] == "(BINARY.PEEK[3] BODY.PEEK[1])":
+        return (
+            "OK",
+            [
+                (b"1 (UID 101 BINARY[3] ~{6}", b"image1"),
+                (b" BODY[1] {44}", b'<img src=3D"image-no-mailpieces700.jpg">\r\n'),
+                b")",
+            ],
+        )
+    return _informed_delivery_uid(command, *args)
+
+
+async def test_informed_delivery_binary(
+    mock_listdir,
+    mock_osremove,
+    mock_osmakedir,
+    mock_os_path_splitext,
+    mock_image,
+    mock_io,
+    mock_resizeimage,
+    mock_copyfile,
+):
+    account = mock.Mock(spec=imaplib.IMAP4_SSL)
+    account.capability.return_value = ("OK", [b"IMAP4rev1 BINARY"])
+    account.uid.side_effect = _informed_delivery_binary
+
+    m_open = mock_open()
+    with patch("builtins.open", m_open, create=True):
+        result = get_mails(account, "./", "5", "mail_today.gif", False)
+
+    assert result == 2
+    assert account.uid.call_args_list[1:] == [
+        call("FETCH", "101", "(UID BODYSTRUCTURE)"),
+        call("FETCH", "101", "(BINARY.PEEK[3] BODY.PEEK[1])"),
+    ]
+    m_open().write.assert_any_call(b"image1")
+
+
+async def test_informed_delivery_binary_unknown_cte(
+    mock_listdir,
+    mock_osremove,
+    mock_osmakedir,
+    mock_os_path_splitext,
+    mock_image,
+    mock_io,
+    mock_resizeimage,
+    mock_copyfile,
+):
+    account = mock.Mock(spec=imaplib.IMAP4_SSL)
+    account.capability.return_value = ("OK", [b"IMAP4rev1 BINARY"])
+
+    def uid(command, *args):
+        if args[-1].startswith("(BINARY"):
+            return ("NO", [b"[UNKNOWN-CTE] Can't decode"])
+        return _informed_delivery_uid(command, *args)
+
+    account.uid.side_effect = uid
+
+    m_open = mock_open()
+    with patch("builtins.open", m_open, create=True):
+        result = get_mails(account, "./", "5", "mail_today.gif", False)
+
+    assert result == 2
+    assert account.uid.call_args_list[-1] == call(
+        "FETCH", "101", "(BODY.PEEK[3] BODY.PEEK[1])"
+    )
+    m_open().write.assert_any_call(b"image1")
+
+
 async def test_informed_delivery_no_mail(
     mock_imap_usps_informed_digest_no_mail,
     mock_listdir,
@@ -895,16 +1053,71 @@ async def test_login_error(mock_imap_login_error, caplog):
     assert "Error logging into IMAP Server:" in caplog.text
 
 
-async def test_selectfolder_list_error(mock_imap_list_error, caplog):
-    assert not selectfolder(mock_imap_list_error, "somefolder")
+async def test_list_folders_error(mock_imap_list_error, caplog):
+    assert list_folders("localhost", 993, "fakeuser", "suchfakemuchpassword") == [
+        '"INBOX"'
+    ]
     assert "Error listing folders:" in caplog.text
 
 
+async def test_list_folders_cached(mock_imap):
+    folders = list_folders("localhost", 993, "fakeuser", "suchfakemuchpassword")
+    assert folders == ['"INBOX"']
+    assert list_folders("localhost", 993, "fakeuser", "suchfakemuchpassword") == [
+        '"INBOX"'
+    ]
+    assert mock_imap.list.call_count == 1
+
+    with patch("custom_components.mail_and_packages.helpers.FOLDER_LIST_TTL", 0):
+        list_folders("localhost", 993, "fakeuser", "suchfakemuchpassword")
+    assert mock_imap.list.call_count == 2
+
+    forget_folders("localhost", "fakeuser")
+    list_folders("localhost", 993, "fakeuser", "suchfakemuchpassword")
+    assert mock_imap.list.call_count == 3
+
+
 async def test_selectfolder_select_error(mock_imap_select_error, caplog):
     assert not selectfolder(mock_imap_select_error, "somefolder")
     assert "Error selecting folder:" in caplog.text
 
 
+async def test_entry_folders():
+    config = {"folder": '"INBOX"', "extra_folders": ['"Orders"', '"INBOX"', '"Spam"']}
+    assert entry_folders(config) == ['"INBOX"', '"Orders"', '"Spam"']
+    assert entry_folders({"folder": '"INBOX"'}) == ['"INBOX"']
+
+
+async def test_merge_sensor_data():
+    data = {
+        "usps_delivered": 1,
+        "amazon_packages": 2,
+        "amazon_order": ["111-123", "111-456"],
+        "image_name": "mail_today.gif",
+        "mail_updated": "Sep 18, 2020 12:00",
+        "amazon_exception": True,
+    }
+    other = {
+        "usps_delivered": 2,
+        "fedex_delivered": 1,
+        "amazon_order": ["111-456", "111-789"],
+        "image_name": None,
+        "mail_updated": "Sep 18, 2020 12:01",
+        "amazon_exception": False,
+    }
+    merged = merge_sensor_data(data, other)
+    assert merged == {
+        "usps_delivered": 3,
+        "amazon_packages": 2,
+        "fedex_delivered": 1,
+        "amazon_order": ["111-123", "111-456", "111-789"],
+        "image_name": "mail_today.gif",
+        "mail_updated": "Sep 18, 2020 12:00",
+        "amazon_exception": True,
+    }
+    assert data["usps_delivered"] == 1
+
+
 async def test_resize_images_open_err(mock_open_excpetion, caplog):
     resize_images(["testimage.jpg", "anothertest.jpg"], 724, 320)
     assert "Error attempting to open image" in caplog.text
@@ -1078,3 +1291,768 @@ async def test_amazon_shipped_fwd(hass, mock_imap_amazon_fwd, caplog):
     result = get_items(mock_imap_amazon_fwd, "order")
     assert result == ["123-1234567-1234567"]
     assert "Arrive Date: Tuesday, January 11" in caplog.text
+
+
+async def test_search_plan(mock_imap_search_plan):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    assert "mcinfo@ups.com" in plan.addresses
+    assert "shipment-tracking@amazon.com" in plan.addresses
+    assert "fakeuser@fake.email" in plan.addresses
+    assert plan.days == 3
+
+    assert plan.execute(mock_imap_search_plan)
+    assert mock_imap_search_plan.search.call_count == 1
+    assert mock_imap_search_plan.fetch.call_count == 1
+    assert mock_imap_search_plan.fetch.call_args.args[0] == "101:103"
+    assert list(plan.messages) == [101, 102, 103]
+
+    mock_imap_search_plan.search_plan = plan
+    today = get_formatted_date()
+    result = email_search(
+        mock_imap_search_plan, ["mcinfo@ups.com"], today, "Your UPS Package"
+    )
+    assert result == ("OK", [b"101"])
+    result = email_search(
+        mock_imap_search_plan,
+        ["TrackingUpdates@fedex.com", "fedexcanada@fedex.com"],
+        today,
+        "delivery scheduled for today",
+    )
+    assert result == ("OK", [b"102"])
+    result = email_search(
+        mock_imap_search_plan, "shipment-tracking@amazon.com", today
+    )
+    assert result == ("OK", [b""])
+    past = (date.today() - datetime.timedelta(days=3)).strftime("%d-%b-%Y")
+    result = email_search(mock_imap_search_plan, "shipment-tracking@amazon.com", past)
+    assert result == ("OK", [b"103"])
+    assert mock_imap_search_plan.search.call_count == 1
+
+    # Addresses outside of the plan go to the server
+    email_search(mock_imap_search_plan, "fake@eamil.address", today)
+    assert mock_imap_search_plan.search.call_count == 2
+
+
+async def test_search_plan_error(mock_imap_search_error):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    assert not plan.execute(mock_imap_search_error)
+    assert plan.lookup("mcinfo@ups.com", get_formatted_date()) is None
+
+
+async def test_imap_connection_reuse(mock_imap):
+    mock_imap.noop.return_value = ("OK", [b"NOOP completed"])
+    connection = ImapConnection("imap.test.email", 993, "user", "pass", "INBOX")
+
+    account = connection.get()
+    assert account is mock_imap
+    assert connection.get() is account
+    assert mock_imap.login.call_count == 1
+    assert mock_imap.select.call_count == 1
+    assert mock_imap.noop.call_count == 1
+
+    connection.close()
+    assert mock_imap.logout.called
+
+
+async def test_imap_connection_reconnect(mock_imap, caplog):
+    connection = ImapConnection("imap.test.email", 993, "user", "pass", "INBOX")
+    assert connection.get()
+
+    mock_imap.noop.side_effect = imaplib.IMAP4.abort("socket error: EOF")
+    assert connection.get() is mock_imap
+    assert mock_imap.login.call_count == 2
+    assert "IMAP session lost:" in caplog.text
+
+
+async def test_imap_connection_session(mock_imap):
+    mock_imap.noop.return_value = ("OK", [b"NOOP completed"])
+    connection = ImapConnection("imap.test.email", 993, "user", "pass", "INBOX")
+    results = []
+    with connection.session() as account:
+        assert account is mock_imap
+        thread = threading.Thread(target=lambda: results.append(connection.get()))
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+    thread.join()
+    assert results == [mock_imap]
+
+
+async def test_imap_connection_backoff(mock_imap_login_error, caplog):
+    connection = ImapConnection("imap.test.email", 993, "user", "pass", "INBOX")
+    with patch("time.sleep") as mock_sleep:
+        assert not connection.get()
+    assert mock_imap_login_error.login.call_count == 3
+    assert mock_sleep.call_args_list == [call(1.0), call(2.0)]
+    assert "Unable to connect to imap.test.email after 3 attempts" in caplog.text
+
+
+async def test_process_emails_connection(
+    hass,
+    mock_imap_no_email,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_copyfile,
+    mock_copytree,
+    mock_hash_file,
+    mock_getctime_today,
+):
+    mock_imap_no_email.noop.return_value = ("OK", [b"NOOP completed"])
+    connection = ImapConnection("imap.test.email", 993, "user", "pass", "INBOX")
+    config = FAKE_CONFIG_DATA_CORRECTED
+
+    process_emails(hass, config, connection=connection)
+    result = process_emails(hass, config, connection=connection)
+    assert result["amazon_packages"] == 0
+    assert mock_imap_no_email.login.call_count == 1
+    assert not mock_imap_no_email.logout.called
+
+
+async def test_message_cache(tmp_path):
+    cache = MessageCache(str(tmp_path), max_size=10)
+    assert cache.get("INBOX", 1, 101) is None
+
+    cache.put("INBOX", 1, 101, b"12345")
+    cache.put("INBOX", 1, 102, b"67890")
+    assert cache.get("INBOX", 1, 101) == b"12345"
+    assert cache.get("INBOX", 2, 101) is None
+    assert cache.get("Archive", 1, 101) is None
+
+    # 102 is now the least recently used message
+    cache.put("INBOX", 1, 103, b"abc")
+    assert cache.get("INBOX", 1, 102) is None
+    assert cache.get("INBOX", 1, 103) == b"abc"
+    assert cache.size == 8
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # Index is rebuilt from disk
+    cache = MessageCache(str(tmp_path), max_size=10)
+    assert cache.get("INBOX", 1, 101) == b"12345"
+    assert cache.size == 8
+
+
+async def test_uid_set():
+    uids = UidSet()
+    assert 101 not in uids
+    for uid in (105, 101, 200, 105):
+        uids.add(uid)
+    assert len(uids) == 3
+    assert 101 in uids and b"105" in uids and 200 in uids
+    assert 99 not in uids and 102 not in uids and 201 not in uids
+
+
+async def test_uid_set_sparse():
+    uids = UidSet()
+    for uid in (5, 1, 2_000_000_000, 5):
+        uids.add(uid)
+    # Far apart UIDs are kept in a set, not a bitmap between them
+    assert uids._bits == 0
+    assert len(uids) == 3
+    assert 1 in uids and 5 in uids and b"2000000000" in uids
+    assert 2 not in uids and 1_999_999_999 not in uids
+    uids.add(7)
+    assert len(uids) == 4 and 7 in uids
+
+    uids = UidSet()
+    uids.add(2_000_000_000)
+    uids.add(1)
+    assert uids._bits == 0
+    assert len(uids) == 2 and 1 in uids and 2_000_000_000 in uids
+
+
+async def test_message_cache_rejected(tmp_path):
+    cache = MessageCache(str(tmp_path))
+    rejected = cache.rejected("INBOX", 1, ("text", "running late"))
+    rejected.add(101)
+    assert 101 in cache.rejected("INBOX", 1, ("text", "running late"))
+    assert 101 not in cache.rejected("INBOX", 2, ("text", "running late"))
+    assert 101 not in cache.rejected("INBOX", 1, ("text", "delayed"))
+
+    with patch("custom_components.mail_and_packages.helpers.PARSER_VERSION", 0):
+        assert 101 not in cache.rejected("INBOX", 1, ("text", "running late"))
+
+
+async def test_find_text_skips_rejected(mock_imap, tmp_path):
+    mock_imap.folder = '"INBOX"'
+    mock_imap.uidvalidity = 1
+    mock_imap.message_cache = MessageCache(str(tmp_path))
+    mock_imap.fetch.return_value = (
+        "OK",
+        [(b"1 (UID 101 RFC822 {25}", b"Subject: hi\n\nOn its way"), b")"],
+    )
+
+    with patch(
+        "custom_components.mail_and_packages.helpers.email_fetch_batch",
+        wraps=email_fetch_batch,
+    ) as mock_batch:
+        assert find_text([b"101"], mock_imap, "running late") == 0
+        assert find_text([b"101"], mock_imap, "running late") == 0
+        assert find_text([b"101"], mock_imap, "its way") == 1
+
+    assert [fetch.args[1] for fetch in mock_batch.call_args_list] == [
+        [101],
+        [],
+        [101],
+    ]
+
+
+async def test_email_fetch_cache(mock_imap_search_plan, tmp_path):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    plan.execute(mock_imap_search_plan)
+    mock_imap_search_plan.search_plan = plan
+    mock_imap_search_plan.folder = '"INBOX"'
+    mock_imap_search_plan.uidvalidity = 1
+    mock_imap_search_plan.message_cache = MessageCache(str(tmp_path))
+    mock_imap_search_plan.fetch.return_value = (
+        "OK",
+        [(b"1 (UID 101 RFC822 {12}", b"Subject: hi\n"), b")"],
+    )
+
+    result = email_fetch(mock_imap_search_plan, b"101")
+    assert result[1][0][1] == b"Subject: hi\n"
+    assert mock_imap_search_plan.fetch.call_count == 2
+
+    result = email_fetch(mock_imap_search_plan, 101)
+    assert result == ("OK", [(b"101 (UID 101 RFC822 {12}", b"Subject: hi\n"), b")"])
+    assert mock_imap_search_plan.fetch.call_count == 2
+
+    # UID sets and sessions without a known folder are not cached
+    email_fetch(mock_imap_search_plan, "101:102")
+    mock_imap_search_plan.uidvalidity = None
+    email_fetch(mock_imap_search_plan, b"101")
+    assert mock_imap_search_plan.fetch.call_count == 4
+
+
+async def test_selectfolder_uidvalidity(mock_imap):
+    mock_imap.response.return_value = ("UIDVALIDITY", [b"1650000000"])
+    assert selectfolder(mock_imap, "INBOX")
+    assert mock_imap.folder == "INBOX"
+    assert mock_imap.uidvalidity == 1650000000
+
+
+async def test_get_tracking_headers_first(mock_imap):
+    mock_imap.fetch.side_effect = [
+        (
+            "OK",
+            [
+                (
+                    b"1 (BODY[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)] {40}",
+                    b"Subject: UPS Update: 1Z2345YY0678901234\r\n\r\n",
+                ),
+                b")",
+                (
+                    b"2 (BODY[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)] {40}",
+                    b"Subject: UPS Update: Package Scheduled\r\n\r\n",
+                ),
+                b")",
+            ],
+        ),
+        (
+            "OK",
+            [
+                (
+                    b"2 (RFC822 {80}",
+                    b"Subject: UPS Update: Package Scheduled\r\n"
+                    b"Content-Type: text/plain\r\n\r\n"
+                    b"Tracking Number: 1Z9876YY0543210987\r\n",
+                ),
+                b")",
+            ],
+        ),
+    ]
+
+    result = get_tracking(b"1 2", mock_imap, "1Z?[0-9A-Z]{16}")
+    assert result == ["1Z2345YY0678901234", "1Z9876YY0543210987"]
+    assert mock_imap.fetch.call_args_list == [
+        call("1:2", "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)])"),
+        call("2", "(RFC822)"),
+    ]
+
+
+async def test_get_tracking_scans_once(mock_imap):
+    headers = (
+        "OK",
+        [
+            (
+                b"1 (BODY[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)] {40}",
+                b"Subject: Your package is on the way\r\n\r\n",
+            ),
+            b")",
+        ],
+    )
+    body = (
+        "OK",
+        [
+            (
+                b"1 (RFC822 {80}",
+                b"Subject: Your package is on the way\r\n"
+                b"Content-Type: text/plain\r\n\r\n"
+                b"UPS 1Z9876YY0543210987, FedEx 123456789012\r\n",
+            ),
+            b")",
+        ],
+    )
+    mock_imap.fetch.side_effect = [headers, body, headers]
+    mock_imap.messages = {}
+
+    with patch(
+        "custom_components.mail_and_packages.helpers.TRACKING_SCANNER.scan",
+        wraps=TRACKING_SCANNER.scan,
+    ) as mock_scan:
+        assert get_tracking(
+            b"1", mock_imap, SHIPPER_SENSORS["ups_delivered"].tracking
+        ) == ["1Z9876YY0543210987"]
+        assert get_tracking(
+            b"1", mock_imap, SHIPPER_SENSORS["fedex_delivered"].tracking
+        ) == ["123456789012"]
+    assert mock_scan.call_count == 1
+    assert mock_imap.fetch.call_count == 3
+    assert list(mock_imap.messages) == [1]
+
+
+async def test_message_view():
+    raw = (
+        b"Subject: =?utf-8?q?Hub_=C3=A9?=\r\n"
+        b"Content-Type: multipart/alternative; boundary=b\r\n\r\n"
+        b"--b\r\nContent-Type: text/plain\r\n\r\nPlain 123\r\n"
+        b"--b\r\nContent-Type: image/png\r\n\r\nPNG\r\n"
+        b"--b\r\nContent-Type: text/html\r\n\r\n<p>HTML</p>\r\n"
+        b"--b--\r\n"
+    )
+    view = MessageView(1, [(b"1 (RFC822 {10}", raw), b")"])
+    assert view.subject == "Hub \u00e9"
+    assert view.texts == ["Plain 123", "HTML"]
+    assert view.html == ["<p>HTML</p>"]
+    assert view.first_part.startswith("Content-Type: text/plain")
+    assert view.message is view.message
+    assert view.raw is None
+    image = [
+        part for part in view.message.walk() if part.get_content_maintype() == "image"
+    ]
+    assert image[0]["Content-Type"] == "image/png"
+    assert image[0].get_payload() == ""
+
+    empty = MessageView(2, [b")"])
+    assert empty.message is None
+    assert empty.subject == ""
+    assert empty.texts == []
+
+
+async def test_html_to_text():
+    html = (
+        "<html><head><style>td { width: 123456789012px; }</style>"
+        "<script>var id = '123456789012345';</script></head>"
+        "<body><p>Your package   is\n <b>on the way</b></p>"
+        '<table><tr><td><a href="https://track?n=987654321098">Track</a></td>'
+        "<td>1Z2345YY0678901234 &amp; more</td></tr></table></body></html>"
+    )
+    assert html_to_text(html) == (
+        "Your package is on the way\nTrack\n1Z2345YY0678901234 & more"
+    )
+    assert not SHIPPER_SENSORS["fedex_delivered"].tracking.findall(html_to_text(html))
+    assert html_to_text(html, ("package", "Track")) == "package is on the way\n"
+    # A missing start doesn't limit, end is still searched from the beginning
+    assert html_to_text(html, ("missing", "Your")) == ""
+    assert html_to_text(html, ("missing", "more")) == (
+        "Your package is on the way\nTrack\n1Z2345YY0678901234 & "
+    )
+    # Only an end following start limits
+    assert html_to_text(html, ("Track", "Your")) == "Track\n1Z2345YY0678901234 & more"
+
+
+async def test_text_region():
+    text = "Track your package. Arriving: Friday, May 5 Track your order"
+    assert text_region(text, "Arriving:", "Track your") == "Arriving: Friday, May 5 "
+    assert (
+        text_region(text, "Arriving:", None)
+        == "Arriving: Friday, May 5 Track your order"
+    )
+    assert text_region(text, None, "Track your") == ""
+    assert text_region(text, "Shipped:", "package") == "Track your "
+
+
+@pytest.mark.parametrize(
+    "name", sorted(os.listdir("tests/test_emails")), ids=lambda name: name
+)
+async def test_parse_text_parts(name):
+    with open(f"tests/test_emails/{name}", "rb") as file:
+        raw = file.read()
+    full = email.message_from_bytes(raw)
+
+    msg = parse_text_parts(raw)
+    assert msg["subject"] == full["subject"]
+    assert [part.get_content_type() for part in msg.walk()] == [
+        part.get_content_type() for part in full.walk()
+    ]
+    for part, full_part in zip(msg.walk(), full.walk()):
+        if part.get_content_maintype() == "text":
+            assert part.get_payload(decode=True) == full_part.get_payload(decode=True)
+        elif not part.is_multipart() and part.get_content_maintype() != "message":
+            assert part.get_payload() == ""
+
+
+async def test_parse_text_parts_skips_binary():
+    image = b"iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk\r\n" * 50
+    raw = (
+        b"Subject: Nested\r\n"
+        b'Content-Type: multipart/mixed; boundary="outer"\r\n\r\n'
+        b"preamble\r\n"
+        b"--outer\r\n"
+        b"Content-Type: multipart/alternative;\r\n boundary=inner\r\n\r\n"
+        b"--inner\r\nContent-Type: text/plain\r\n\r\nPlain 123\r\n"
+        b"--inner\r\nContent-Type: text/html\r\n\r\n<p>Html 456</p>\r\n"
+        b"--inner--\r\n"
+        b"--outer\r\n"
+        b"Content-Type: image/png\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+        + image
+        + b"--outer\r\n\r\nNo headers 789\r\n"
+        b"--outer--\r\n"
+    )
+
+    with patch(
+        "custom_components.mail_and_packages.helpers.BytesFeedParser.feed",
+        autospec=True,
+        side_effect=BytesFeedParser.feed,
+    ) as mock_feed:
+        msg = parse_text_parts(raw)
+    assert not any(b"iVBOR" in call.args[1] for call in mock_feed.call_args_list)
+
+    full = email.message_from_bytes(raw)
+    assert [part.get_content_type() for part in msg.walk()] == [
+        part.get_content_type() for part in full.walk()
+    ]
+    texts = [
+        part.get_payload(decode=True)
+        for part in msg.walk()
+        if part.get_content_maintype() == "text"
+    ]
+    assert texts == [b"Plain 123", b"<p>Html 456</p>", b"No headers 789"]
+
+
+async def test_email_fetch_batch_without_uid(mock_imap_search_plan, tmp_path):
+    mock_imap_search_plan.folder = '"INBOX"'
+    mock_imap_search_plan.uidvalidity = 1
+    mock_imap_search_plan.message_cache = MessageCache(str(tmp_path))
+    mock_imap_search_plan.uid.side_effect = lambda *args: (
+        "OK",
+        [
+            (b"7 (RFC822 {6}", b"other\n"),
+            b")",
+            (b"8 (UID 2 RFC822 {7}", b"second\n"),
+            b")",
+        ],
+    )
+
+    # The response without a UID can't be matched, it's dropped
+    result = email_fetch_batch(mock_imap_search_plan, [b"1", b"2"])
+    assert list(result) == [b"2"]
+    assert mock_imap_search_plan.message_cache.get('"INBOX"', 1, 1) is None
+    assert mock_imap_search_plan.message_cache.get('"INBOX"', 1, 2) == b"second\n"
+
+
+async def test_email_fetch_batch(mock_imap_search_plan, tmp_path):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    plan.execute(mock_imap_search_plan)
+    mock_imap_search_plan.search_plan = plan
+    mock_imap_search_plan.folder = '"INBOX"'
+    mock_imap_search_plan.uidvalidity = 1
+    mock_imap_search_plan.message_cache = MessageCache(str(tmp_path))
+    mock_imap_search_plan.fetch.return_value = (
+        "OK",
+        [
+            (b"1 (UID 1 RFC822 {6}", b"first\n"),
+            b")",
+            (b"3 (UID 3 RFC822 {6}", b"third\n"),
+            b")",
+            (b"2 (UID 2 RFC822 {7}", b"second\n"),
+            b")",
+        ],
+    )
+
+    result = email_fetch_batch(mock_imap_search_plan, [b"1", b"2", b"3"])
+    assert mock_imap_search_plan.fetch.call_args == call("1:3", "(RFC822)")
+    assert list(result) == [b"1", b"2", b"3"]
+    assert result[b"2"] == [(b"2 (UID 2 RFC822 {7}", b"second\n"), b")"]
+
+    # Everything is cached now
+    result = email_fetch_batch(mock_imap_search_plan, [b"3", b"1"])
+    assert mock_imap_search_plan.fetch.call_count == 2
+    assert result[b"3"][0][1] == b"third\n"
+
+    email_fetch_batch(mock_imap_search_plan, [b"12", b"4", b"9", b"10", b"11"])
+    assert mock_imap_search_plan.fetch.call_args == call("4,9:12", "(RFC822)")
+
+
+def _fetch_reply(message_set, parts):
+    """Answer a FETCH with one small email per message."""
+    data = []
+    for num in _expand(message_set):
+        raw = f"email {num}\n".encode()
+        data.append((f"{num} (UID {num} RFC822 {{{len(raw)}}}".encode(), raw))
+        data.append(b")")
+    return ("OK", data)
+
+
+def _expand(message_set):
+    """Expand a sequence set like 1,4:5."""
+    nums = []
+    for part in message_set.split(","):
+        first, _, last = part.partition(":")
+        nums.extend(range(int(first), int(last or first) + 1))
+    return nums
+
+
+async def test_search_plan_body_uids():
+    config = FAKE_CONFIG_DATA_CORRECTED.copy()
+    config["resources"] = ["dhl_delivered", "fedex_delivering", "ups_delivered"]
+    plan = build_search_plan(config)
+    emails = {
+        1: ("mcinfo@ups.com", "your ups package was delivered"),
+        2: ("trackingupdates@fedex.com", "your package is now out for delivery"),
+        3: (
+            "trackingupdates@fedex.com",
+            "fedex shipment 61290912345678912345: your package is now out for delivery",
+        ),
+        4: ("noreply@dhl.de", "dhl on demand delivery"),
+    }
+    for uid, (sender, subject) in emails.items():
+        plan.messages[uid] = (sender, subject, None)
+        plan._route(uid, sender, subject)
+
+    # Counted emails and tracking numbers in the subject need no download
+    assert plan.body_uids() == [2, 4]
+
+
+async def test_prefetch_emails(mock_imap_search_plan, tmp_path):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    plan.execute(mock_imap_search_plan)
+    mock_imap_search_plan.search_plan = plan
+    mock_imap_search_plan.folder = '"INBOX"'
+    mock_imap_search_plan.uidvalidity = 1
+    mock_imap_search_plan.message_cache = MessageCache(str(tmp_path))
+    mock_imap_search_plan.message_cache.put('"INBOX"', 1, 2, b"cached\n")
+    mock_imap_search_plan.fetch.side_effect = _fetch_reply
+    sessions = [mock.Mock(spec=imaplib.IMAP4_SSL) for _ in range(2)]
+    for session in sessions:
+        session.uid.side_effect = lambda _, *args: _fetch_reply(*args)
+
+    prefetch_emails(
+        mock_imap_search_plan, sessions, [b"7", b"3", b"1", b"2", b"5", b"4"]
+    )
+    # The cached email is skipped, the rest is split in contiguous shards
+    assert mock_imap_search_plan.fetch.call_args == call("1,3", "(BODY.PEEK[])")
+    assert sessions[0].uid.call_args == call("FETCH", "4:5", "(BODY.PEEK[])")
+    assert sessions[1].uid.call_args == call("FETCH", "7", "(BODY.PEEK[])")
+    assert list(mock_imap_search_plan.prefetched) == [1, 3, 4, 5, 7]
+    assert mock_imap_search_plan.message_cache.get('"INBOX"', 1, 3) == b"email 3\n"
+
+    fetches = mock_imap_search_plan.fetch.call_count
+    result = email_fetch_batch(mock_imap_search_plan, [b"5", b"2", b"1"])
+    assert mock_imap_search_plan.fetch.call_count == fetches
+    assert [parts[0][1] for parts in result.values()] == [
+        b"email 5\n",
+        b"cached\n",
+        b"email 1\n",
+    ]
+
+
+async def test_email_count_esearch(mock_imap_no_email):
+    mock_imap_no_email.capability.return_value = (
+        "OK",
+        [b"IMAP4rev1 ESEARCH CONDSTORE"],
+    )
+    mock_imap_no_email.search.return_value = ("OK", [None])
+    mock_imap_no_email.response.return_value = (
+        "ESEARCH",
+        [b'(TAG "A4") COUNT 12'],
+    )
+
+    result = email_count(mock_imap_no_email, "fake@eamil.address", "01-Jan-20")
+    assert result == ("OK", 12)
+    assert mock_imap_no_email.search.call_args == call(
+        None, "RETURN (COUNT)", '(FROM "fake@eamil.address" SINCE 01-Jan-20)'
+    )
+    assert mock_imap_no_email.capabilities == ("IMAP4REV1", "ESEARCH", "CONDSTORE")
+
+    # Nothing matched
+    mock_imap_no_email.response.return_value = ("ESEARCH", [b'(TAG "A5")'])
+    result = email_count(mock_imap_no_email, "fake@eamil.address", "01-Jan-20")
+    assert result == ("OK", 0)
+    assert mock_imap_no_email.capability.call_count == 1
+
+
+async def test_search_pipeline():
+    account = mock.Mock(spec=["capability", "pipeline"])
+    account.capability.return_value = ("OK", [b"IMAP4rev1 ESEARCH"])
+    account.pipeline.return_value = [
+        ("OK", [b'(TAG "A1") UID ALL 5,3:1']),
+        ("OK", [b"SEARCH completed"]),
+        ("NO", [b"SEARCH failed"]),
+        ("OK", [b'(TAG "A4") UID']),
+    ]
+
+    result = search_pipeline(account, ["ALL", "ALL", "ALL", "ALL"])
+    assert result == [
+        ("OK", [b"5 1 2 3"]),
+        None,
+        ("NO", [b"SEARCH failed"]),
+        ("OK", [b""]),
+    ]
+    assert account.pipeline.call_args.args[0][0] == "UID SEARCH RETURN (ALL) ALL"
+
+    # Without ESEARCH nothing is pipelined
+    account = mock.Mock(spec=["capability", "pipeline"])
+    account.capability.return_value = ("OK", [b"IMAP4rev1"])
+    assert search_pipeline(account, ["ALL", "ALL"]) is None
+    account.pipeline.assert_not_called()
+
+
+async def test_email_count_fallback(mock_imap_no_email):
+    mock_imap_no_email.capability.return_value = ("OK", [b"IMAP4rev1"])
+    mock_imap_no_email.search.return_value = ("OK", [b"1 2 3"])
+
+    result = email_count(mock_imap_no_email, "fake@eamil.address", "01-Jan-20")
+    assert result == ("OK", 3)
+    assert mock_imap_no_email.search.call_args == call(
+        None, '(FROM "fake@eamil.address" SINCE 01-Jan-20)'
+    )
+
+
+async def test_email_search_utf8(mock_imap_no_email):
+    mock_imap_no_email.search.return_value = ("OK", [b"4"])
+
+    result = email_search(
+        mock_imap_no_email,
+        ["noreply@dhl.de", "paket@dhl.de"],
+        "01-Jan-20",
+        "Ihr Paket kommt heute über",
+    )
+    assert result == ("OK", [b"4"])
+    # The senders stay in the query, the subject follows as a literal
+    assert mock_imap_no_email.search.call_args == call(
+        "UTF-8",
+        'OR FROM "noreply@dhl.de" FROM "paket@dhl.de" SINCE 01-Jan-20 SUBJECT',
+    )
+    assert mock_imap_no_email.literal == "Ihr Paket kommt heute über".encode()
+
+
+async def test_mailbox_status(mock_imap_search_plan):
+    mock_imap_search_plan.capabilities = ("IMAP4REV1", "CONDSTORE")
+    mock_imap_search_plan.status.return_value = (
+        "OK",
+        [b'"INBOX" (MESSAGES 3 UIDNEXT 104 UIDVALIDITY 1 HIGHESTMODSEQ 900)'],
+    )
+    assert mailbox_status(mock_imap_search_plan, '"INBOX"') == {
+        "MESSAGES": 3,
+        "UIDNEXT": 104,
+        "UIDVALIDITY": 1,
+        "HIGHESTMODSEQ": 900,
+    }
+    assert mock_imap_search_plan.status.call_args == call(
+        '"INBOX"', "(MESSAGES UIDNEXT UIDVALIDITY HIGHESTMODSEQ)"
+    )
+
+    mock_imap_search_plan.status.return_value = ("NO", [b"Not allowed"])
+    assert mailbox_status(mock_imap_search_plan, '"INBOX"') is None
+
+
+async def test_subject_matcher():
+    matcher = SubjectMatcher(["delivered", "was delivered", "package", "age was"])
+    assert matcher.search("your package was delivered") == {
+        "delivered",
+        "was delivered",
+        "package",
+        "age was",
+    }
+    assert matcher.search("out for delivery") == set()
+
+
+async def test_search_plan_routes(mock_imap_search_plan):
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    plan.execute(mock_imap_search_plan)
+    assert plan.routes == {
+        101: {"ups_delivered"},
+        102: {"fedex_delivering"},
+        103: {"amazon_packages"},
+    }
+
+    # Senders are found anywhere in the header, like the server's FROM search
+    mock_imap_search_plan.fetch.return_value = (
+        "OK",
+        [
+            (
+                b"1 (UID 101 BODY[HEADER.FIELDS (FROM SUBJECT)] {70}",
+                b"From: Not UPS <notmcinfo@ups.com>\r\n"
+                b"Subject: Your UPS Package was delivered\r\n\r\n",
+            ),
+            b")",
+            (
+                b"2 (UID 102 BODY[HEADER.FIELDS (FROM SUBJECT)] {70}",
+                b"From: USPS Informed Delivery <news@usps.example>\r\n"
+                b"Subject: Your Daily Digest\r\n\r\n",
+            ),
+            b")",
+        ],
+    )
+    plan.execute(mock_imap_search_plan)
+    assert plan.routes == {101: {"ups_delivered"}, 102: {"usps_mail"}}
+    today = get_formatted_date()
+    assert plan.lookup(["mcinfo@ups.com"], today) == ("OK", [b"101"])
+
+
+async def test_search_plan_incremental(mock_imap_search_plan):
+    status = {"MESSAGES": 3, "UIDNEXT": 104, "UIDVALIDITY": 1}
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    assert not plan.unchanged(status)
+    assert plan.execute(mock_imap_search_plan, status)
+    assert plan.unchanged(dict(status))
+    assert not plan.unchanged(None)
+
+    # A new email is only searched for in the new UID range
+    mock_imap_search_plan.search.return_value = ("OK", [b"104"])
+    mock_imap_search_plan.fetch.return_value = (
+        "OK",
+        [
+            (
+                b"4 (UID 104 BODY[HEADER.FIELDS (FROM SUBJECT)] {60}",
+                b"From: mcinfo@ups.com\r\nSubject: UPS Update\r\n\r\n",
+            ),
+            b")",
+        ],
+    )
+    status = {"MESSAGES": 4, "UIDNEXT": 105, "UIDVALIDITY": 1}
+    assert not plan.unchanged(status)
+    assert plan.execute(mock_imap_search_plan, status)
+    assert mock_imap_search_plan.search.call_args.args[1].startswith("(UID 104:* ")
+    assert sorted(plan.messages) == [101, 102, 103, 104]
+
+    # Deleted emails would stay in the table, search everything again
+    mock_imap_search_plan.search.return_value = ("OK", [b"104"])
+    status = {"MESSAGES": 4, "UIDNEXT": 106, "UIDVALIDITY": 1}
+    assert plan.execute(mock_imap_search_plan, status)
+    assert mock_imap_search_plan.search.call_args.args[1].startswith("(OR ")
+    assert list(plan.messages) == [104]
+
+
+async def test_process_emails_unchanged(hass, mock_imap_search_plan):
+    status = {"MESSAGES": 3, "UIDNEXT": 104, "UIDVALIDITY": 1}
+    updated = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    previous = {"ups_delivered": 1, "mail_updated": updated}
+    plan = build_search_plan(FAKE_CONFIG_DATA_CORRECTED)
+    plan.execute(mock_imap_search_plan, status)
+    mock_imap_search_plan.status.return_value = (
+        "OK",
+        [b'"INBOX" (MESSAGES 3 UIDNEXT 104 UIDVALIDITY 1)'],
+    )
+
+    result = process_emails(
+        hass, FAKE_CONFIG_DATA_CORRECTED, plan, previous=previous
+    )
+    # The old data is kept, the refresh still counts as an update
+    assert result is not previous
+    assert result["ups_delivered"] == 1
+    assert result["mail_updated"] > updated
+    assert previous["mail_updated"] == updated
+    assert mock_imap_search_plan.search.call_count == 1
+    assert mock_imap_search_plan.fetch.call_count == 1
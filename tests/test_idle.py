@@ -0,0 +1,73 @@
+"""Tests for IMAP IDLE."""
+import asyncio
+from datetime import timedelta
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.mail_and_packages.idle import IdleListener
+
+
+def _coordinator():
+    """Return a coordinator stand-in."""
+    coordinator = mock.Mock()
+    coordinator.update_interval = timedelta(minutes=5)
+    coordinator.async_refresh = mock.AsyncMock()
+    return coordinator
+
+
+def _config(server) -> dict:
+    """Return config pointing at the fake server."""
+    return {
+        "host": "127.0.0.1",
+        "port": server.port,
+        "username": "user@fake.email",
+        "password": "suchfakemuchpassword",
+        "folder": '"INBOX"',
+    }
+
+
+@pytest.mark.enable_socket
+async def test_idle_refresh(hass, fake_imap_server):
+    """Test new mail triggers a refresh and stretches the poll interval."""
+    coordinator = _coordinator()
+
+    with patch("custom_components.mail_and_packages.idle.IDLE_DEBOUNCE", 0):
+        listener = IdleListener(hass, coordinator, _config(fake_imap_server))
+        listener.async_start()
+        for _ in range(100):
+            if coordinator.async_refresh.called:
+                break
+            await asyncio.sleep(0.01)
+
+        assert coordinator.async_refresh.called
+        assert listener.supported
+        assert coordinator.update_interval == timedelta(minutes=30)
+        commands = fake_imap_server.commands
+        assert 'MP0002 LOGIN "user@fake.email" "suchfakemuchpassword"' in commands
+        assert 'MP0004 SELECT "INBOX"' in commands
+        assert "MP0005 IDLE" in commands
+        assert "DONE" in commands
+
+        await listener.async_stop()
+
+    assert coordinator.update_interval == timedelta(minutes=5)
+
+
+@pytest.mark.enable_socket
+async def test_idle_not_supported(hass, fake_imap_server, caplog):
+    """Test polling continues when the server has no IDLE."""
+    fake_imap_server.capabilities = "IMAP4rev1"
+    coordinator = _coordinator()
+
+    listener = IdleListener(hass, coordinator, _config(fake_imap_server))
+    listener.async_start()
+    await asyncio.wait_for(listener._task, timeout=5)
+
+    assert listener.supported is False
+    assert not any("SELECT" in command for command in fake_imap_server.commands)
+    assert coordinator.update_interval == timedelta(minutes=5)
+    assert "does not support IDLE" in caplog.text
+
+    await listener.async_stop()
@@ -0,0 +1,738 @@
+"""Tests for the asyncio IMAP client."""
+import asyncio
+import imaplib
+import ssl
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.mail_and_packages.helpers import (
+    MessageCache,
+    async_process_emails,
+    build_search_plan,
+    email_count,
+    email_count_many,
+    email_search,
+    email_search_many,
+    login,
+)
+from custom_components.mail_and_packages.imap import (
+    _NO_COMPRESS,
+    AsyncImapClient,
+    AsyncImapConnection,
+    AsyncImapConnectionPool,
+    ImapBridge,
+    ImapError,
+    ImaplibPipeline,
+    enable_deflate,
+    release_sessions,
+    reserve_sessions,
+    ssl_context,
+)
+from tests.const import FAKE_CONFIG_DATA_CORRECTED
+
+
+def _messages():
+    """Return the emails served by the fake server."""
+    messages = []
+    for name in ["ups_out_for_delivery.eml", "fedex_out_for_delivery.eml"]:
+        with open(f"tests/test_emails/{name}", "rb") as file:
+            messages.append(file.read())
+    return messages
+
+
+@pytest.mark.enable_socket
+async def test_client_commands(hass, fake_imap_server):
+    fake_imap_server.messages = _messages()
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    assert client.capabilities == ("IMAP4REV1", "IDLE")
+
+    assert (await client.login("user@fake.email", "pass"))[0] == "OK"
+    assert await client.select('"INBOX"') == ("OK", [b"2"])
+    assert client.uidvalidity == 1650000000
+
+    result = await client.status('"INBOX"', "(MESSAGES UIDNEXT UIDVALIDITY)")
+    assert result == (
+        "OK",
+        [b'"INBOX" (MESSAGES 2 UIDNEXT 103 UIDVALIDITY 1650000000)'],
+    )
+    assert await client.search(None, '(FROM "mcinfo@ups.com")') == (
+        "OK",
+        [b"1 2"],
+    )
+
+    (server_response, data) = await client.fetch("1:2", "(RFC822)")
+    assert server_response == "OK"
+    assert len(data) == 4
+    assert data[0] == (
+        f"1 (UID 101 RFC822 {{{len(fake_imap_server.messages[0])}}}".encode(),
+        fake_imap_server.messages[0],
+    )
+    assert data[1] == b")"
+    assert data[2][0].startswith(b"2 (UID 102 RFC822 {")
+
+    assert await client.noop() == ("OK", [b"NOOP completed"])
+    await client.logout()
+    assert not client.connected
+
+
+@pytest.mark.enable_socket
+async def test_client_timeout(hass, fake_imap_server):
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port, timeout=0.1)
+    await client.connect()
+    fake_imap_server.stalled = {"NOOP"}
+
+    # The late answer must not reach the next command, the session is dropped
+    with pytest.raises(asyncio.TimeoutError):
+        await client.noop()
+    assert not client.connected
+    with pytest.raises(ImapError):
+        await client.noop()
+
+
+@pytest.mark.enable_socket
+async def test_connection_reconnect(hass, fake_imap_server):
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"'
+    )
+    client = await connection.async_get()
+    assert client
+    assert await connection.async_get() is client
+
+    fake_imap_server.drop()
+    await asyncio.sleep(0.05)
+    assert await connection.async_get() is not client
+    logins = [command for command in fake_imap_server.commands if "LOGIN" in command]
+    assert len(logins) == 2
+
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_connection_backoff(hass, caplog):
+    connection = AsyncImapConnection(
+        "127.0.0.1", 1, "user", "pass", '"INBOX"', retries=2, backoff=0
+    )
+    assert not await connection.async_get()
+    assert "Unable to connect to 127.0.0.1 after 2 attempts" in caplog.text
+
+
+@pytest.mark.enable_socket
+async def test_bridge(hass, fake_imap_server):
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+    bridge = ImapBridge(client, hass.loop)
+    assert bridge.response("UIDVALIDITY") == ("UIDVALIDITY", [b"1650000000"])
+
+    result = await hass.async_add_executor_job(bridge.noop)
+    assert result == ("OK", [b"NOOP completed"])
+
+    bridge.cancel()
+    with pytest.raises(ImapError):
+        await hass.async_add_executor_job(bridge.noop)
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+async def test_client_pipeline(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+    fake_imap_server.out_of_order = True
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+
+    results = await client.pipeline(
+        [
+            "UID SEARCH RETURN (ALL) ALL",
+            "UID SEARCH RETURN (COUNT) ALL",
+            "UID SEARCH ALL",
+            "NOOP",
+        ]
+    )
+    # ESEARCH responses go to the command they name, not the oldest one
+    assert results[0] == ("OK", [b'(TAG "MP0005") UID ALL 101:102'])
+    assert results[1] == ("OK", [b'(TAG "MP0006") UID COUNT 2'])
+    # A SEARCH response can't be matched to its command
+    assert results[2] == ("OK", [b"SEARCH completed"])
+    assert results[3] == ("OK", [b"NOOP completed"])
+
+    # Nothing left over for the next command
+    assert await client.noop() == ("OK", [b"NOOP completed"])
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_pipeline_adapter(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+    fake_imap_server.out_of_order = True
+
+    def _pipeline():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        account.select('"INBOX"')
+        try:
+            assert ImaplibPipeline.supported(account)
+            return ImaplibPipeline(account).pipeline(
+                ["UID SEARCH RETURN (ALL) ALL", "UID SEARCH RETURN (COUNT) ALL"]
+            )
+        finally:
+            account.logout()
+
+    results = await hass.async_add_executor_job(_pipeline)
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    tags = [search.split(" ", 1)[0] for search in searches]
+    assert results == [
+        ("OK", [f'(TAG "{tags[0]}") UID ALL 101:102'.encode()]),
+        ("OK", [f'(TAG "{tags[1]}") UID COUNT 2'.encode()]),
+    ]
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_pipeline(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+    fake_imap_server.out_of_order = True
+
+    def _search():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        account.select('"INBOX"')
+        try:
+            return email_search_many(
+                account,
+                [
+                    ("mcinfo@ups.com", "01-Jan-2022", None),
+                    ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+                ],
+            )
+        finally:
+            account.logout()
+
+    with patch.object(
+        ImaplibPipeline, "pipeline", autospec=True, side_effect=ImaplibPipeline.pipeline
+    ) as mock_pipeline:
+        results = await hass.async_add_executor_job(_search)
+    assert mock_pipeline.call_count == 1
+    assert results == [("OK", [b"101 102"]), ("OK", [b"101 102"])]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+    assert all("RETURN (ALL)" in search for search in searches)
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_pipeline_no_esearch(hass, fake_imap_server):
+    fake_imap_server.messages = _messages()
+
+    def _search():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        account.select('"INBOX"')
+        try:
+            return email_search_many(
+                account,
+                [
+                    ("mcinfo@ups.com", "01-Jan-2022", None),
+                    ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+                ],
+            )
+        finally:
+            account.logout()
+
+    # Plain SEARCH responses don't name their command, search one by one
+    with patch.object(ImaplibPipeline, "pipeline") as mock_pipeline:
+        results = await hass.async_add_executor_job(_search)
+    mock_pipeline.assert_not_called()
+    assert results == [("OK", [b"101 102"]), ("OK", [b"101 102"])]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_pipeline_missing_internals(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+
+    def _search():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        account.select('"INBOX"')
+        try:
+            return email_search_many(
+                account,
+                [
+                    ("mcinfo@ups.com", "01-Jan-2022", None),
+                    ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+                ],
+            )
+        finally:
+            account.logout()
+
+    with patch(
+        "custom_components.mail_and_packages.imap.IMAPLIB_PIPELINE",
+        ("_command", "_no_such_internal"),
+    ), patch.object(ImaplibPipeline, "pipeline") as mock_pipeline:
+        results = await hass.async_add_executor_job(_search)
+    mock_pipeline.assert_not_called()
+    assert results == [("OK", [b"101 102"]), ("OK", [b"101 102"])]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_pipeline_count(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+
+    def _count():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        account.select('"INBOX"')
+        try:
+            return email_count_many(
+                account,
+                [
+                    ("mcinfo@ups.com", "01-Jan-2022", None),
+                    ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+                ],
+            )
+        finally:
+            account.logout()
+
+    with patch("custom_components.mail_and_packages.helpers.email_count") as mock_count:
+        results = await hass.async_add_executor_job(_count)
+    mock_count.assert_not_called()
+    assert results == [("OK", 2), ("OK", 2)]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+    assert all("RETURN (COUNT)" in search for search in searches)
+
+
+@pytest.mark.enable_socket
+async def test_bridge_esearch_count_many(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+    fake_imap_server.out_of_order = True
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+    bridge = ImapBridge(client, hass.loop)
+
+    with patch("custom_components.mail_and_packages.helpers.email_count") as mock_count:
+        result = await hass.async_add_executor_job(
+            email_count_many,
+            bridge,
+            [
+                ("mcinfo@ups.com", "01-Jan-2022", None),
+                ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+            ],
+        )
+    mock_count.assert_not_called()
+    assert result == [("OK", 2), ("OK", 2)]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+    assert all("RETURN (COUNT)" in search for search in searches)
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+@pytest.mark.parametrize("capabilities", ["IMAP4rev1", "IMAP4rev1 ESEARCH"])
+async def test_bridge_search_many(hass, fake_imap_server, capabilities):
+    fake_imap_server.capabilities = capabilities
+    fake_imap_server.messages = _messages()
+    fake_imap_server.out_of_order = "ESEARCH" in capabilities
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+    bridge = ImapBridge(client, hass.loop)
+
+    with patch.object(
+        AsyncImapClient, "pipeline", autospec=True, side_effect=AsyncImapClient.pipeline
+    ) as mock_pipeline:
+        result = await hass.async_add_executor_job(
+            email_search_many,
+            bridge,
+            [
+                ("mcinfo@ups.com", "01-Jan-2022", None),
+                ("TrackingUpdates@fedex.com", "01-Jan-2022", "Delivered"),
+            ],
+        )
+    assert result == [("OK", [b"101 102"]), ("OK", [b"101 102"])]
+    # Only pipelined when the responses name their command
+    assert mock_pipeline.called == ("ESEARCH" in capabilities)
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 2
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+async def test_bridge_esearch_count(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 ESEARCH"
+    fake_imap_server.messages = _messages()
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+    bridge = ImapBridge(client, hass.loop)
+
+    result = await hass.async_add_executor_job(
+        email_count, bridge, "mcinfo@ups.com", "01-Jan-2022"
+    )
+    assert result == ("OK", 2)
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert searches == [
+        'MP0005 UID SEARCH RETURN (COUNT) (FROM "mcinfo@ups.com" SINCE 01-Jan-2022)'
+    ]
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+@pytest.mark.parametrize("capabilities", ["IMAP4rev1", "IMAP4rev1 LITERAL+"])
+async def test_bridge_utf8_search(hass, fake_imap_server, capabilities):
+    fake_imap_server.capabilities = capabilities
+    fake_imap_server.messages = _messages()
+    client = AsyncImapClient("127.0.0.1", fake_imap_server.port)
+    await client.connect()
+    await client.login("user", "pass")
+    await client.select('"INBOX"')
+    bridge = ImapBridge(client, hass.loop)
+
+    result = await hass.async_add_executor_job(
+        email_search,
+        bridge,
+        ["noreply@inpost.pl", "powiadomienia@inpost.pl"],
+        "01-Jan-2022",
+        "Paczka już w drodze",
+    )
+    assert result == ("OK", [b"101 102"])
+    assert bridge.literal is None
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert searches == [
+        'MP0005 UID SEARCH CHARSET UTF-8 OR FROM "noreply@inpost.pl" FROM '
+        '"powiadomienia@inpost.pl" SINCE 01-Jan-2022 SUBJECT Paczka już w drodze'
+    ]
+    await client.logout()
+
+
+@pytest.mark.enable_socket
+async def test_async_process_emails(
+    hass,
+    fake_imap_server,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_copyfile,
+    mock_copytree,
+    mock_hash_file,
+    mock_getctime_today,
+):
+    fake_imap_server.messages = _messages()
+    config = FAKE_CONFIG_DATA_CORRECTED.copy()
+    config["host"] = "127.0.0.1"
+    config["port"] = fake_imap_server.port
+    config["resources"] = ["fedex_delivering", "ups_delivering", "zpackages_transit"]
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"'
+    )
+
+    with patch.object(
+        ImapBridge, "_call", autospec=True, side_effect=ImapBridge._call
+    ) as mock_bridged:
+        result = await async_process_emails(hass, config, connection)
+    assert result["ups_delivering"] == 1
+    assert result["fedex_delivering"] == 1
+    assert result["fedex_tracking"] == ["61290912345678912345"]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 1
+    # Everything was read on the event loop, the executor only parsed
+    assert not mock_bridged.called
+
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_async_process_emails_unchanged(
+    hass,
+    fake_imap_server,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_copyfile,
+    mock_copytree,
+    mock_hash_file,
+    mock_getctime_today,
+):
+    fake_imap_server.messages = _messages()
+    config = FAKE_CONFIG_DATA_CORRECTED.copy()
+    config["host"] = "127.0.0.1"
+    config["port"] = fake_imap_server.port
+    config["resources"] = ["fedex_delivering", "mail_updated", "ups_delivering"]
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"'
+    )
+    plan = build_search_plan(config)
+
+    previous = await async_process_emails(hass, config, connection, plan)
+    result = await async_process_emails(
+        hass, config, connection, plan, previous=previous
+    )
+    # The folder didn't change, the old counts are kept with a new update time
+    assert result is not previous
+    assert result["ups_delivering"] == previous["ups_delivering"] == 1
+    assert result["mail_updated"] > previous["mail_updated"]
+    searches = [c for c in fake_imap_server.commands if " SEARCH " in c]
+    assert len(searches) == 1
+
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_async_process_emails_cache_off_loop(
+    hass,
+    tmp_path,
+    fake_imap_server,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_copyfile,
+    mock_copytree,
+    mock_hash_file,
+    mock_getctime_today,
+):
+    fake_imap_server.messages = _messages()
+    config = FAKE_CONFIG_DATA_CORRECTED.copy()
+    config["host"] = "127.0.0.1"
+    config["port"] = fake_imap_server.port
+    config["resources"] = ["fedex_delivering", "ups_delivering", "zpackages_transit"]
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"'
+    )
+    cache = MessageCache(str(tmp_path))
+    on_loop = []
+
+    def _record(method):
+        def wrapper(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(method.__name__)
+            except RuntimeError:
+                pass
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    with patch.object(cache, "has", _record(cache.has)), patch.object(
+        cache, "put", _record(cache.put)
+    ), patch.object(cache, "get", _record(cache.get)), patch.object(
+        cache, "_load", _record(cache._load)
+    ):
+        result = await async_process_emails(hass, config, connection, cache=cache)
+    assert result["ups_delivering"] == 1
+    assert result["fedex_delivering"] == 1
+    assert list(tmp_path.iterdir())
+    # The cache files are only read and written in the executor
+    assert on_loop == []
+
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_async_process_emails_pool(
+    hass,
+    fake_imap_server,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_copyfile,
+    mock_copytree,
+    mock_hash_file,
+    mock_getctime_today,
+):
+    fake_imap_server.messages = _messages()
+    config = FAKE_CONFIG_DATA_CORRECTED.copy()
+    config["host"] = "127.0.0.1"
+    config["port"] = fake_imap_server.port
+    config["resources"] = ["fedex_delivering", "ups_delivering", "zpackages_transit"]
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"'
+    )
+    pool = AsyncImapConnectionPool(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"', 1, 3
+    )
+
+    result = await async_process_emails(
+        hass, config, connection, pool=pool, previous=None
+    )
+    assert result["ups_delivering"] == 1
+    assert result["fedex_delivering"] == 1
+    assert result["fedex_tracking"] == ["61290912345678912345"]
+    logins = [c for c in fake_imap_server.commands if " LOGIN " in c]
+    assert len(logins) == 2
+    # Only the email without the tracking number in its subject is read,
+    # downloaded once without marking it as read
+    fetches = [
+        c
+        for c in fake_imap_server.commands
+        if c.endswith(("(RFC822)", "(BODY.PEEK[])"))
+    ]
+    assert [fetch.split()[3:] for fetch in fetches] == [["101", "(BODY.PEEK[])"]]
+
+    await connection.async_close()
+    await pool.async_close()
+
+
+def test_reserve_sessions():
+    assert reserve_sessions("imap.fake.host", 2, 3) == 2
+    assert reserve_sessions("imap.fake.host", 2, 3) == 1
+    assert reserve_sessions("imap.fake.host", 1, 3) == 0
+    release_sessions("imap.fake.host", 2)
+    assert reserve_sessions("imap.fake.host", 5, 3) == 2
+    release_sessions("imap.fake.host", 3)
+    assert reserve_sessions("imap.fake.host", 1, 3) == 1
+    release_sessions("imap.fake.host", 1)
+
+
+@pytest.mark.enable_socket
+async def test_client_compress(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 COMPRESS=DEFLATE"
+    fake_imap_server.messages = _messages()
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"', compress=True
+    )
+    client = await connection.async_get()
+    assert "MP0004 COMPRESS DEFLATE" in fake_imap_server.commands
+
+    (server_response, data) = await client.fetch("1:2", "(RFC822)")
+    assert server_response == "OK"
+    assert data[0][1] == fake_imap_server.messages[0]
+    assert client.deflate.bytes_in > client.deflate.wire_in
+    assert client.deflate.ratio > 1
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_client_compress_broken(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 COMPRESS=DEFLATE"
+    fake_imap_server.broken_deflate = True
+    connection = AsyncImapConnection(
+        "127.0.0.1",
+        fake_imap_server.port,
+        "user",
+        "pass",
+        '"INBOX"',
+        backoff=0,
+        compress=True,
+    )
+    try:
+        client = await connection.async_get()
+        assert client
+        assert client.deflate is None
+        compress = [c for c in fake_imap_server.commands if "COMPRESS" in c]
+        assert len(compress) == 1
+        (server_response, _) = await client.noop()
+        assert server_response == "OK"
+        await connection.async_close()
+    finally:
+        _NO_COMPRESS.discard("127.0.0.1")
+
+
+@pytest.mark.enable_socket
+async def test_client_compress_disabled(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 COMPRESS=DEFLATE"
+    connection = AsyncImapConnection(
+        "127.0.0.1", fake_imap_server.port, "user", "pass", '"INBOX"', compress=False
+    )
+    client = await connection.async_get()
+    assert client.deflate is None
+    assert not any("COMPRESS" in c for c in fake_imap_server.commands)
+    await connection.async_close()
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_compress(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 COMPRESS=DEFLATE"
+    fake_imap_server.messages = _messages()
+
+    def _fetch():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        deflate = enable_deflate(account)
+        account.select('"INBOX"')
+        try:
+            return deflate, account.fetch("1:2", "(RFC822)")
+        finally:
+            account.logout()
+
+    deflate, (server_response, data) = await hass.async_add_executor_job(_fetch)
+    assert server_response == "OK"
+    assert data[2][1] == fake_imap_server.messages[1]
+    assert 'SELECT "INBOX"' in fake_imap_server.commands[-3]
+    assert deflate.bytes_in > deflate.wire_in
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_compress_broken(hass, fake_imap_server):
+    fake_imap_server.capabilities = "IMAP4rev1 COMPRESS=DEFLATE"
+    fake_imap_server.broken_deflate = True
+
+    def _select():
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        assert enable_deflate(account) is not None
+        with pytest.raises(imaplib.IMAP4.abort):
+            account.select('"INBOX"')
+        account.shutdown()
+
+        account = imaplib.IMAP4("127.0.0.1", fake_imap_server.port)
+        account.login("user", "pass")
+        assert enable_deflate(account) is None
+        result = account.select('"INBOX"')
+        account.logout()
+        return result
+
+    try:
+        (server_response, _) = await hass.async_add_executor_job(_select)
+    finally:
+        _NO_COMPRESS.discard("127.0.0.1")
+    assert server_response == "OK"
+    compress = [c for c in fake_imap_server.commands if "COMPRESS" in c]
+    assert len(compress) == 1
+
+
+async def test_ssl_context_shared():
+    context = ssl_context()
+    assert ssl_context() is context
+    assert context.verify_mode == ssl.CERT_NONE
+
+
+@pytest.mark.enable_socket
+async def test_client_tls_resumption(hass, fake_imap_server_tls):
+    for reused in (False, True):
+        client = AsyncImapClient("127.0.0.1", fake_imap_server_tls.port)
+        await client.connect()
+        (server_response, _) = await client.login("user@fake.email", "password")
+        assert server_response == "OK"
+        ssl_object = client._protocol.transport.get_extra_info("ssl_object")
+        assert ssl_object.session_reused is reused
+        await client.logout()
+
+
+@pytest.mark.enable_socket
+async def test_imaplib_tls_resumption(hass, fake_imap_server_tls):
+    for reused in (False, True):
+        account = await hass.async_add_executor_job(
+            login,
+            "127.0.0.1",
+            fake_imap_server_tls.port,
+            "user@fake.email",
+            "password",
+        )
+        assert account.sock.session_reused is reused
+        await hass.async_add_executor_job(account.logout)
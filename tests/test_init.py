@@ -1,12 +1,26 @@
 """Tests for init."""
 
+from datetime import timedelta
 from unittest.mock import patch
 
 import pytest
 from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
 
-from custom_components.mail_and_packages.const import DOMAIN
+from custom_components.mail_and_packages.const import (
+    CONF_IMAP_CONNECTIONS,
+    CONF_MESSAGE_CACHE,
+    COORDINATOR,
+    DOMAIN,
+    MAX_IMAP_CONNECTIONS,
+    PREWARM_LEAD,
+)
+from custom_components.mail_and_packages.imap import release_sessions, reserve_sessions
 from tests.const import (
     FAKE_CONFIG_DATA,
     FAKE_CONFIG_DATA_AMAZON_FWD_STRING,
@@ -70,6 +84,69 @@ async def test_setup_entry(
     assert len(entries) == 1
 
 
+async def test_setup_entry_not_ready(hass, mock_update, mock_copy_overlays):
+    """Test a failed first refresh gives the sessions back."""
+    mock_update.side_effect = Exception("Server unavailable")
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data={**FAKE_CONFIG_DATA, CONF_IMAP_CONNECTIONS: 3},
+    )
+
+    entry.add_to_hass(hass)
+    assert not await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert entry.state is ConfigEntryState.SETUP_RETRY
+    assert reserve_sessions("imap.test.email", 3, 3) == 3
+    release_sessions("imap.test.email", 3)
+
+
+async def test_message_cache(hass, tmp_path, mock_update, mock_copy_overlays):
+    """Test the emails are cached per entry and deleted with it."""
+    hass.config.config_dir = str(tmp_path)
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data=FAKE_CONFIG_DATA,
+    )
+
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    path = tmp_path / ".storage" / DOMAIN / entry.entry_id
+    coordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    assert coordinator.message_cache.path == str(path)
+    coordinator.message_cache.put('"INBOX"', 1, 1, b"email")
+    assert path.exists()
+
+    assert await hass.config_entries.async_remove(entry.entry_id)
+    await hass.async_block_till_done()
+    assert not path.exists()
+
+
+async def test_message_cache_off(hass, tmp_path, mock_update, mock_copy_overlays):
+    """Test turning the cache off deletes the cached emails."""
+    hass.config.config_dir = str(tmp_path)
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data={**FAKE_CONFIG_DATA, CONF_MESSAGE_CACHE: False},
+    )
+    path = tmp_path / ".storage" / DOMAIN / entry.entry_id
+    path.mkdir(parents=True)
+    (path / "cached.eml").write_bytes(b"email")
+
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert hass.data[DOMAIN][entry.entry_id][COORDINATOR].message_cache is None
+    assert mock_update.call_args.args[4] is None
+    assert not path.exists()
+
+
 async def test_no_path_no_sec(
     hass,
     mock_imap_no_email,
@@ -180,3 +257,114 @@ async def test_custom_img(
     assert len(hass.states.async_entity_ids(SENSOR_DOMAIN)) == 43
     entries = hass.config_entries.async_entries(DOMAIN)
     assert len(entries) == 1
+
+
+async def test_extra_folders(
+    hass,
+    mock_imap_no_email,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_update_time,
+    mock_copy_overlays,
+    mock_hash_file,
+    mock_getctime_today,
+    mock_update,
+):
+    """Test other folders are scanned and added to the sensors."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data={**FAKE_CONFIG_DATA, "extra_folders": ['"Orders"']},
+    )
+
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    folders = [call.args[1]["folder"] for call in mock_update.call_args_list]
+    assert folders == ['"INBOX"', '"Orders"']
+    assert mock_update.call_args_list[1].args[-1] is False
+
+    state = hass.states.get("sensor.mail_usps_delivering")
+    assert state.state == "6"
+    coordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    assert coordinator.data["ups_tracking"] == ["1Z123456789"]
+    assert coordinator.data["image_name"] == "mail_today.gif"
+
+    # The folder's session counts against the mail server's limit
+    extra = MAX_IMAP_CONNECTIONS - 1
+    assert reserve_sessions("imap.test.email", extra, extra) == extra - 1
+    release_sessions("imap.test.email", extra - 1)
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert reserve_sessions("imap.test.email", extra, extra) == extra
+    release_sessions("imap.test.email", extra)
+
+
+async def test_extra_folders_no_session(
+    hass,
+    mock_imap_no_email,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_update_time,
+    mock_copy_overlays,
+    mock_hash_file,
+    mock_getctime_today,
+    mock_update,
+):
+    """Test folders are skipped when the mail server has no session left."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data={**FAKE_CONFIG_DATA, "extra_folders": ['"Orders"']},
+    )
+
+    extra = MAX_IMAP_CONNECTIONS - 1
+    assert reserve_sessions("imap.test.email", extra, extra) == extra
+    try:
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    finally:
+        release_sessions("imap.test.email", extra)
+
+    folders = [call.args[1]["folder"] for call in mock_update.call_args_list]
+    assert folders == ['"INBOX"']
+
+
+async def test_prewarm(
+    hass,
+    mock_imap_no_email,
+    mock_osremove,
+    mock_osmakedir,
+    mock_listdir,
+    mock_update_time,
+    mock_copy_overlays,
+    mock_hash_file,
+    mock_getctime_today,
+    mock_update,
+):
+    """Test the session is opened shortly before the next refresh."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="imap.test.email",
+        data={**FAKE_CONFIG_DATA, "imap_prewarm": True},
+    )
+
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert not mock_imap_no_email.login.called
+
+    coordinator = hass.data[DOMAIN][entry.entry_id][COORDINATOR]
+    lead = coordinator.update_interval - timedelta(seconds=PREWARM_LEAD)
+    async_fire_time_changed(hass, dt_util.utcnow() + lead + timedelta(seconds=1))
+    await hass.async_block_till_done()
+    assert mock_imap_no_email.login.call_count == 1
+    assert mock_update.call_count == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
@@ -0,0 +1,187 @@
+"""Tests for the compiled shipper table."""
+import os
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.mail_and_packages.const import SENSOR_DATA
+from custom_components.mail_and_packages.helpers import MessageView
+from custom_components.mail_and_packages.shippers import (
+    SHIPPER_SENSORS,
+    TRACKING_SCANNER,
+    TrackingScanner,
+    compile_pattern,
+    compile_sensor_data,
+)
+
+
+def test_sensor_data_patterns(caplog):
+    """Test every pattern in SENSOR_DATA compiles."""
+    table = compile_sensor_data(SENSOR_DATA)
+    assert "Invalid pattern" not in caplog.text
+    assert set(table) == {key for key, value in SENSOR_DATA.items() if "email" in value}
+
+
+def test_shipper_sensors():
+    """Test the table entries."""
+    ups = SHIPPER_SENSORS["ups_delivered"]
+    assert ups.shipper == "ups"
+    assert "mcinfo@ups.com" in ups.sender_set
+    assert ups.tracking.pattern == "1Z?[0-9A-Z]{16}"
+    assert SHIPPER_SENSORS["dhl_delivered"].bodies[0].search("has been delivered")
+    assert SHIPPER_SENSORS["capost_delivered"].tracking is None
+
+    with pytest.raises(TypeError):
+        SHIPPER_SENSORS["ups_delivered"] = ups
+    with pytest.raises(AttributeError):
+        ups.tracking = None
+
+    auspost = SHIPPER_SENSORS["auspost_delivered"].tracking
+    assert auspost.findall("Tracking AB123456789AU and 1234567") == [
+        "AB123456789AU",
+        "1234567",
+    ]
+
+
+@pytest.mark.parametrize(
+    "pattern", ["\\d{7,10,12}", "[0-9]{3", "\\d{x}", "(unclosed", "a{2,}{"]
+)
+def test_compile_pattern_invalid(pattern):
+    """Test broken patterns are refused."""
+    with pytest.raises(ValueError):
+        compile_pattern(pattern)
+
+
+def test_compile_sensor_data_invalid(caplog):
+    """Test broken patterns are logged and left out."""
+    table = compile_sensor_data(
+        {
+            "test_delivered": {"email": ["test@test.email"], "subject": ["Hi"]},
+            "test_tracking": {"pattern": ["\\d{7,10,12}"]},
+        }
+    )
+    assert table["test_delivered"].tracking is None
+    assert "Invalid pattern for test_tracking: invalid repeat at position 2" in (
+        caplog.text
+    )
+
+
+def test_tracking_scanner():
+    """Test one scan finds what each shipper's pattern finds."""
+    text = (
+        "UPS 1Z2345YY0678901234 FedEx 123456789012 "
+        "USPS 9400111899562537866361 Royal Mail AB123456789GB "
+        '<a href="https://t.example/?n=AB123456789AU&id=12345678901234567890">'
+        "no_tracking_here 1234567 ÃB123456789AU"
+    )
+    found = TRACKING_SCANNER.scan(text)
+    for sensor in SHIPPER_SENSORS.values():
+        if sensor.tracking is not None:
+            assert found[sensor.shipper] == sensor.tracking.findall(text)
+    assert found["ups"][0] == "1Z2345YY0678901234"
+    assert found["royal"] == ["AB123456789GB"]
+    assert TRACKING_SCANNER.name(SHIPPER_SENSORS["fedex_delivered"].tracking) == "fedex"
+    assert TRACKING_SCANNER.name(compile_pattern("\\d{5}")) is None
+
+
+def test_tracking_scanner_patterns():
+    """Test each pattern matches on its own."""
+    scanner = TrackingScanner(
+        {"five": compile_pattern("\\d{5}"), "three": compile_pattern("\\d{3}")}
+    )
+    assert scanner.names == ("five", "three")
+    assert scanner.scan("1234567 <b>89</b>") == {
+        "five": ["12345"],
+        "three": ["123", "456"],
+    }
+    assert scanner.scan("") == {"five": [], "three": []}
+    assert TrackingScanner({}).scan("123") == {}
+
+
+def _counted(pattern):
+    """Wrap a compiled pattern to count the passes over a text."""
+    return mock.Mock(
+        wraps=pattern,
+        pattern=pattern.pattern,
+        flags=pattern.flags,
+        groups=pattern.groups,
+    )
+
+
+def test_tracking_scanner_one_pass():
+    """Test one joined pass finds the runs the patterns then search."""
+    patterns = {
+        sensor.shipper: _counted(sensor.tracking)
+        for sensor in SHIPPER_SENSORS.values()
+        if sensor.tracking is not None
+    }
+    scanner = TrackingScanner(patterns)
+    text = "UPS 1Z2345YY0678901234 FedEx 123456789012 Royal Mail AB123456789GB"
+    with patch.object(scanner, "_combined", wraps=scanner._combined) as combined:
+        found = scanner.scan(text)
+        assert combined.finditer.call_count == 1
+        for pattern in patterns.values():
+            pattern.findall.assert_called_once_with(
+                "1Z2345YY0678901234 123456789012 AB123456789GB"
+            )
+        assert scanner.scan("no numbers here 12") == dict.fromkeys(scanner.names, [])
+    assert combined.finditer.call_count == 2
+    assert all(pattern.findall.call_count == 1 for pattern in patterns.values())
+    assert not any(pattern.finditer.called for pattern in patterns.values())
+    assert found == TRACKING_SCANNER.scan(text)
+    assert found["ups"] == ["1Z2345YY0678901234"]
+
+
+def test_tracking_scanner_findall():
+    """Test patterns with groups, flags or empty matches match findall."""
+    patterns = {
+        "one": compile_pattern("AB(\\d{3})"),
+        "two": compile_pattern("(\\d{2})_(\\d{2})?x"),
+        "alternation": compile_pattern("(1)\\d|(2)\\d"),
+        "flags": compile_pattern("(?i)ab\\d{2}"),
+        "space": compile_pattern("\\d{2} \\d{2}"),
+        "boundary": compile_pattern("\\b\\d"),
+        "backreference": compile_pattern("(\\d)\\1"),
+        "empty": compile_pattern("9*"),
+        "overlapping": compile_pattern("\\d{3}"),
+    }
+    scanner = TrackingScanner(patterns)
+    text = "AB123 ab45 12_34x 56_x 11 23 9900 1234567"
+    found = scanner.scan(text)
+    candidates = " ".join(word for word in text.split() if not word.isalpha())
+    for name, pattern in patterns.items():
+        assert found[name] == pattern.findall(candidates)
+    assert found["one"] == ["123"]
+    assert found["two"] == [("12", "34"), ("56", "")]
+    assert found["flags"] == ["AB12", "ab45"]
+
+
+@pytest.mark.parametrize(
+    "name", sorted(os.listdir("tests/test_emails")), ids=lambda name: name
+)
+def test_tracking_scanner_emails(name):
+    """Test every shipper pattern finds what its findall does in the emails."""
+    with open(f"tests/test_emails/{name}", "rb") as file:
+        view = MessageView(1, [(b"1 (RFC822 {1}", file.read())])
+    for text, found in zip(view.texts, view.tracking):
+        for sensor in SHIPPER_SENSORS.values():
+            if sensor.tracking is not None:
+                assert found[sensor.shipper] == sensor.tracking.findall(text)
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("Order 12345678", []),
+        ("Ref: 98765432101", []),
+        ("postcode 30001234", []),
+        ("Tracking 1234567", ["1234567"]),
+        ("Tracking 1234567890 and 123456789012", ["1234567890", "123456789012"]),
+        ("Parcel AB123456789AU", ["AB123456789AU"]),
+    ],
+)
+def test_auspost_tracking(text, expected):
+    """Test AusPost numbers aren't cut out of longer numbers."""
+    assert SHIPPER_SENSORS["auspost_delivered"].tracking.findall(text) == expected
+    assert TRACKING_SCANNER.scan(text)["auspost"] == expected